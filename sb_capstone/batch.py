@@ -0,0 +1,284 @@
+import argparse
+import glob
+import json
+import os
+import time
+import joblib
+import pandas as pd
+import pyarrow.parquet as pq
+
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from sb_capstone.wrangling import clean_profile
+from sb_capstone.storage import save_dataset, load_dataset
+from sb_capstone.experiment import (
+    receive_offer,
+    select_offer
+)
+
+MANIFEST = "manifest.json"
+
+# models loaded by the current process, by file
+_models = {}
+
+def iter_profile(file, chunk_size=100000):
+    """Streams a profile csv or parquet file in cleaned chunks of ``chunk_size`` customers
+
+    Args:
+        file (str): The profile file, with id, gender, age, income and became_member_on
+        chunk_size (int): Number of customers per chunk
+
+    Returns:
+        generator: The profile chunks
+    """
+
+    if file.endswith(".parquet"):
+        chunks = (b.to_pandas() for b in pq.ParquetFile(file).iter_batches(batch_size=chunk_size))
+    else:
+        chunks = pd.read_csv(file, chunksize=chunk_size)
+
+    for chunk in chunks:
+        yield clean_profile(chunk.reset_index(drop=True))
+
+def run_batch_job(profile_file, directory, chunk_size=100000, n_jobs=1, receive_model=None, select_model=None,
+        default_value=pd.NA, default_offers=[], progress=None):
+    """Scores every customer of a profile file, chunk by chunk, in a process pool
+
+    Each chunk is scored with ``receive_offer`` and ``select_offer`` and written to
+    its own parquet file, then recorded in the manifest of the directory. Running
+    the job again skips the chunks of the manifest, so a crashed job resumes
+    where it stopped. Only the chunks being scored are held in memory.
+
+    Args:
+        profile_file (str): The profile csv or parquet file
+        directory (str): Directory of the scored chunks and the manifest
+        chunk_size (int): Number of customers per chunk
+        n_jobs (int): Number of worker processes, chunks are scored in this process if 1
+        receive_model (str): The receive model artifact, defaults to the registered receive_offer model
+        select_model (str): The select model artifact, defaults to the registered select_offer model
+        default_value (bool): Receive value of the anonymous customers
+        default_offers (list): Offers recommended to the anonymous customers
+        progress (callable): Called with the manifest, rows scored and rows per second after every chunk
+
+    Returns:
+        dict: The manifest
+    """
+
+    os.makedirs(directory, exist_ok=True)
+
+    manifest = _load_manifest(directory, profile_file, chunk_size)
+    _save_manifest(directory, manifest)
+
+    done = set(manifest["chunks"])
+
+    params = dict(
+        receive_model=receive_model,
+        select_model=select_model,
+        default_value=default_value,
+        default_offers=default_offers)
+
+    start = time.perf_counter()
+    rows = 0
+
+    def finish(result):
+        nonlocal rows
+
+        index, record = result
+        manifest["chunks"][str(index)] = record
+        _save_manifest(directory, manifest)
+
+        rows += record["rows"]
+
+        if progress is not None:
+            progress(manifest, rows, rows / (time.perf_counter() - start))
+
+    chunks = ((i, c) for i, c in enumerate(iter_profile(profile_file, chunk_size)) if str(i) not in done)
+
+    if n_jobs == 1:
+        for index, chunk in chunks:
+            finish(_score_chunk(index, chunk, directory, **params))
+    else:
+        with ProcessPoolExecutor(n_jobs) as executor:
+            pending = set()
+
+            for index, chunk in chunks:
+                # a couple of chunks waiting per worker, the file is not read ahead further
+                if len(pending) >= 2 * n_jobs:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+                    for future in finished:
+                        finish(future.result())
+
+                pending.add(executor.submit(_score_chunk, index, chunk, directory, **params))
+
+            for future in pending:
+                finish(future.result())
+
+    manifest["complete"] = True
+    manifest["rows"] = sum(c["rows"] for c in manifest["chunks"].values())
+    _save_manifest(directory, manifest)
+
+    return manifest
+
+def read_batch_results(directory, columns=None):
+    """Reads the scored chunks of a batch job, in profile order
+
+    Args:
+        directory (str): Directory of the batch job
+        columns (list): Columns to read, all columns if None
+
+    Returns:
+        pandas.DataFrame: The id, receive_offer and recommended_offers of each customer, offers missing for the customers ``select_offer`` leaves out
+    """
+
+    manifest = _load_manifest(directory)
+    chunks = sorted(manifest["chunks"].items(), key=lambda c: int(c[0]))
+
+    return pd.concat(
+        [load_dataset(os.path.join(directory, c["file"]), columns=columns) for _, c in chunks],
+        ignore_index=True)
+
+def _score_chunk(index, profile, directory, receive_model=None, select_model=None, default_value=pd.NA, default_offers=[]):
+    """Scores a profile chunk and writes it to the directory
+
+    Args:
+        index (int): The chunk number
+        profile (pandas.DataFrame): The profile chunk
+        directory (str): Directory of the scored chunks
+        receive_model (str): The receive model artifact, the registered model if None
+        select_model (str): The select model artifact, the registered model if None
+        default_value (bool): Receive value of the anonymous customers
+        default_offers (list): Offers recommended to the anonymous customers
+
+    Returns:
+        int: The chunk number
+        dict: The manifest record of the chunk
+    """
+
+    start = time.perf_counter()
+
+    ids = profile[["id"]].copy()
+
+    receive = receive_offer(profile, model=_load_model(receive_model), default_value=default_value)
+    select = select_offer(profile, model=_load_model(select_model), default_offers=default_offers, output="bitmask")
+
+    # receive_offer sorts the customers by id, keep them in profile order
+    results = ids.merge(receive, on="id", how="left").merge(select.to_frame(), on="id", how="left")
+    results.receive_offer = results.receive_offer.astype("boolean")
+
+    file = f"chunk-{index:05d}.parquet"
+
+    # write aside first so a crash never leaves a partial chunk behind
+    save_dataset(results, os.path.join(directory, file + ".tmp"))
+    os.replace(os.path.join(directory, file + ".tmp"), os.path.join(directory, file))
+
+    return index, {"file": file, "rows": len(results), "seconds": time.perf_counter() - start}
+
+def _load_model(file):
+    """Loads a model artifact once per process
+
+    Args:
+        file (str): The model artifact, None for the registered model
+
+    Returns:
+        object: The model, None for the registered model
+    """
+
+    if file is None:
+        return None
+
+    if file not in _models:
+        _models[file] = joblib.load(file)
+
+    return _models[file]
+
+def _load_manifest(directory, profile_file=None, chunk_size=None):
+    """Loads the manifest of a batch job, or starts a new one
+
+    Chunks whose file is missing are dropped, so they are scored again. Chunk
+    files written after the last manifest update, by workers still running when
+    the job stopped, are complete and added back.
+
+    Args:
+        directory (str): Directory of the batch job
+        profile_file (str): The profile file the job scores, not checked if None
+        chunk_size (int): Number of customers per chunk, not checked if None
+
+    Returns:
+        dict: The manifest
+    """
+
+    file = os.path.join(directory, MANIFEST)
+
+    if not os.path.exists(file):
+        if profile_file is None:
+            raise FileNotFoundError(f"No batch job manifest in {directory}.")
+
+        return {"profile": os.path.abspath(profile_file), "chunk_size": chunk_size, "chunks": {}, "complete": False}
+
+    with open(file) as f:
+        manifest = json.load(f)
+
+    if profile_file is not None and (manifest["profile"], manifest["chunk_size"]) != (os.path.abspath(profile_file), chunk_size):
+        raise ValueError(
+            f"The job in {directory} scores {manifest['profile']} in chunks of {manifest['chunk_size']}, "
+            "use another directory to score a different file or chunk size.")
+
+    manifest["chunks"] = {
+        i: c for i, c in manifest["chunks"].items() if os.path.exists(os.path.join(directory, c["file"]))}
+
+    for chunk_file in sorted(glob.glob(os.path.join(directory, "chunk-*.parquet"))):
+        index = str(int(os.path.basename(chunk_file)[len("chunk-"):-len(".parquet")]))
+
+        if index not in manifest["chunks"]:
+            manifest["chunks"][index] = {
+                "file": os.path.basename(chunk_file),
+                "rows": pq.read_metadata(chunk_file).num_rows,
+                "seconds": None
+            }
+
+    return manifest
+
+def _save_manifest(directory, manifest):
+    """Saves the manifest of a batch job, replacing the previous one at once
+
+    Args:
+        directory (str): Directory of the batch job
+        manifest (dict): The manifest
+
+    Returns:
+        None
+    """
+
+    file = os.path.join(directory, MANIFEST)
+
+    with open(file + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    os.replace(file + ".tmp", file)
+
+def main():
+    """Runs the batch scoring job from the command line
+    """
+
+    parser = argparse.ArgumentParser(description="Scores every customer of a profile file, resuming finished chunks.")
+    parser.add_argument("profile", help="Profile csv or parquet file.")
+    parser.add_argument("directory", help="Directory of the scored chunks and the manifest.")
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument("--n-jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--receive-model", default=None, help="Receive model artifact, defaults to the registered model.")
+    parser.add_argument("--select-model", default=None, help="Select model artifact, defaults to the registered model.")
+    parser.add_argument("--default-offers", type=int, nargs="*", default=[])
+    args = parser.parse_args()
+
+    def report(manifest, rows, rows_per_second):
+        print(f"{len(manifest['chunks'])} chunks done, {rows} rows scored, {rows_per_second:,.0f} rows/s", flush=True)
+
+    manifest = run_batch_job(
+        args.profile, args.directory, args.chunk_size, args.n_jobs, args.receive_model, args.select_model,
+        default_offers=args.default_offers, progress=report)
+
+    print(f"{manifest['rows']} rows in {len(manifest['chunks'])} chunks, see {os.path.join(args.directory, MANIFEST)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+import joblib
+import numpy as np
+import pandas as pd
+
+from sklearn.metrics import f1_score
+from sklearn.model_selection import train_test_split
+
+from sb_capstone.synthetic import generate_dataset
+from sb_capstone.features import ReceiveImputer, get_receive_imputer
+from sb_capstone.compiled import compile_model
+from sb_capstone.incremental import evaluate_incremental
+from sb_capstone.shaping import (
+    merge_portfolio,
+    get_transcript_combined,
+    get_transcript_group,
+    convert_for_receive_training,
+    convert_for_select_training
+)
+from sb_capstone.experiment import (
+    train_receive_offer,
+    train_select_offer,
+    receive_offer,
+    select_offer,
+    get_select_model,
+    _convert_for_receive,
+    _convert_for_select
+)
+
+def measure(stage, func, *args, trace_memory=True, **kwargs):
+    """Runs a function, measuring its wall time and peak allocation
+
+    Args:
+        stage (str): The name of the stage
+        func (callable): The function to run
+        *args: The function arguments
+        trace_memory (bool): Whether to trace the peak allocation, which slows the function down
+        **kwargs: The function keyword arguments
+
+    Returns:
+        object: The function result
+        dict: The stage, seconds and peak memory in MB
+    """
+
+    if trace_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+
+        if trace_memory:
+            tracemalloc.stop()
+
+    return result, {"stage": stage, "seconds": seconds, "peak_mb": peak / 1024 ** 2}
+
+def run_pipeline_benchmark(scale=1, seed=0, trace_memory=True, imputers=False, select_models=False, compiled=False,
+        incremental=False, n_jobs=[]):
+    """Benchmarks every stage of the pipeline on a synthetic dataset
+
+    Args:
+        scale (float): Size relative to the 17,000 customers of the experiment
+        seed (int): Random seed of the dataset
+        trace_memory (bool): Whether to trace the peak allocation of each stage
+        imputers (bool): Whether to also compare the receive imputers
+        select_models (bool): Whether to also compare the select model types
+        compiled (bool): Whether to also compare the compiled models to sklearn
+        incremental (bool): Whether to also compare the incremental updates to full retrains
+        n_jobs (list): Worker counts to also run ``get_transcript_combined`` with, in the process pool
+
+    Returns:
+        list: The measures of each stage
+    """
+
+    results = []
+
+    def run(stage, func, *args, **kwargs):
+        result, record = measure(stage, func, *args, trace_memory=trace_memory, **kwargs)
+        results.append({"scale": scale, **record})
+        return result
+
+    portfolio, profile, transcript = run("generate_dataset", generate_dataset, scale, seed)
+
+    transcript_all = run("merge_portfolio", merge_portfolio, transcript, portfolio)
+    transcript_all = run("get_transcript_combined", get_transcript_combined, transcript_all)
+    transcript_group = run("get_transcript_group", get_transcript_group, transcript_all, profile.copy())
+
+    receive_data = run("convert_for_receive_training", convert_for_receive_training, transcript_group.copy(), impute=False)
+    select_data = run("convert_for_select_training", convert_for_select_training, transcript_group.copy())
+
+    with tempfile.TemporaryDirectory() as directory:
+        receive_file, _ = run("train_receive_offer", train_receive_offer, receive_data, os.path.join(directory, "receive_offer.pkl"))
+        select_file, _ = run("train_select_offer", train_select_offer, select_data, os.path.join(directory, "select_offer.pkl"))
+
+        receive_model = joblib.load(receive_file)
+        select_model = joblib.load(select_file)
+
+    run("receive_offer", receive_offer, profile, model=receive_model)
+    run("select_offer", select_offer, profile, model=select_model)
+
+    # the peak allocation is the one of this process, the workers aren't traced
+    for jobs in n_jobs:
+        run(f"get_transcript_combined_{jobs}_jobs", get_transcript_combined, merge_portfolio(transcript, portfolio), n_jobs=jobs)
+
+    if imputers:
+        for record in compare_imputers(receive_data, seed=seed, trace_memory=trace_memory):
+            results.append({"scale": scale, **record})
+
+    if select_models:
+        for record in compare_select_models(select_data, profile, seed=seed, trace_memory=trace_memory):
+            results.append({"scale": scale, **record})
+
+    if compiled:
+        for record in compare_compiled_models(receive_model, select_model, profile):
+            results.append({"scale": scale, **record})
+
+    if incremental:
+        for kind in ["receive", "select"]:
+            for record in evaluate_incremental(transcript_group, kind, seed).to_dict("records"):
+                stage = f"{record.pop('kind')}_{record.pop('model')}_wave_{record.pop('wave')}"
+                results.append({"scale": scale, "stage": stage, "peak_mb": np.NaN, **record})
+
+    return results
+
+def compare_select_models(data, profile, seed=0, trace_memory=True, n_latency=200):
+    """Compares the select model with a tree per offer to the single multi-output tree
+
+    Both are fitted on the same split and report their fit time, artifact size,
+    the latency of ``select_offer`` on one customer, its throughput on the whole
+    profile and the F1 score of every offer on the test rows.
+
+    Args:
+        data (pandas.DataFrame): The select training set
+        profile (pandas.DataFrame): The profile to score
+        seed (int): Random seed of the split and of the trees
+        trace_memory (bool): Whether to trace the peak allocation of each fit
+        n_latency (int): Number of single customer calls to time
+
+    Returns:
+        list: The measures of each model type
+    """
+
+    y_cols = np.arange(1, 11).astype(str).tolist()
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        data.drop(columns=y_cols), data[y_cols], random_state=seed)
+
+    customer = profile[profile.age.notna()].head(1)
+    results = []
+
+    for name, native in [("per_offer", False), ("native", True)]:
+        model = get_select_model(native=native).set_params(**{
+            "random_state" if native else "estimator__random_state": seed})
+
+        _, record = measure(f"fit_select_{name}", model.fit, X_train, y_train, trace_memory=trace_memory)
+
+        with tempfile.TemporaryDirectory() as directory:
+            record["artifact_kb"] = os.path.getsize(joblib.dump(model, os.path.join(directory, "model.pkl"))[0]) / 1024
+
+        latencies = []
+
+        for _ in range(n_latency):
+            start = time.perf_counter()
+            select_offer(customer, model=model)
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        select_offer(profile, model=model, output="bitmask")
+        seconds = time.perf_counter() - start
+
+        record["latency_p50_ms"] = np.median(latencies) * 1000
+        record["rows_per_second"] = len(profile) / seconds
+
+        f1 = f1_score(y_test, np.asarray(model.predict(X_test)), average=None, zero_division=0)
+        record.update({f"f1_{offer}": score for offer, score in zip(y_cols, f1)})
+
+        results.append(record)
+
+    return results
+
+def compare_compiled_models(receive_model, select_model, profile, n_latency=1000):
+    """Compares the predictions and latency of the compiled models to sklearn
+
+    Each model predicts one customer at a time, with sklearn, with the compiled
+    ``predict`` and with ``predict_one``, then the whole profile at once. Every
+    predictor is checked against the sklearn predictions of the whole profile.
+
+    Args:
+        receive_model (sklearn.base.BaseEstimator): The fitted receive model
+        select_model (sklearn.base.BaseEstimator): The fitted select model
+        profile (pandas.DataFrame): The profile to score
+        n_latency (int): Number of single customer predictions to time
+
+    Returns:
+        list: The measures of each model and predictor
+    """
+
+    _, receive_features, _ = _convert_for_receive(profile)
+    select_features, _ = _convert_for_select(profile)
+    select_features = select_features[["gender", "age", "income", "membership_year", "membership_month", "membership_day"]]
+
+    results = []
+
+    for name, model, features in [("receive", receive_model, receive_features), ("select", select_model, select_features)]:
+        compiled = compile_model(model)
+        expected = np.asarray(model.predict(features))
+
+        rows = features.to_numpy()[:n_latency]
+        predictors = [
+            ("sklearn", model.predict, lambda i: features.iloc[i:i + 1], lambda: model.predict(features)),
+            ("compiled", compiled.predict, lambda i: rows[i:i + 1], lambda: compiled.predict(features)),
+            ("compiled_one", compiled.predict_one, lambda i: rows[i],
+                lambda: [compiled.predict_one(row) for row in features.to_numpy()])
+        ]
+
+        for kind, predict, get_row, predict_all in predictors:
+            latencies = []
+
+            for i in range(len(rows)):
+                row = get_row(i)
+                start = time.perf_counter()
+                predict(row)
+                latencies.append(time.perf_counter() - start)
+
+            _, record = measure(f"predict_{name}_{kind}", (model if kind == "sklearn" else compiled).predict, features, trace_memory=False)
+
+            record["latency_p50_us"] = np.median(latencies) * 1e6
+            record["rows_per_second"] = len(features) / record["seconds"]
+            record["matches_sklearn"] = bool(np.array_equal(np.asarray(predict_all()), expected))
+
+            results.append(record)
+
+    return results
+
+def compare_imputers(data, mask_fraction=0.1, seed=0, trace_memory=True):
+    """Compares the fitting time and quality of the receive imputers
+
+    Gender and income are hidden on a fraction of the complete rows, and each
+    imputer is fitted on every row and scored on how well it restores them.
+
+    Args:
+        data (pandas.DataFrame): The receive training set, not imputed
+        mask_fraction (float): Fraction of the complete rows to hide values of
+        seed (int): Random seed of the hidden rows
+        trace_memory (bool): Whether to trace the peak allocation of each fit
+
+    Returns:
+        list: The measures of each imputer
+    """
+
+    features = data.drop(columns=["purchased"]).astype(np.float64).reset_index(drop=True)
+
+    rng = np.random.default_rng(seed)
+    complete = np.flatnonzero(features.notna().all(axis=1).to_numpy())
+    hidden = rng.choice(complete, int(len(complete) * mask_fraction), replace=False)
+
+    masked = features.copy()
+    masked.loc[hidden, ["gender", "income"]] = np.NaN
+
+    imputers = {
+        "iterative": get_receive_imputer(),
+        "fast": get_receive_imputer(fast=True),
+        "most_frequent": ReceiveImputer(strategy="most_frequent")
+    }
+
+    results = []
+
+    for name, imputer in imputers.items():
+        _, record = measure(f"fit_imputer_{name}", imputer.fit, masked, trace_memory=trace_memory)
+
+        imputed = pd.DataFrame(imputer.transform(masked), columns=masked.columns)
+
+        record["gender_accuracy"] = (imputed.gender[hidden].round() == features.gender[hidden]).mean()
+        record["income_mae"] = (imputed.income[hidden] - features.income[hidden]).abs().mean()
+
+        results.append(record)
+
+    return results
+
+def save_baseline(results, file):
+    """Saves benchmark results as the baseline to compare to
+
+    Args:
+        results (list): The benchmark measures
+        file (str): File to save the baseline to
+
+    Returns:
+        str: File where the baseline is saved.
+    """
+
+    with open(file, "w") as f:
+        json.dump({"results": results}, f, indent=2)
+
+    return file
+
+def compare_to_baseline(results, file, tolerance=0.2):
+    """Compares benchmark results to a saved baseline
+
+    Args:
+        results (list): The benchmark measures
+        file (str): The baseline file
+        tolerance (float): Relative increase allowed before flagging a regression
+
+    Returns:
+        pandas.DataFrame: The baseline and current measures per stage, with the regressions flagged
+    """
+
+    with open(file) as f:
+        baseline = pd.DataFrame(json.load(f)["results"])
+
+    comparison = pd.DataFrame(results).merge(
+        baseline, on=["scale", "stage"], how="left", suffixes=("", "_baseline"))
+
+    comparison["seconds_ratio"] = comparison.seconds / comparison.seconds_baseline
+    comparison["peak_ratio"] = comparison.peak_mb / comparison.peak_mb_baseline
+    comparison["regression"] = (comparison.seconds_ratio > 1 + tolerance) | (comparison.peak_ratio > 1 + tolerance)
+
+    return comparison
+
+def main():
+    """Runs the benchmarks from the command line
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmarks the pipeline on synthetic data.")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=None, help="Baseline file to compare to, or to save with --save-baseline.")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--no-memory", action="store_true", help="Skip peak memory tracing, which slows stages down.")
+    parser.add_argument("--imputers", action="store_true", help="Also compare the time and quality of the receive imputers.")
+    parser.add_argument("--select-models", action="store_true", help="Also compare the select model with a tree per offer to a single multi-output tree.")
+    parser.add_argument("--compiled", action="store_true", help="Also compare the predictions and latency of the compiled models to sklearn.")
+    parser.add_argument("--incremental", action="store_true", help="Also compare the incremental model updates to full retrains, wave by wave.")
+    parser.add_argument("--n-jobs", type=int, nargs="*", default=[], help="Also run get_transcript_combined with these worker counts.")
+    args = parser.parse_args()
+
+    results = []
+
+    for scale in args.scales:
+        results.extend(run_pipeline_benchmark(
+            scale, args.seed, not args.no_memory, args.imputers, args.select_models, args.compiled, args.incremental,
+            args.n_jobs))
+
+    if args.baseline is not None and args.save_baseline:
+        save_baseline(results, args.baseline)
+        print(pd.DataFrame(results).to_string(index=False))
+    elif args.baseline is not None:
+        comparison = compare_to_baseline(results, args.baseline, args.tolerance)
+        print(comparison.to_string(index=False))
+
+        if comparison.regression.any():
+            raise SystemExit(1)
+    else:
+        print(pd.DataFrame(results).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,483 @@
+import hashlib
+import inspect
+import os
+import threading
+import numpy as np
+import pandas as pd
+import sklearn
+
+from collections import OrderedDict
+
+from sb_capstone.profiling import call_stage
+
+class StageCache():
+    """Content-addressed on-disk cache of pipeline stage results
+
+    Results are stored as pickles named after their key, and the least recently
+    used ones are evicted once the directory grows past ``max_bytes``.
+
+    Attributes:
+        directory (str): The directory where the results are stored
+        max_bytes (int): The maximum size of the stored results
+        hits (int): Number of results read from the cache
+        misses (int): Number of results computed and stored
+    """
+
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3):
+        """Initializes the class
+
+        Args:
+            directory (str): The directory where the results are stored
+            max_bytes (int): The maximum size of the stored results
+        """
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def contains(self, key):
+        """Checks whether a result is stored
+
+        Args:
+            key (str): The result key
+
+        Returns:
+            bool: Whether the result is stored
+        """
+
+        return os.path.exists(self._get_file(key))
+
+    def get(self, key):
+        """Reads a stored result, marking it as recently used
+
+        Args:
+            key (str): The result key
+
+        Returns:
+            object: The result
+        """
+
+        file = self._get_file(key)
+        data = pd.read_pickle(file)
+        os.utime(file)
+
+        self.hits += 1
+
+        return data
+
+    def put(self, key, data):
+        """Stores a result, evicting the least recently used ones when full
+
+        Args:
+            key (str): The result key
+            data (object): The result
+
+        Returns:
+            None
+        """
+
+        file = self._get_file(key)
+
+        # write aside first so readers never see a partial file
+        pd.to_pickle(data, file + ".tmp")
+        os.replace(file + ".tmp", file)
+
+        self.misses += 1
+        self._evict()
+
+    def clear(self):
+        """Removes every stored result
+
+        Returns:
+            None
+        """
+
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pkl"):
+                os.remove(entry.path)
+
+    def _get_file(self, key):
+        """Gets the file of a result
+
+        Args:
+            key (str): The result key
+
+        Returns:
+            str: The result file
+        """
+
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def _evict(self):
+        """Removes the least recently used results until the size fits
+
+        Returns:
+            None
+        """
+
+        entries = [e for e in os.scandir(self.directory) if e.name.endswith(".pkl")]
+        entries = sorted(entries, key=lambda e: e.stat().st_mtime_ns)
+        size = sum(e.stat().st_size for e in entries)
+
+        # always keep the latest result, even when it doesn't fit by itself
+        for entry in entries[:-1]:
+            if size <= self.max_bytes:
+                break
+
+            size -= entry.stat().st_size
+            os.remove(entry.path)
+
+class PredictionCache():
+    """Bounded in-memory LRU cache of model predictions per customer features
+
+    Customers with the same features get the same prediction, so every row is
+    keyed by the exact bytes of its float64 features, missing values included.
+    The cache holds the predictions of one model version. A call with another
+    version, like a retrained artifact, drops every entry first. Use one cache
+    per model.
+
+    Attributes:
+        max_size (int): The maximum number of cached rows
+        version (object): The model version of the cached predictions
+        hits (int): Number of rows read from the cache
+        misses (int): Number of rows predicted by the model
+        evictions (int): Number of rows dropped to stay within ``max_size``
+        invalidations (int): Number of times the entries were dropped for a new version
+    """
+
+    def __init__(self, max_size=100000):
+        """Initializes the class
+
+        Args:
+            max_size (int): The maximum number of cached rows
+        """
+
+        self.max_size = max_size
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def predict(self, version, predict, X):
+        """Predicts the rows, calling the model only for the features not cached
+
+        Rows with the same features in the batch are predicted once.
+
+        Args:
+            version (object): The model version, like ``registry.get_version`` or the model itself
+            predict (callable): The model predict function
+            X (pandas.DataFrame): The model features
+
+        Returns:
+            numpy.ndarray: The predictions, like ``predict``
+        """
+
+        keys = _get_row_keys(X)
+        values = [None] * len(keys)
+        missing = {}
+
+        with self._lock:
+            if version != self.version:
+                if self.version is not None:
+                    self.invalidations += 1
+
+                self._entries.clear()
+                self.version = version
+
+            for i, key in enumerate(keys):
+                value = self._entries.get(key)
+
+                if value is None:
+                    missing.setdefault(key, []).append(i)
+                else:
+                    self._entries.move_to_end(key)
+                    values[i] = value
+
+            self.hits += len(keys) - sum(len(rows) for rows in missing.values())
+
+        if len(missing) > 0:
+            first = [rows[0] for rows in missing.values()]
+            predictions = np.asarray(predict(X.iloc[first] if hasattr(X, "iloc") else X[first]))
+
+            with self._lock:
+                self.misses += len(first)
+
+                for (key, rows), value in zip(missing.items(), predictions):
+                    for i in rows:
+                        values[i] = value
+
+                    # a prediction made for an older version is not kept
+                    if version == self.version:
+                        self._entries[key] = value
+
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+
+        return np.asarray(values)
+
+    def clear(self):
+        """Drops every cached prediction
+
+        Returns:
+            None
+        """
+
+        with self._lock:
+            self._entries.clear()
+
+def hash_data(data):
+    """Hashes the content of a frame or series, including its index and dtypes
+
+    Args:
+        data (pandas.DataFrame): The data to hash
+
+    Returns:
+        str: The hex digest
+    """
+
+    digest = hashlib.sha256()
+
+    if isinstance(data, pd.Series):
+        data = data.to_frame()
+
+    digest.update(pd.util.hash_pandas_object(data.index).to_numpy().tobytes())
+
+    for col in data.columns:
+        digest.update(repr((col, str(data[col].dtype))).encode())
+
+        values = data[col]
+
+        # object columns may hold lists, which can't be hashed, hash their text instead.
+        # map builds a new array, astype(str) may convert the column in place
+        if values.dtype == object:
+            values = values.map(str)
+
+        values = pd.util.hash_pandas_object(values, index=False)
+
+        digest.update(values.to_numpy().tobytes())
+
+    return digest.hexdigest()
+
+def hash_stage(func, params):
+    """Hashes the code of a stage and its parameters
+
+    The code includes the source of the functions and classes of this package the
+    stage uses, the value of the module constants they refer to, like dtypes and
+    schemas, and the versions of pandas, numpy and sklearn.
+
+    Args:
+        func (callable): The stage function
+        params (dict): The stage parameters
+
+    Returns:
+        str: The hex digest
+    """
+
+    digest = hashlib.sha256()
+    digest.update(repr((pd.__version__, np.__version__, sklearn.__version__)).encode())
+
+    for source in _get_sources(func, set()):
+        digest.update(source.encode())
+
+    for name in sorted(params):
+        value = params[name]
+        value = hash_data(value) if isinstance(value, (pd.DataFrame, pd.Series)) else repr(value)
+        digest.update(repr((name, value)).encode())
+
+    return digest.hexdigest()
+
+def run_stages(data, stages, cache=None):
+    """Runs the data through a chain of stages, reusing cached results
+
+    Each result is keyed by the key of its input and the code and parameters of the
+    stage, so changing a stage only recomputes that stage and the ones after it.
+
+    Args:
+        data (pandas.DataFrame): The input of the first stage
+        stages (list): Pairs of stage function and keyword parameters
+        cache (StageCache): The cache to use, runs every stage if None
+
+    Returns:
+        pandas.DataFrame: The output of the last stage
+    """
+
+    if cache is None:
+        for func, params in stages:
+            data = call_stage(func.__name__, func, data, **params)
+
+        return data
+
+    keys = []
+    key = hash_data(data)
+
+    for func, params in stages:
+        key = hashlib.sha256((key + hash_stage(func, params)).encode()).hexdigest()
+        keys.append(key)
+
+    start = 0
+
+    for i in reversed(range(len(stages))):
+        if cache.contains(keys[i]):
+            data = cache.get(keys[i])
+            start = i + 1
+            break
+
+    for (func, params), key in zip(stages[start:], keys[start:]):
+        data = call_stage(func.__name__, func, data, **params)
+        cache.put(key, data)
+
+    return data
+
+def cached_call(cache, func, data, **params):
+    """Runs a single function as a cached stage
+
+    Args:
+        cache (StageCache): The cache to use
+        func (callable): The function, taking the data as first argument
+        data (pandas.DataFrame): The function input
+        **params: The other function parameters
+
+    Returns:
+        object: The function output
+    """
+
+    return run_stages(data, [(func, params)], cache)
+
+def _get_row_keys(X):
+    """Gets the key of each row, the bytes of its float64 features
+
+    Args:
+        X (pandas.DataFrame): The features
+
+    Returns:
+        list: The key of each row
+    """
+
+    X = np.ascontiguousarray(X, dtype=np.float64)
+
+    # all the missing values share the NaN bits, so the rows with them match too
+    X = np.where(np.isnan(X), np.NaN, X)
+
+    return X.view(np.dtype((np.void, X.dtype.itemsize * X.shape[1]))).ravel().tolist()
+
+def _get_sources(func, seen):
+    """Collects the source of a function and of the package code and constants it uses
+
+    Args:
+        func (callable): The function
+        seen (set): Functions and classes already collected
+
+    Returns:
+        list: The sources
+    """
+
+    # profiled functions are wrappers, hash the function they wrap
+    func = inspect.unwrap(func)
+
+    if func in seen:
+        return []
+
+    seen.add(func)
+
+    try:
+        sources = [inspect.getsource(func)]
+    except (OSError, TypeError):
+        return [repr(func)]
+
+    if inspect.isclass(func):
+        for method in vars(func).values():
+            if inspect.isfunction(method):
+                sources.extend(_get_sources(method, seen))
+
+        return sources
+
+    code = getattr(func, "__code__", None)
+
+    if code is None:
+        return sources
+
+    for name in sorted(_get_code_names(code)):
+        if name not in func.__globals__:
+            continue
+
+        value = func.__globals__[name]
+
+        if (inspect.isfunction(value) or inspect.isclass(value)) and value.__module__.startswith("sb_capstone"):
+            sources.extend(_get_sources(value, seen))
+        else:
+            constant = _describe_constant(value)
+
+            if constant is not None:
+                sources.append(f"{name} = {constant}")
+
+    return sources
+
+def _get_code_names(code):
+    """Collects the global and attribute names of a code object and the code nested in it
+
+    Args:
+        code (types.CodeType): The code
+
+    Returns:
+        set: The names
+    """
+
+    names = set(code.co_names)
+
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names.update(_get_code_names(const))
+
+    return names
+
+def _describe_constant(value):
+    """Describes a module constant by its content
+
+    Modules, functions and other objects, whose repr is their address, are not described,
+    nor are the containers holding them.
+
+    Args:
+        value (object): The constant
+
+    Returns:
+        str: The description, None if the value is not a constant
+    """
+
+    if isinstance(value, np.ndarray):
+        return repr((value.dtype.str, value.shape, hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()))
+
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return hash_data(value)
+
+    if isinstance(value, dict):
+        value = sorted(value.items(), key=repr)
+
+    if isinstance(value, (set, frozenset)):
+        value = sorted(value, key=repr)
+
+    if isinstance(value, (tuple, list)):
+        items = [_describe_constant(v) for v in value]
+
+        # a container of other objects would change its repr on every run
+        return None if None in items else f"[{', '.join(items)}]"
+
+    # types like the dtypes of a schema
+    if inspect.isclass(value):
+        return f"{value.__module__}.{value.__qualname__}"
+
+    if isinstance(value, (str, bytes, int, float, complex, type(None),
+                          np.generic, np.dtype, pd.api.extensions.ExtensionDtype)):
+        return repr(value)
+
+    return None
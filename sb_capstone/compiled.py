@@ -0,0 +1,282 @@
+import numpy as np
+import pandas as pd
+
+from sklearn.impute import IterativeImputer, SimpleImputer
+from sklearn.multioutput import MultiOutputClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.tree import DecisionTreeClassifier
+
+from sb_capstone.features import ReceiveImputer
+
+# children of the leaves, like sklearn.tree._tree.TREE_LEAF
+TREE_LEAF = -1
+
+class CompiledTrees():
+    """Fitted decision trees flattened into contiguous node arrays
+
+    The nodes of every tree are stored one tree after the other, the children
+    pointing into the same arrays. Rows are walked down every tree at once, one
+    level per step, without sklearn's input validation. The features are cast to
+    float32 and compared to the float64 thresholds like sklearn, so the
+    predictions are the same.
+
+    Attributes:
+        feature (numpy.ndarray): The feature each node splits on, 0 on the leaves
+        threshold (numpy.ndarray): The threshold each node splits at, going left when lower or equal
+        children_left (numpy.ndarray): The left child of each node, ``TREE_LEAF`` on the leaves
+        children_right (numpy.ndarray): The right child of each node, ``TREE_LEAF`` on the leaves
+        value (numpy.ndarray): The predicted classes of each node, one column per output
+        roots (numpy.ndarray): The root node of each tree
+        imputers (list): Fitted imputers run on the rows with missing features before the trees
+        n_features (int): Number of features
+    """
+
+    def __init__(self, feature, threshold, children_left, children_right, value, roots, imputers=[], n_features=None):
+        """Initializes the class
+
+        Args:
+            feature (numpy.ndarray): The feature each node splits on, 0 on the leaves
+            threshold (numpy.ndarray): The threshold each node splits at, going left when lower or equal
+            children_left (numpy.ndarray): The left child of each node, ``TREE_LEAF`` on the leaves
+            children_right (numpy.ndarray): The right child of each node, ``TREE_LEAF`` on the leaves
+            value (numpy.ndarray): The predicted classes of each node, one column per output
+            roots (numpy.ndarray): The root node of each tree
+            imputers (list): Fitted imputers run on the rows with missing features before the trees
+            n_features (int): Number of features
+        """
+
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.value = value
+        self.roots = roots
+        self.imputers = imputers
+        self.n_features = n_features
+
+        # both children of node i at 2 * i and 2 * i + 1, to pick one with the split result
+        self._children = np.stack([children_left, children_right], axis=1).ravel()
+        self._nodes = None
+
+    @property
+    def n_outputs(self):
+        """int: Number of predicted outputs over every tree"""
+        return len(self.roots) * self.value.shape[1]
+
+    def apply(self, X):
+        """Finds the leaf of every row in every tree
+
+        Args:
+            X (numpy.ndarray): The contiguous float32 features, without missing values
+
+        Returns:
+            numpy.ndarray: The leaf of each row in each tree
+        """
+
+        n_trees = len(self.roots)
+
+        values = X.ravel()
+        start = np.repeat(np.arange(len(X)) * X.shape[1], n_trees)
+        node = np.tile(self.roots, len(X))
+        active = np.flatnonzero(self.children_left[node] != TREE_LEAF)
+
+        while len(active) > 0:
+            current = node[active]
+            right = values[start[active] + self.feature[current]] > self.threshold[current]
+
+            current = self._children[2 * current + right]
+            node[active] = current
+            active = active[self.children_left[current] != TREE_LEAF]
+
+        return node.reshape(len(X), n_trees)
+
+    def predict(self, X):
+        """Predicts the classes of the rows
+
+        Args:
+            X (pandas.DataFrame): The features, in the training column order
+
+        Returns:
+            numpy.ndarray: The classes, one column per output when more than one
+        """
+
+        X = self._impute(self._check_features(X))
+        y = self.value[self.apply(np.ascontiguousarray(X, dtype=np.float32))].reshape(len(X), self.n_outputs)
+
+        return y[:, 0] if self.n_outputs == 1 else y
+
+    def predict_one(self, x):
+        """Predicts the classes of a single row, walking the trees in plain Python
+
+        Much faster than ``predict`` on one row, where numpy calls cost more than
+        the walk itself.
+
+        Args:
+            x (numpy.ndarray): The features of the row
+
+        Returns:
+            object: The class, or an array of the class of each output when more than one
+        """
+
+        x = np.asarray(x, dtype=np.float64).reshape(1, -1)
+
+        if np.isnan(x).any():
+            return self.predict(x)[0]
+
+        if self._nodes is None:
+            self._nodes = (
+                self.feature.tolist(),
+                self.threshold.tolist(),
+                self.children_left.tolist(),
+                self.children_right.tolist())
+
+        feature, threshold, children_left, children_right = self._nodes
+        x = self._check_features(x)[0].astype(np.float32).tolist()
+        leaves = []
+
+        for node in self.roots.tolist():
+            while children_left[node] != TREE_LEAF:
+                node = children_left[node] if x[feature[node]] <= threshold[node] else children_right[node]
+
+            leaves.append(node)
+
+        y = self.value[leaves].reshape(self.n_outputs)
+
+        return y[0] if self.n_outputs == 1 else y
+
+    def _check_features(self, X):
+        """Converts the features to a float64 matrix and checks their number
+
+        Args:
+            X (pandas.DataFrame): The features
+
+        Returns:
+            numpy.ndarray: The features
+        """
+
+        X = np.asarray(X, dtype=np.float64)
+
+        if X.ndim != 2 or (self.n_features is not None and X.shape[1] != self.n_features):
+            raise ValueError(f"Expected {self.n_features} features, got shape {X.shape}.")
+
+        return X
+
+    def _impute(self, X):
+        """Runs the imputers on the rows with missing features only
+
+        The imputers keep the known values, so the other rows are left as is.
+
+        Args:
+            X (numpy.ndarray): The float64 features
+
+        Returns:
+            numpy.ndarray: The features without missing values
+        """
+
+        missing = np.flatnonzero(np.isnan(X).any(axis=1))
+
+        if len(missing) == 0 or len(self.imputers) == 0:
+            return X
+
+        X = X.copy()
+        rows = X[missing]
+
+        for imputer in self.imputers:
+            # ReceiveImputer keeps the feature names on the imputer it wraps
+            columns = getattr(getattr(imputer, "imputer_", imputer), "feature_names_in_", None)
+            rows = imputer.transform(rows if columns is None else pd.DataFrame(rows, columns=columns))
+
+        X[missing] = rows
+
+        return X
+
+def compile_model(model):
+    """Flattens a fitted receive or select model into ``CompiledTrees``
+
+    Takes a decision tree, a ``MultiOutputClassifier`` of trees, a search like
+    ``GridSearchCV`` with a best estimator, or a ``Pipeline`` of imputers ending
+    with one of these.
+
+    Args:
+        model (sklearn.base.BaseEstimator): The fitted model
+
+    Returns:
+        CompiledTrees: The compiled model
+    """
+
+    imputers = []
+
+    while True:
+        if hasattr(model, "best_estimator_"):
+            model = model.best_estimator_
+        elif isinstance(model, Pipeline):
+            for _, step in model.steps[:-1]:
+                if not isinstance(step, (ReceiveImputer, SimpleImputer, IterativeImputer)):
+                    raise ValueError(f"Cannot compile pipeline step {type(step).__name__}.")
+
+                imputers.append(step)
+
+            model = model.steps[-1][1]
+        else:
+            break
+
+    if isinstance(model, MultiOutputClassifier):
+        trees = model.estimators_
+    elif isinstance(model, DecisionTreeClassifier):
+        trees = [model]
+    else:
+        raise ValueError(f"Cannot compile {type(model).__name__}.")
+
+    if len(set(t.n_outputs_ for t in trees)) > 1:
+        raise ValueError("Cannot compile trees with a different number of outputs.")
+
+    arrays = [_flatten_tree(t) for t in trees]
+    sizes = np.array([len(a[0]) for a in arrays])
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int32)
+
+    def children(i):
+        return np.concatenate([
+            np.where(a[i] == TREE_LEAF, TREE_LEAF, a[i] + offset) for a, offset in zip(arrays, offsets)
+        ]).astype(np.int32)
+
+    return CompiledTrees(
+        feature=np.concatenate([a[0] for a in arrays]),
+        threshold=np.concatenate([a[1] for a in arrays]),
+        children_left=children(2),
+        children_right=children(3),
+        value=np.concatenate([a[4] for a in arrays]),
+        roots=offsets,
+        imputers=imputers,
+        n_features=trees[0].n_features_in_)
+
+def _flatten_tree(tree):
+    """Copies the node arrays of a fitted tree, with the predicted classes of each node
+
+    Args:
+        tree (sklearn.tree.DecisionTreeClassifier): The fitted tree
+
+    Returns:
+        numpy.ndarray: The feature of each node
+        numpy.ndarray: The threshold of each node
+        numpy.ndarray: The left child of each node
+        numpy.ndarray: The right child of each node
+        numpy.ndarray: The predicted classes of each node
+    """
+
+    nodes = tree.tree_
+    classes = tree.classes_ if tree.n_outputs_ > 1 else [tree.classes_]
+
+    # the class with the most weight, the first one on ties, like DecisionTreeClassifier.predict
+    value = np.empty((nodes.node_count, tree.n_outputs_), dtype=classes[0].dtype)
+
+    for k, c in enumerate(classes):
+        value[:, k] = c.take(np.argmax(nodes.value[:, k, :len(c)], axis=1))
+
+    leaf = nodes.children_left == TREE_LEAF
+
+    return (
+        np.where(leaf, 0, nodes.feature).astype(np.int32),
+        nodes.threshold.astype(np.float64),
+        nodes.children_left.astype(np.int32),
+        nodes.children_right.astype(np.int32),
+        value)
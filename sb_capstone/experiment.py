@@ -1,4 +1,5 @@
 from re import split
+import asyncio
 import joblib
 import numpy as np
 import pandas as pd
@@ -8,25 +9,43 @@ from sklearn.multioutput import MultiOutputClassifier
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.metrics import classification_report
 from sklearn.tree import DecisionTreeClassifier
+from sklearn.pipeline import Pipeline
 
 from sb_capstone.shaping import (
     _simplify_gender,
-    _transform_age_group,
-    _transform_generation,
-    _explode_membership_date,
-    _extract_age_bins,
-    _transform_gender
+    _explode_membership_date
 )
 
-select_model = joblib.load("../models/select_offer.pkl")
-receive_model = joblib.load("../models/receive_offer.pkl")
+from sb_capstone.features import (
+    ReceiveFeatureTransformer,
+    RECEIVE_COLUMNS,
+    get_receive_imputer
+)
+
+from sb_capstone.registry import registry
+from sb_capstone.profiling import profiled, call_stage
+
+_receive_features = ReceiveFeatureTransformer()
 
-def train_receive_offer(data, file):
+SELECT_COLUMNS = [
+    "gender",
+    "age",
+    "income",
+    "membership_year",
+    "membership_month",
+    "membership_day"
+]
+
+def train_receive_offer(data, file, fast=False):
     """Trains data to create model to determine if a customer will receive an offer.
 
+    The model imputes missing features itself, with an imputer fitted once on the
+    training rows and saved with the model, so customers are scored the same way.
+
     Args:
-        data (pandas.DataFrame): Data to train model on.
+        data (pandas.DataFrame): Data to train model on, missing features are imputed.
         file (str): File to save model to.
+        fast (bool): Whether to use the fast fitting imputer.
 
     Returns:
         str: File where the model is saved.
@@ -38,7 +57,10 @@ def train_receive_offer(data, file):
 
     X_train, X_test, y_train, y_test = train_test_split(X, y)
 
-    clf = DecisionTreeClassifier(criterion="gini", splitter="random")
+    clf = Pipeline([
+        ("imputer", get_receive_imputer(fast)),
+        ("tree", DecisionTreeClassifier(criterion="gini", splitter="random"))
+    ])
     clf.fit(X_train, y_train)
 
     y_pred = clf.predict(X_test)
@@ -48,12 +70,14 @@ def train_receive_offer(data, file):
 
     return file, score
 
-def train_select_offer(data, file):
+def train_select_offer(data, file, n_jobs=None, native=False):
     """Trains data to create model to determine which offers to show to a customer.
 
     Args:
         data (pandas.DataFrame): Data to train model on.
         file (str): File to save model to.
+        n_jobs (int): Number of processes fitting the offer trees in parallel, -1 for every core.
+        native (bool): Whether to fit a single tree predicting every offer instead of a tree per offer.
 
     Returns:
         str: File where the model is saved.
@@ -67,10 +91,7 @@ def train_select_offer(data, file):
 
     X_train, X_test, y_train, y_test = train_test_split(X, y)
 
-    clf = MultiOutputClassifier(
-        DecisionTreeClassifier(criterion="gini", splitter="random"),
-    )
-
+    clf = get_select_model(n_jobs, native)
     clf.fit(X_train, y_train)
 
     y_pred = clf.predict(X_test)
@@ -80,6 +101,28 @@ def train_select_offer(data, file):
 
     return file, score
 
+def get_select_model(n_jobs=None, native=False):
+    """Creates the select model, not fitted.
+
+    Both models predict a customer by offer matrix, so ``select_offer`` takes either.
+
+    Args:
+        n_jobs (int): Number of processes fitting the offer trees in parallel, -1 for every core.
+        native (bool): Whether to use a single tree predicting every offer instead of a tree per offer.
+
+    Returns:
+        sklearn.base.BaseEstimator: The select model.
+    """
+
+    if native:
+        return DecisionTreeClassifier(criterion="gini", splitter="random")
+
+    return MultiOutputClassifier(
+        DecisionTreeClassifier(criterion="gini", splitter="random"),
+        n_jobs=n_jobs
+    )
+
+@profiled
 def _convert_for_select(profile):
     """Convert profile to be fed into the select model.
 
@@ -99,51 +142,151 @@ def _convert_for_select(profile):
 
     return profile, without_profile
 
-def select_offer(profile, model = select_model, default_offers = []):
+class OfferRecommendations():
+    """Recommended offers of customers packed as bitmasks
+
+    Bit ``k - 1`` of a customer mask is set when offer ``k`` is recommended. The
+    recommendations are only converted to Python lists when asked.
+
+    Attributes:
+        id (numpy.ndarray): The customer ids
+        mask (numpy.ndarray): The uint16 recommended offers mask of each customer
+        anonymous (numpy.ndarray): Whether the customer is anonymous and got the default offers
+    """
+
+    n_offers = 10
+
+    def __init__(self, id, mask, anonymous):
+        """Initializes the class
+
+        Args:
+            id (numpy.ndarray): The customer ids
+            mask (numpy.ndarray): The uint16 recommended offers mask of each customer
+            anonymous (numpy.ndarray): Whether the customer is anonymous and got the default offers
+        """
+
+        self.id = id
+        self.mask = mask
+        self.anonymous = anonymous
+
+    def __len__(self):
+        return len(self.mask)
+
+    def to_dense(self):
+        """Unpacks the masks into a customer by offer matrix
+
+        Returns:
+            numpy.ndarray: The bool matrix, column ``k - 1`` being offer ``k``
+        """
+
+        return ((self.mask[:, None] >> np.arange(self.n_offers, dtype=np.uint16)) & 1).astype(bool)
+
+    def to_csr(self):
+        """Converts the recommendations to compressed sparse rows
+
+        Returns:
+            numpy.ndarray: The row pointers, customer ``i`` offers are ``indices[indptr[i]:indptr[i + 1]]``
+            numpy.ndarray: The recommended offer ids
+        """
+
+        rows, cols = np.nonzero(self.to_dense())
+        indptr = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(self)), out=indptr[1:])
+
+        return indptr, (cols + 1).astype(np.int16)
+
+    def to_lists(self):
+        """Converts the recommendations to lists of offer ids
+
+        Returns:
+            list: The recommended offer ids of each customer
+        """
+
+        indptr, indices = self.to_csr()
+
+        # plain Python ints, indexing numpy arrays one row at a time is much slower
+        indptr, indices = indptr.tolist(), indices.tolist()
+
+        return [indices[indptr[i]:indptr[i + 1]] for i in range(len(self))]
+
+    def to_frame(self):
+        """Converts the recommendations to a frame of offer id lists
+
+        Returns:
+            pandas.DataFrame: The customer ids and recommended offers
+        """
+
+        return pd.DataFrame({"id": self.id, "recommended_offers": self.to_lists()})
+
+def _pack_offers(offers):
+    """Packs offer ids into a mask
+
+    Args:
+        offers (list): The offer ids
+
+    Returns:
+        numpy.uint16: The mask
+    """
+
+    return np.uint16(sum(1 << (int(o) - 1) for o in set(offers)))
+
+def _pack_predictions(y):
+    """Packs the select model predictions into masks
+
+    Args:
+        y (numpy.ndarray): The predictions, one column per offer
+
+    Returns:
+        numpy.ndarray: The uint16 mask of each row
+    """
+
+    y = np.asarray(y) == 1
+
+    return (y.astype(np.uint16) << np.arange(y.shape[1], dtype=np.uint16)).sum(axis=1, dtype=np.uint16)
+
+@profiled
+def select_offer(profile, model = None, default_offers = [], output = "frame", cache = None):
     """Predict which offers to show to a customer.
 
     Args:
         profile (pandas.DataFrame): Profile to predict offers for.
-        model (sklearn.model_selection.Model): Model to use to predict offers.
+        model (sklearn.model_selection.Model): Model to use to predict offers, a tree per offer or a single multi-output tree, defaults to the registered select_offer model.
         default_offers (list): Default offers to show to a customer who are anonymous.
+        output (str): "frame" for offer lists per customer, "bitmask" for ``OfferRecommendations``.
+        cache (PredictionCache): Cache of the predictions of this model, predicts every customer if None.
 
     Returns:
-        pandas.DataFrame: Profile with offers.
+        pandas.DataFrame: Profile with offers, or OfferRecommendations when output is "bitmask".
     """
 
+    model, version = _get_model("select_offer", model)
+
     profile, without_profile = _convert_for_select(profile)
-    
-    offer_cols = np.arange(1, 11).astype(str).tolist()
 
-    profile[offer_cols] = np.zeros(10, dtype=int).tolist()
+    mask = np.zeros(len(profile), dtype=np.uint16)
 
     if len(profile) > 0:
-        cols = [
-            "gender",
-            "age",
-            "income", 
-            "membership_year", 
-            "membership_month", 
-            "membership_day"
-        ]
-
+        mask = _pack_predictions(_predict(model, version, profile[SELECT_COLUMNS], cache))
 
-        y = pd.DataFrame(model.predict(profile[cols]), columns=offer_cols)
+    if output == "bitmask":
+        return OfferRecommendations(
+            np.concatenate([profile.id.to_numpy(), without_profile.id.to_numpy()]),
+            np.concatenate([mask, np.full(len(without_profile), _pack_offers(default_offers), dtype=np.uint16)]),
+            np.repeat([False, True], [len(profile), len(without_profile)]))
 
-        profile[offer_cols] = y
-
-    profile = profile[["id"] + offer_cols]
-    profile = pd.melt(profile, id_vars="id", value_vars=np.arange(1, 11).astype(str).tolist(), var_name="recommended_offers")
-    profile = profile[profile.value == 1]
-    profile = profile.groupby("id").agg({"recommended_offers": lambda x: x.tolist()}).reset_index()
+    # customers without any recommended offer are left out, sorted by id
+    recommendations = OfferRecommendations(profile.id.to_numpy(), mask, np.zeros(len(profile), dtype=bool))
+    recommendations = recommendations.to_frame()[mask != 0].sort_values("id", kind="stable").reset_index(drop=True)
+    recommendations.recommended_offers = recommendations.recommended_offers.apply(lambda x: [str(o) for o in x])
 
     without_profile["recommended_offers"] = [default_offers] * without_profile.shape[0] 
     without_profile = without_profile[["id", "recommended_offers"]]
 
-    results = pd.concat([profile, without_profile])
+    results = pd.concat([recommendations, without_profile])
 
     return results
 
+@profiled
 def _convert_for_receive(profile):
     """Convert profile to be fed into the receive model.
 
@@ -151,61 +294,41 @@ def _convert_for_receive(profile):
         profile (pandas.DataFrame): Profile to convert.
 
     Returns:
-        pandas.DataFrame: Converted profile.
+        pandas.DataFrame: Profile of the known customers.
+        pandas.DataFrame: Receive model features of the known customers.
+        pandas.DataFrame: Profile of the anonymous customers.
     """
 
     without_profile = profile[profile.age.isna()].reset_index(drop=True)
     profile = profile[~profile.age.isna()].reset_index(drop=True)
-    
-    profile = _transform_age_group(
-        _transform_generation(
-        _transform_gender(
-        _explode_membership_date(
-            _extract_age_bins(
-            profile)))))
-    
-    return profile, without_profile
 
-def receive_offer(profile, model = receive_model, default_value=pd.NA):
+    features = pd.DataFrame(_receive_features.transform(profile), columns=RECEIVE_COLUMNS)
+
+    return profile, features, without_profile
+
+@profiled
+def receive_offer(profile, model = None, default_value=pd.NA, cache = None):
     """Predict whether the customer should receive an offer.
 
     Args:
         profile (pandas.DataFrame): Profile to predict offers for.
-        model (sklearn.model_selection.Model): Model to use to predict offers.
+        model (sklearn.model_selection.Model): Model to use to predict offers, defaults to the registered receive_offer model.
         default_value (str): Default value to use if the customer is anonymous.
+        cache (PredictionCache): Cache of the predictions of this model, predicts every customer if None.
 
     Returns:
         pandas.DataFrame: Profile with offers.
     """
 
-    profile, without_profile = _convert_for_receive(profile)
+    model, version = _get_model("receive_offer", model)
 
-    profile["receive_offer"] = False
+    profile, features, without_profile = _convert_for_receive(profile)
 
-    cols = [
-        "gender",
-        "age",
-        "income",
-        "membership_year",
-        "membership_month",
-        "membership_day",
-        "gen_z",
-        "millenials",
-        "gen_x",
-        "boomers",
-        "silent",
-        "young",
-        "adult",
-        "middle_age",
-        "old"
-    ]
+    profile = profile[["id"]].copy()
+    profile["receive_offer"] = False
 
     if len(profile) > 0:
-        y = model.predict(profile[cols])
-        profile["receive_offer"] = y
-        profile.receive_offer = profile.receive_offer.apply(lambda x: True if x==1.0 else False)
-    
-    profile = profile[["id", "receive_offer"]]
+        profile["receive_offer"] = _predict(model, version, features, cache) == 1.0
 
     without_profile["receive_offer"] = default_value
     without_profile = without_profile[["id", "receive_offer"]]
@@ -213,3 +336,200 @@ def receive_offer(profile, model = receive_model, default_value=pd.NA):
     results = pd.concat([profile, without_profile]).sort_values("id").reset_index(drop=True)
 
     return results
+
+def _get_model(name, model):
+    """Gets the model to predict with and its version
+
+    Args:
+        name (str): The name of the registered model
+        model (sklearn.model_selection.Model): The model given by the caller, the registered model if None
+
+    Returns:
+        sklearn.model_selection.Model: The model
+        object: The registry version of the model, or the given model itself
+    """
+
+    if model is not None:
+        return model, model
+
+    # the version is taken first, a newer artifact loaded after it only costs a cache invalidation
+    version = registry.get_version(name)
+
+    return registry.get(name), version
+
+def _predict(model, version, X, cache):
+    """Predicts with the model, through the prediction cache when given
+
+    Args:
+        model (sklearn.model_selection.Model): The model
+        version (object): The model version
+        X (pandas.DataFrame): The model features
+        cache (PredictionCache): The prediction cache, or None
+
+    Returns:
+        numpy.ndarray: The predictions
+    """
+
+    if cache is None:
+        return call_stage("predict", model.predict, X)
+
+    return call_stage("predict", cache.predict, version, model.predict, X)
+
+@profiled
+def _convert_for_scoring(profile):
+    """Convert profile to be fed into both the receive and the select model.
+
+    The select features are the first receive features, without the customers
+    of gender O and with any other gender than M as 0, like ``_convert_for_select``.
+
+    Args:
+        profile (pandas.DataFrame): Profile to convert.
+
+    Returns:
+        pandas.DataFrame: Profile of the known customers.
+        pandas.DataFrame: Receive model features of the known customers.
+        pandas.DataFrame: Select model features of the known customers the select model scores.
+        numpy.ndarray: Whether each known customer is scored by the select model.
+        pandas.DataFrame: Profile of the anonymous customers.
+    """
+
+    profile, features, without_profile = _convert_for_receive(profile)
+
+    selected = (profile.gender != "O").to_numpy()
+
+    select_features = features.loc[selected, SELECT_COLUMNS].reset_index(drop=True)
+    select_features.gender = select_features.gender.fillna(0.0)
+
+    return profile, features, select_features, selected, without_profile
+
+def _combine_scores(profile, selected, without_profile, received, recommended, default_value, default_offers):
+    """Combines the predictions of both models into a single frame
+
+    Args:
+        profile (pandas.DataFrame): Profile of the known customers.
+        selected (numpy.ndarray): Whether each known customer is scored by the select model.
+        without_profile (pandas.DataFrame): Profile of the anonymous customers.
+        received (numpy.ndarray): The receive model predictions of the known customers.
+        recommended (numpy.ndarray): The select model predictions of the selected customers.
+        default_value (bool): Receive value of the anonymous customers.
+        default_offers (list): Offers recommended to the anonymous customers.
+
+    Returns:
+        pandas.DataFrame: The id, receive_offer and recommended_offers of each customer, sorted by id.
+    """
+
+    mask = np.zeros(len(profile), dtype=np.uint16)
+
+    if selected.any():
+        mask[selected] = _pack_predictions(recommended)
+
+    known = profile[["id"]].copy()
+    known["receive_offer"] = np.asarray(received) == 1.0 if len(profile) > 0 else False
+
+    without_profile = without_profile[["id"]].copy()
+    without_profile["receive_offer"] = default_value
+
+    recommendations = OfferRecommendations(
+        np.concatenate([known.id.to_numpy(), without_profile.id.to_numpy()]),
+        np.concatenate([mask, np.full(len(without_profile), _pack_offers(default_offers), dtype=np.uint16)]),
+        np.repeat([False, True], [len(known), len(without_profile)]))
+
+    results = pd.concat([known, without_profile], ignore_index=True)
+    results["recommended_offers"] = recommendations.to_lists()
+
+    return results.sort_values("id").reset_index(drop=True)
+
+@profiled
+def score_profile(profile, receive_model = None, select_model = None, default_value = pd.NA, default_offers = [],
+        receive_cache = None, select_cache = None):
+    """Predict whether the customer should receive an offer, and which offers to show, in one pass.
+
+    The features of both models are prepared once from the profile, instead of
+    once per model with ``receive_offer`` and ``select_offer``.
+
+    Args:
+        profile (pandas.DataFrame): Profile to predict offers for.
+        receive_model (sklearn.model_selection.Model): Model to use to predict receiving, defaults to the registered receive_offer model.
+        select_model (sklearn.model_selection.Model): Model to use to predict offers, defaults to the registered select_offer model.
+        default_value (bool): Receive value of the anonymous customers.
+        default_offers (list): Offers recommended to the anonymous customers.
+        receive_cache (PredictionCache): Cache of the receive model predictions, predicts every customer if None.
+        select_cache (PredictionCache): Cache of the select model predictions, predicts every customer if None.
+
+    Returns:
+        pandas.DataFrame: The id, receive_offer and recommended_offers of each customer, sorted by id. Customers of gender O get no offers, the select model doesn't score them.
+    """
+
+    receive_model, receive_version = _get_model("receive_offer", receive_model)
+    select_model, select_version = _get_model("select_offer", select_model)
+
+    profile, features, select_features, selected, without_profile = _convert_for_scoring(profile)
+
+    received = recommended = None
+
+    if len(features) > 0:
+        received = _predict(receive_model, receive_version, features, receive_cache)
+
+    if len(select_features) > 0:
+        recommended = _predict(select_model, select_version, select_features, select_cache)
+
+    return _combine_scores(profile, selected, without_profile, received, recommended, default_value, default_offers)
+
+async def score_profile_async(profile, receive_model = None, select_model = None, default_value = pd.NA, default_offers = [],
+        receive_cache = None, select_cache = None, executor = None):
+    """Same as ``score_profile``, running both predictions at once in a thread pool.
+
+    The features are also prepared in the pool, so the event loop is never
+    blocked. The trees release the GIL while predicting, so the two models
+    overlap when there is more than one core.
+
+    Args:
+        profile (pandas.DataFrame): Profile to predict offers for.
+        receive_model (sklearn.model_selection.Model): Model to use to predict receiving, defaults to the registered receive_offer model.
+        select_model (sklearn.model_selection.Model): Model to use to predict offers, defaults to the registered select_offer model.
+        default_value (bool): Receive value of the anonymous customers.
+        default_offers (list): Offers recommended to the anonymous customers.
+        receive_cache (PredictionCache): Cache of the receive model predictions, predicts every customer if None.
+        select_cache (PredictionCache): Cache of the select model predictions, predicts every customer if None.
+        executor (concurrent.futures.Executor): Pool to run in, the event loop default pool if None.
+
+    Returns:
+        pandas.DataFrame: The id, receive_offer and recommended_offers of each customer, sorted by id.
+    """
+
+    loop = asyncio.get_running_loop()
+
+    profile, features, select_features, selected, without_profile = \
+        await loop.run_in_executor(executor, _convert_for_scoring, profile)
+
+    received, recommended = await asyncio.gather(
+        loop.run_in_executor(executor, _predict_now, "receive_offer", receive_model, features, receive_cache),
+        loop.run_in_executor(executor, _predict_now, "select_offer", select_model, select_features, select_cache))
+
+    return _combine_scores(profile, selected, without_profile, received, recommended, default_value, default_offers)
+
+def _predict_now(name, model, X, cache):
+    """Predicts with the model, outside of any profiled stage
+
+    The profiler records stages of a single thread, concurrent predictions
+    are not recorded.
+
+    Args:
+        name (str): The name of the registered model
+        model (sklearn.model_selection.Model): The model given by the caller, the registered model if None
+        X (pandas.DataFrame): The model features
+        cache (PredictionCache): The prediction cache, or None
+
+    Returns:
+        numpy.ndarray: The predictions, None without rows
+    """
+
+    model, version = _get_model(name, model)
+
+    if len(X) == 0:
+        return None
+
+    if cache is None:
+        return model.predict(X)
+
+    return cache.predict(version, model.predict, X)
@@ -0,0 +1,205 @@
+import numpy as np
+
+from sklearn.base import (
+    BaseEstimator,
+    TransformerMixin
+)
+from sklearn.experimental import enable_iterative_imputer
+from sklearn.impute import IterativeImputer, SimpleImputer
+
+from sb_capstone.wrangling import GenerationType
+
+RECEIVE_COLUMNS = [
+    "gender",
+    "age",
+    "income",
+    "membership_year",
+    "membership_month",
+    "membership_day",
+    "gen_z",
+    "millenials",
+    "gen_x",
+    "boomers",
+    "silent",
+    "young",
+    "adult",
+    "middle_age",
+    "old"
+]
+
+# same bins as shaping._extract_age_bins
+GENERATION_BINS = np.array([17, 2018-1997, 2018-1981, 2018-1965, 2018-1946, 101], dtype=float)
+AGE_GROUP_BINS = np.array([17, 25, 40, 60, 101], dtype=float)
+
+class ReceiveFeatureTransformer(BaseEstimator, TransformerMixin):
+    """Maps raw profile columns straight to the receive model input matrix
+
+    Produces the same values and column order as ``_extract_age_bins``,
+    ``_explode_membership_date``, ``_transform_gender``, ``_transform_generation`` and
+    ``_transform_age_group`` chained, filling a single float matrix instead of
+    building intermediate frames.
+    """
+
+    def fit(self, X, y=None):
+        """Nothing to fit, the mapping is fixed
+
+        Args:
+            X (pandas.DataFrame): Profile with gender, age, income and became_member_on
+            y (None): Ignored
+
+        Returns:
+            ReceiveFeatureTransformer: The transformer
+        """
+
+        return self
+
+    def transform(self, X):
+        """Transforms profiles into the receive model input
+
+        Args:
+            X (pandas.DataFrame): Profile with gender, age, income and became_member_on
+
+        Returns:
+            numpy.ndarray: The feature matrix, ordered as ``RECEIVE_COLUMNS``
+        """
+
+        gender = np.asarray(X["gender"], dtype=object)
+        age = np.asarray(X["age"], dtype=float)
+        member = np.asarray(X["became_member_on"], dtype="datetime64[ns]")
+
+        features = np.zeros((len(age), len(RECEIVE_COLUMNS)), dtype=float)
+
+        features[:, 0] = np.where(gender == "M", 1.0, np.where(gender == "F", 0.0, np.NaN))
+        features[:, 1] = age
+        features[:, 2] = np.asarray(X["income"], dtype=float)
+
+        month = member.astype("datetime64[M]")
+        features[:, 3] = member.astype("datetime64[Y]").astype(int) + 1970
+        features[:, 4] = month.astype(int) % 12 + 1
+        features[:, 5] = (member - month).astype("timedelta64[D]").astype(int) + 1
+        features[np.isnat(member), 3:6] = np.NaN
+
+        _one_hot(features, 6, age, GENERATION_BINS)
+        _one_hot(features, 6 + len(GenerationType.categories), age, AGE_GROUP_BINS)
+
+        return features
+
+    def get_feature_names_out(self, input_features=None):
+        """Gets the names of the output columns
+
+        Args:
+            input_features (list): Ignored
+
+        Returns:
+            numpy.ndarray: The output column names
+        """
+
+        return np.array(RECEIVE_COLUMNS, dtype=object)
+
+class ReceiveImputer(BaseEstimator, TransformerMixin):
+    """Imputes the missing receive model features, fitted once and kept with the model
+
+    The default is the iterative imputer of the original training. Fitting on a
+    sample of rows, with fewer rounds, or with the most frequent value per column
+    trades imputation quality for fitting time.
+
+    Attributes:
+        strategy (str): "iterative" or "most_frequent"
+        max_samples (int or float): Maximum number of rows to fit on, or fraction of the rows if a float, all rows if None
+        max_iter (int): Maximum number of imputation rounds of the iterative strategy
+        random_state (int): Seed of the row sampling and of the iterative imputer
+    """
+
+    def __init__(self, strategy="iterative", max_samples=None, max_iter=10, random_state=None):
+        """Initializes the class
+
+        Args:
+            strategy (str): "iterative" or "most_frequent"
+            max_samples (int or float): Maximum number of rows to fit on, or fraction of the rows if a float, all rows if None
+            max_iter (int): Maximum number of imputation rounds of the iterative strategy
+            random_state (int): Seed of the row sampling and of the iterative imputer
+        """
+
+        self.strategy = strategy
+        self.max_samples = max_samples
+        self.max_iter = max_iter
+        self.random_state = random_state
+
+    def fit(self, X, y=None):
+        """Fits the imputer
+
+        Args:
+            X (pandas.DataFrame): The receive model features
+            y (None): Ignored
+
+        Returns:
+            ReceiveImputer: The fitted imputer
+        """
+
+        if self.strategy == "iterative":
+            self.imputer_ = IterativeImputer(
+                initial_strategy="most_frequent", max_iter=self.max_iter, random_state=self.random_state)
+        elif self.strategy == "most_frequent":
+            self.imputer_ = SimpleImputer(strategy="most_frequent")
+        else:
+            raise ValueError(f"Unknown imputation strategy {self.strategy}.")
+
+        max_samples = self.max_samples
+
+        if isinstance(max_samples, float):
+            max_samples = max(1, int(np.ceil(max_samples * len(X))))
+
+        if max_samples is not None and len(X) > max_samples:
+            rows = np.random.default_rng(self.random_state).choice(len(X), max_samples, replace=False)
+            X = X.iloc[np.sort(rows)] if hasattr(X, "iloc") else X[np.sort(rows)]
+
+        self.imputer_.fit(X)
+
+        return self
+
+    def transform(self, X):
+        """Imputes the missing features
+
+        Args:
+            X (pandas.DataFrame): The receive model features
+
+        Returns:
+            numpy.ndarray: The features with the missing values imputed
+        """
+
+        return self.imputer_.transform(X)
+
+def get_receive_imputer(fast=False):
+    """Gets an unfitted imputer for the receive model features
+
+    Args:
+        fast (bool): Whether to fit on a fifth of the rows with 3 rounds instead of every row with 10
+
+    Returns:
+        ReceiveImputer: The imputer
+    """
+
+    if fast:
+        return ReceiveImputer(max_samples=0.2, max_iter=3, random_state=0)
+
+    return ReceiveImputer()
+
+def _one_hot(features, offset, values, bins):
+    """Sets the dummy column of the right-closed bin each value falls in
+
+    Values outside of the bins leave every dummy at zero, like ``pandas.cut``.
+
+    Args:
+        features (numpy.ndarray): The feature matrix to fill
+        offset (int): The first dummy column
+        values (numpy.ndarray): The values to bin
+        bins (numpy.ndarray): The bin edges
+
+    Returns:
+        None
+    """
+
+    index = np.searchsorted(bins, values, side="left") - 1
+    valid = (index >= 0) & (index < len(bins) - 1)
+
+    features[np.flatnonzero(valid), offset + index[valid]] = 1.0
@@ -0,0 +1,373 @@
+import os
+import time
+import joblib
+import numpy as np
+import pandas as pd
+
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import f1_score
+from sklearn.multioutput import MultiOutputClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+
+from sb_capstone.features import RECEIVE_COLUMNS, get_receive_imputer
+from sb_capstone.experiment import SELECT_COLUMNS, get_select_model
+from sb_capstone.training import SELECT_TARGETS
+from sb_capstone.shaping import (
+    WAVE_BINS,
+    convert_for_receive_training,
+    convert_for_select_training
+)
+
+class OnlineClassifier(BaseEstimator, ClassifierMixin):
+    """Linear classifier updated one batch of rows at a time
+
+    The features are scaled with running means and variances, and the missing
+    ones are set to the running mean. Several targets get a classifier each.
+    Rare targets, like most offers, are better predicted ``balanced``: a row is
+    positive when its probability is above the share of positive rows seen.
+    The watermark is the time up to which the rows are learned, saved with it.
+
+    Attributes:
+        alpha (float): Regularization strength of the classifiers
+        n_epochs (int): Number of passes over each batch
+        balanced (bool): Whether to predict positive above the positive share instead of above half
+        random_state (int): Seed of the classifiers and of the row order
+        watermark_ (int): The hour up to which the closed rows are learned, 0 before any
+        history_ (list): The rows and accuracy of every update
+    """
+
+    def __init__(self, alpha=0.0001, n_epochs=5, balanced=False, random_state=None):
+        """Initializes the class
+
+        Args:
+            alpha (float): Regularization strength of the classifiers
+            n_epochs (int): Number of passes over each batch
+            balanced (bool): Whether to predict positive above the positive share instead of above half
+            random_state (int): Seed of the classifiers and of the row order
+        """
+
+        self.alpha = alpha
+        self.n_epochs = n_epochs
+        self.balanced = balanced
+        self.random_state = random_state
+
+        self.watermark_ = 0
+        self.history_ = []
+
+    def fit(self, X, y):
+        """Fits the model from scratch, forgetting the watermark and the updates
+
+        Args:
+            X (pandas.DataFrame): The features
+            y (pandas.DataFrame): The target, or targets
+
+        Returns:
+            OnlineClassifier: The fitted model
+        """
+
+        for attr in ["scaler_", "classifier_"]:
+            if hasattr(self, attr):
+                delattr(self, attr)
+
+        self.watermark_ = 0
+        self.history_ = []
+
+        return self.partial_fit(X, y)
+
+    def partial_fit(self, X, y):
+        """Updates the model with a batch of rows
+
+        Args:
+            X (pandas.DataFrame): The features
+            y (pandas.DataFrame): The target, or targets
+
+        Returns:
+            OnlineClassifier: The updated model
+        """
+
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y)
+
+        if not hasattr(self, "classifier_"):
+            self.scaler_ = StandardScaler()
+            self.classifier_ = SGDClassifier(loss="log_loss", alpha=self.alpha, random_state=self.random_state)
+
+            if y.ndim > 1:
+                self.classifier_ = MultiOutputClassifier(self.classifier_)
+
+            self._rng = np.random.default_rng(self.random_state)
+
+            # both classes are declared up front, a batch may only have one of them
+            self.classes_ = np.array([0, 1], dtype=y.dtype)
+            self.n_seen_ = 0
+            self.n_positive_ = np.zeros(y.shape[1:], dtype=np.int64)
+
+        self.n_seen_ += len(y)
+        self.n_positive_ += (y == 1).sum(axis=0)
+
+        classes = self.classes_ if y.ndim == 1 else [self.classes_] * y.shape[1]
+
+        self.scaler_.partial_fit(X)
+        X = self._scale(X)
+
+        for _ in range(self.n_epochs):
+            order = self._rng.permutation(len(X))
+            self.classifier_.partial_fit(X[order], y[order], classes=classes)
+
+        return self
+
+    def predict(self, X):
+        """Predicts the target of the rows
+
+        Args:
+            X (pandas.DataFrame): The features
+
+        Returns:
+            numpy.ndarray: The target, one column per target when more than one
+        """
+
+        X = self._scale(np.asarray(X, dtype=np.float64))
+
+        if not self.balanced:
+            return self.classifier_.predict(X)
+
+        if isinstance(self.classifier_, MultiOutputClassifier):
+            proba = np.column_stack([p[:, 1] for p in self.classifier_.predict_proba(X)])
+        else:
+            proba = self.classifier_.predict_proba(X)[:, 1]
+
+        return self.classes_[(proba > self.n_positive_ / self.n_seen_).astype(int)]
+
+    def _scale(self, X):
+        """Scales the features, the missing ones set to the running mean
+
+        Args:
+            X (numpy.ndarray): The features
+
+        Returns:
+            numpy.ndarray: The scaled features
+        """
+
+        return np.nan_to_num(self.scaler_.transform(X), nan=0.0)
+
+def update_receive_offer(transcript_group, file, now=None, random_state=None):
+    """Updates the incremental receive model with the rows closed since its watermark
+
+    A row is closed once its wave is over and its offer expired, its outcome can't
+    change anymore. Only the rows closed after the model watermark and up to
+    ``now`` are shaped and learned, so the cost follows the new data and the rows
+    of open offers are learned by a later update. The model is created when the
+    file doesn't exist.
+
+    Args:
+        transcript_group (pandas.DataFrame): The transcript group, new waves included
+        file (str): File of the model, updated in place.
+        now (int): The hour the transcript group goes up to, the end of its last wave if None
+        random_state (int): Seed of a new model
+
+    Returns:
+        str: File where the model is saved.
+        dict: The watermark, the new rows and the accuracy on them before the update, None when there was nothing new.
+    """
+
+    model = _load_online_model(file, random_state)
+    new, watermark = _get_closed_rows(transcript_group, model.watermark_, now)
+
+    if len(new) == 0:
+        return file, None
+
+    data = convert_for_receive_training(new)
+
+    return _update(model, data[RECEIVE_COLUMNS], data.purchased, watermark, file)
+
+def update_select_offer(transcript_group, file, now=None, random_state=None):
+    """Updates the incremental select model with the rows closed since its watermark
+
+    The offers of each customer are flattened over the newly closed rows only, so
+    a customer is learned once per update with the offers completed since the last one.
+    The model predicts ``balanced``, each offer being completed by few customers.
+
+    Args:
+        transcript_group (pandas.DataFrame): The transcript group, new waves included
+        file (str): File of the model, updated in place.
+        now (int): The hour the transcript group goes up to, the end of its last wave if None
+        random_state (int): Seed of a new model
+
+    Returns:
+        str: File where the model is saved.
+        dict: The watermark, the new rows and the accuracy on them before the update, None when there was nothing new.
+    """
+
+    model = _load_online_model(file, random_state, balanced=True)
+    new, watermark = _get_closed_rows(transcript_group, model.watermark_, now)
+
+    if len(new) == 0:
+        return file, None
+
+    data = _get_select_data(new)
+
+    return _update(model, data[SELECT_COLUMNS], data[SELECT_TARGETS], watermark, file)
+
+def evaluate_incremental(transcript_group, kind="receive", seed=0):
+    """Tracks the incremental model against a full retrain, wave by wave
+
+    Before each wave, the incremental model learns the previous wave only, while
+    an online model and the decision tree of ``train_receive_offer`` or
+    ``train_select_offer`` are fitted again on every previous wave. All of them are
+    then scored on the wave.
+
+    Args:
+        transcript_group (pandas.DataFrame): The transcript group
+        kind (str): "receive" or "select"
+        seed (int): Random seed of the models
+
+    Returns:
+        pandas.DataFrame: The fit time, accuracy and weighted F1 of each model on each wave
+    """
+
+    waves = np.sort(transcript_group.wave.unique())
+
+    if kind == "receive":
+        data = [convert_for_receive_training(transcript_group[transcript_group.wave == w], impute=False) for w in waves]
+        features, targets, balanced = RECEIVE_COLUMNS, "purchased", False
+        tree = Pipeline([
+            ("imputer", get_receive_imputer(fast=True)),
+            ("tree", DecisionTreeClassifier(criterion="gini", splitter="random", random_state=seed))
+        ])
+    elif kind == "select":
+        data = [_get_select_data(transcript_group[transcript_group.wave == w]) for w in waves]
+        features, targets, balanced = SELECT_COLUMNS, SELECT_TARGETS, True
+        tree = get_select_model().set_params(estimator__random_state=seed)
+    else:
+        raise ValueError(f"Unknown model kind {kind}.")
+
+    incremental = OnlineClassifier(balanced=balanced, random_state=seed)
+    results = []
+
+    for i in range(1, len(waves)):
+        history = pd.concat(data[:i], ignore_index=True)
+        test = data[i]
+
+        models = [
+            ("incremental", incremental, lambda m: m.partial_fit(data[i - 1][features], data[i - 1][targets])),
+            ("online_retrain", OnlineClassifier(balanced=balanced, random_state=seed), lambda m: m.fit(history[features], history[targets])),
+            ("tree_retrain", tree, lambda m: m.fit(history[features], history[targets]))
+        ]
+
+        for name, model, fit in models:
+            start = time.perf_counter()
+            fit(model)
+            seconds = time.perf_counter() - start
+
+            y_true = np.asarray(test[targets])
+            y_pred = np.asarray(model.predict(test[features]))
+
+            results.append({
+                "kind": kind,
+                "wave": int(waves[i]),
+                "model": name,
+                "train_rows": len(history),
+                "fit_rows": len(data[i - 1]) if name == "incremental" else len(history),
+                "seconds": seconds,
+                "accuracy": (y_true == y_pred).mean(),
+                "f1": f1_score(y_true, y_pred, average="weighted", zero_division=0)
+            })
+
+    return pd.DataFrame(results)
+
+def _get_closed_rows(transcript_group, watermark, now=None):
+    """Gets the rows closed after the watermark and up to now
+
+    A row closes at the end of its wave, or when its offer expires if later. The
+    offers still open at the end of the last wave close with it, no event comes
+    after it.
+
+    Args:
+        transcript_group (pandas.DataFrame): The transcript group
+        watermark (int): The hour up to which the rows are already learned
+        now (int): The hour the transcript group goes up to, the end of its last wave if None
+
+    Returns:
+        pandas.DataFrame: The closed rows
+        int: The new watermark
+    """
+
+    bins = np.array(WAVE_BINS)
+    wave = transcript_group.wave.to_numpy(dtype=np.int64)
+
+    if now is None:
+        now = int(bins[wave.max()]) if len(wave) > 0 else watermark
+
+    expires = bins[wave - 1] + 1 + transcript_group.duration.to_numpy(dtype=np.float64) * 24
+    closes = np.minimum(np.maximum(bins[wave], expires), bins[-1])
+
+    return transcript_group[(closes > watermark) & (closes <= now)], max(watermark, now)
+
+def _get_select_data(transcript_group):
+    """Builds the select training set of some waves, with every offer column
+
+    Args:
+        transcript_group (pandas.DataFrame): The transcript group of the waves
+
+    Returns:
+        pandas.DataFrame: The features and offer targets
+    """
+
+    data = convert_for_select_training(transcript_group)
+
+    # offers nobody completed in these waves have no dummy column
+    return data.reindex(columns=SELECT_COLUMNS + SELECT_TARGETS, fill_value=0) \
+        .astype({t: np.uint8 for t in SELECT_TARGETS})
+
+def _load_online_model(file, random_state=None, balanced=False):
+    """Loads an incremental model, or creates it when the file doesn't exist
+
+    Args:
+        file (str): File of the model
+        random_state (int): Seed of a new model
+        balanced (bool): Whether a new model predicts balanced
+
+    Returns:
+        OnlineClassifier: The model
+    """
+
+    if os.path.exists(file):
+        return joblib.load(file)
+
+    return OnlineClassifier(balanced=balanced, random_state=random_state)
+
+def _update(model, X, y, watermark, file):
+    """Scores the model on the new rows, learns them and saves it with the new watermark
+
+    Args:
+        model (OnlineClassifier): The model
+        X (pandas.DataFrame): The new features
+        y (pandas.DataFrame): The new targets
+        watermark (int): The hour up to which the rows are learned after the update
+        file (str): File to save the model to
+
+    Returns:
+        str: File where the model is saved.
+        dict: The watermark, the new rows and the accuracy on them before the update.
+    """
+
+    score = {"watermark": watermark, "rows": len(X), "accuracy": None}
+
+    if len(X) > 0:
+        # scored before learning the rows, as the model would have served them
+        if hasattr(model, "classifier_"):
+            score["accuracy"] = float((np.asarray(y) == np.asarray(model.predict(X))).mean())
+
+        model.partial_fit(X, y)
+
+    model.watermark_ = watermark
+    model.history_.append(score)
+
+    # write aside first so a crash never leaves a partial model behind
+    joblib.dump(model, file + ".tmp")
+    os.replace(file + ".tmp", file)
+
+    return file, score
@@ -0,0 +1,128 @@
+import json
+import numpy as np
+import pandas as pd
+
+from itertools import islice
+
+from sb_capstone.wrangling import (
+    EventType,
+    OfferIDType
+)
+
+RAW_EVENTS = {e.replace("_", " "): i for i, e in enumerate(EventType.categories)}
+
+def load_id_map(file):
+    """Maps the hash ids of a raw portfolio or profile file to their integer ids
+
+    The integer ids follow the order of the file starting from 1, the same way the
+    wrangling notebook assigns them.
+
+    Args:
+        file (str): The raw json lines file
+
+    Returns:
+        dict: The integer id of each hash id
+    """
+
+    with open(file) as f:
+        return {json.loads(line)["id"]: i + 1 for i, line in enumerate(f) if line.strip()}
+
+def iter_transcript(file, person_ids, offer_ids, chunk_size=100000):
+    """Streams the raw transcript into typed frames of at most ``chunk_size`` events
+
+    Events of customers missing from ``person_ids`` are dropped, and offers missing
+    from ``offer_ids`` get the offer id 0, like the wrangling notebook.
+
+    Args:
+        file (str): The raw transcript json lines file
+        person_ids (dict): The integer id of each customer hash id
+        offer_ids (dict): The integer id of each offer hash id
+        chunk_size (int): Maximum number of events decoded at once
+
+    Returns:
+        generator: The transcript chunks with person_id, event, time, offer_id, amount and reward
+    """
+
+    with open(file) as f:
+        while True:
+            lines = list(islice(f, chunk_size))
+
+            if len(lines) == 0:
+                break
+
+            yield _decode_transcript(lines, person_ids, offer_ids)
+
+def read_transcript(file, person_ids, offer_ids, chunk_size=100000):
+    """Reads the raw transcript into a typed frame, decoding it in chunks
+
+    Args:
+        file (str): The raw transcript json lines file
+        person_ids (dict): The integer id of each customer hash id
+        offer_ids (dict): The integer id of each offer hash id
+        chunk_size (int): Maximum number of events decoded at once
+
+    Returns:
+        pandas.DataFrame: The transcript with person_id, event, time, offer_id, amount and reward
+    """
+
+    chunks = list(iter_transcript(file, person_ids, offer_ids, chunk_size))
+
+    if len(chunks) == 0:
+        return _decode_transcript([], person_ids, offer_ids)
+
+    return pd.concat(chunks, ignore_index=True)
+
+def _decode_transcript(lines, person_ids, offer_ids):
+    """Decodes raw transcript lines into typed columns
+
+    Args:
+        lines (list): The raw json lines
+        person_ids (dict): The integer id of each customer hash id
+        offer_ids (dict): The integer id of each offer hash id
+
+    Returns:
+        pandas.DataFrame: The decoded events
+    """
+
+    n = len(lines)
+
+    person = np.zeros(n, dtype=np.int64)
+    event = np.zeros(n, dtype=np.int8)
+    time = np.zeros(n, dtype=np.int64)
+    offer = np.zeros(n, dtype=np.int8)
+    amount = np.full(n, np.NaN)
+    reward = np.full(n, np.NaN)
+    known = np.zeros(n, dtype=bool)
+
+    for i, line in enumerate(lines):
+        if not line.strip():
+            continue
+
+        record = json.loads(line)
+        value = record["value"]
+
+        person[i] = person_ids.get(record["person"], 0)
+        known[i] = person[i] > 0
+        event[i] = RAW_EVENTS[record["event"]]
+        time[i] = record["time"]
+
+        # offer completed events spell the key offer_id, the others offer id
+        offer_hash = value.get("offer id", value.get("offer_id"))
+
+        if offer_hash is not None:
+            offer[i] = offer_ids.get(offer_hash, 0)
+
+        if "amount" in value:
+            amount[i] = value["amount"]
+
+        if "reward" in value:
+            reward[i] = value["reward"]
+
+    return pd.DataFrame({
+        "person_id": person[known],
+        "event": pd.Categorical.from_codes(event[known], dtype=EventType),
+        "time": time[known],
+        "offer_id": pd.Categorical.from_codes(offer[known], dtype=OfferIDType),
+        "amount": amount[known],
+        "reward": reward[known]
+    })
@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+import pandas as pd
+
+from sb_capstone.serving import (
+    _read_message,
+    _write_message
+)
+
+async def _client(records, route, host, port, path, n_requests, latencies):
+    """Sends requests one after another over a keep-alive connection
+
+    Args:
+        records (list): The customer profiles to send, cycled through
+        route (str): The route to request
+        host (str): The server host
+        port (int): The server port
+        path (str): The server unix socket, used instead of host and port
+        n_requests (int): Number of requests to send
+        latencies (list): List the latency of each request is appended to
+
+    Returns:
+        int: Number of failed requests
+    """
+
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+
+    errors = 0
+
+    for i in range(n_requests):
+        body = json.dumps(records[i % len(records)]).encode()
+
+        start = time.perf_counter()
+        _write_message(writer, f"POST {route} HTTP/1.1\r\nHost: {host}", body)
+        await writer.drain()
+        response = await _read_message(reader)
+
+        if response is None:
+            raise ConnectionError("The server closed the connection before responding.")
+
+        status, code, _ = response
+        latencies.append(time.perf_counter() - start)
+
+        errors += code != "200"
+
+    writer.close()
+
+    return errors
+
+async def run_load(records, route="/receive_offer", concurrency=32, n_requests=2000, host="127.0.0.1", port=8080, path=None):
+    """Runs concurrent single customer requests against the scoring server
+
+    Args:
+        records (list): The customer profiles to send
+        route (str): The route to request
+        concurrency (int): Number of concurrent connections
+        n_requests (int): Total number of requests
+        host (str): The server host
+        port (int): The server port
+        path (str): The server unix socket, used instead of host and port
+
+    Returns:
+        dict: Latency percentiles in milliseconds, throughput and errors
+    """
+
+    latencies = []
+
+    # the first clients send one more request each, so the total is n_requests
+    per_client = [n_requests // concurrency + (i < n_requests % concurrency) for i in range(concurrency)]
+
+    start = time.perf_counter()
+    errors = await asyncio.gather(*[
+        _client(records[i::concurrency] or records, route, host, port, path, n, latencies)
+        for i, n in enumerate(per_client) if n > 0])
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+
+    return {
+        "route": route,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": int(sum(errors)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "throughput": len(latencies) / elapsed
+    }
+
+def load_records(file):
+    """Loads customer profiles from the processed profile csv as request records
+
+    Args:
+        file (str): The processed profile file
+
+    Returns:
+        list: The customer profiles
+    """
+
+    profile = pd.read_csv(file)
+    profile = profile.astype(object).where(profile.notna(), None)
+
+    return profile.to_dict(orient="records")
+
+def main():
+    """Runs the load generator from the command line
+    """
+
+    parser = argparse.ArgumentParser(description="Load generator for the scoring server.")
+    parser.add_argument("profile", help="Processed profile csv used as request payloads.")
+    parser.add_argument("--route", default="/receive_offer")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--unix", default=None)
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load(
+        load_records(args.profile), args.route, args.concurrency, args.requests, args.host, args.port, args.unix))
+
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+import glob
+import os
+import numpy as np
+import pandas as pd
+
+from sb_capstone.cache import run_stages
+from sb_capstone.storage import save_dataset, load_dataset
+from sb_capstone.wrangling import TranscriptGroupSchema
+from sb_capstone.shaping import (
+    merge_portfolio,
+    get_transcript_combined,
+    _get_person_partition,
+    _get_group_stages,
+    _get_receive_stages,
+    _get_select_stages,
+    _add_profiles_with_notrans,
+    _impute_missing_values,
+    _impute_missing,
+    get_transcript_offers
+)
+
+def partition_transcript(transcript, directory, n_partitions=16, portfolio=None):
+    """Writes the transcript into on-disk partitions by customer
+
+    Every chunk is split by the hash of ``person_id`` and written as one file per
+    partition, so only a chunk is held in memory at a time.
+
+    Args:
+        transcript (pandas.DataFrame): The transcript, or an iterable of transcript chunks like ``ingest.iter_transcript``
+        directory (str): Directory of the partitions
+        n_partitions (int): Number of partitions
+        portfolio (pandas.DataFrame): The portfolio to merge into every chunk, None when already merged
+
+    Returns:
+        str: Directory of the partitions.
+    """
+
+    if isinstance(transcript, pd.DataFrame):
+        transcript = [transcript]
+
+    for i, chunk in enumerate(transcript):
+        if portfolio is not None:
+            chunk = merge_portfolio(chunk, portfolio)
+
+        partition = _get_person_partition(chunk.person_id.to_numpy(), n_partitions)
+
+        for p in range(n_partitions):
+            file = os.path.join(_get_partition_dir(directory, p), f"transcript-{i:05d}.parquet")
+            save_dataset(chunk[partition == p].reset_index(drop=True), file)
+
+    return directory
+
+def partition_profile(profile, directory, n_partitions=16):
+    """Writes the profile into the partitions of its customers
+
+    Args:
+        profile (pandas.DataFrame): The profile
+        directory (str): Directory of the partitions
+        n_partitions (int): Number of partitions, the same as the transcript
+
+    Returns:
+        str: Directory of the partitions.
+    """
+
+    partition = _get_person_partition(profile.id.to_numpy(), n_partitions)
+
+    for p in range(n_partitions):
+        file = os.path.join(_get_partition_dir(directory, p), "profile.parquet")
+        save_dataset(profile[partition == p].reset_index(drop=True), file)
+
+    return directory
+
+def get_transcript_group_partitioned(directory):
+    """Runs ``get_transcript_combined`` and ``get_transcript_group`` one partition at a time
+
+    Three passes keep the result the same as on the whole transcript: the first
+    groups the events and collects the waves, the second attaches the profiles
+    for every wave and sums the diffs, and the last imputes with the mean of
+    every partition. Each partition ends up with a ``transcript_group.parquet``.
+
+    Args:
+        directory (str): Directory of the partitions
+
+    Returns:
+        list: The transcript group file of each partition.
+    """
+
+    partitions = _get_partitions(directory)
+    stages = _get_group_stages(None)
+    funcs = [func for func, _ in stages]
+
+    expand = funcs.index(_add_profiles_with_notrans)
+    impute = funcs.index(_impute_missing_values)
+
+    waves = set()
+
+    for partition in partitions:
+        transcript = _read_transcript_partition(partition)
+        transcript = get_transcript_combined(transcript)
+        transcript_group = run_stages(transcript, stages[:expand])
+
+        waves.update(np.asarray(transcript_group.wave.unique()).tolist())
+        save_dataset(transcript_group, os.path.join(partition, "grouped.parquet"))
+
+    waves = np.array(sorted(waves), dtype=np.int64)
+    diffs_sum = 0.0
+    diffs_count = 0
+
+    for partition in partitions:
+        profile = load_dataset(os.path.join(partition, "profile.parquet"))
+        transcript_group = load_dataset(os.path.join(partition, "grouped.parquet"))
+
+        transcript_group = run_stages(
+            transcript_group, _get_group_stages(profile, waves)[expand:impute])
+
+        diffs_sum += transcript_group.diffs.sum()
+        diffs_count += transcript_group.diffs.count()
+
+        save_dataset(transcript_group, os.path.join(partition, "expanded.parquet"))
+        os.remove(os.path.join(partition, "grouped.parquet"))
+
+    diffs_mean = diffs_sum / diffs_count if diffs_count > 0 else np.NaN
+    files = []
+
+    for partition in partitions:
+        transcript_group = load_dataset(os.path.join(partition, "expanded.parquet"))
+
+        transcript_group = run_stages(
+            transcript_group, _get_group_stages(None, waves, diffs_mean)[impute:])
+
+        files.append(save_dataset(transcript_group, os.path.join(partition, "transcript_group.parquet")))
+        os.remove(os.path.join(partition, "expanded.parquet"))
+
+    return files
+
+def iter_transcript_group(directory, columns=None):
+    """Streams the transcript group of every partition
+
+    Args:
+        directory (str): Directory of the partitions
+        columns (list): Columns to read, all columns if None
+
+    Returns:
+        generator: The transcript group of each partition
+    """
+
+    for partition in _get_partitions(directory):
+        yield load_dataset(os.path.join(partition, "transcript_group.parquet"), columns=columns)
+
+def read_transcript_group(directory, columns=None):
+    """Reads the transcript groups of every partition into one frame
+
+    Rows follow the partitions, not the order of ``get_transcript_group``. Without
+    partitions, the transcript group is empty.
+
+    Args:
+        directory (str): Directory of the partitions
+        columns (list): Columns to read, all columns if None
+
+    Returns:
+        pandas.DataFrame: The transcript group
+    """
+
+    transcript_groups = list(iter_transcript_group(directory, columns))
+
+    if len(transcript_groups) == 0:
+        return _get_empty_transcript_group(columns)
+
+    return pd.concat(transcript_groups, ignore_index=True)
+
+def convert_for_receive_training_partitioned(directory, impute=False, fast=False):
+    """Builds the receive model training set from the partitions
+
+    The row-wise stages run one partition at a time, only the compact features
+    are put together to fit the imputer.
+
+    Args:
+        directory (str): Directory of the partitions
+        impute (bool): Whether to impute the missing features, leave them to the model imputer if False
+        fast (bool): Whether to use the fast fitting imputer
+
+    Returns:
+        pandas.DataFrame: The features for receive model training
+    """
+
+    stages = _get_receive_stages(fast)
+    impute_stage = [func for func, _ in stages].index(_impute_missing)
+
+    data = [run_stages(t, stages[:impute_stage]) for t in iter_transcript_group(directory)]
+
+    if len(data) == 0:
+        data = [run_stages(_get_empty_transcript_group(), stages[:impute_stage])]
+
+    data = pd.concat(data, ignore_index=True)
+
+    if not impute:
+        return data
+
+    return run_stages(data, stages[impute_stage:])
+
+def convert_for_select_training_partitioned(directory):
+    """Builds the select model training set from the partitions
+
+    The offers of each customer are flattened one partition at a time, the income
+    outliers are then found over every customer.
+
+    Args:
+        directory (str): Directory of the partitions
+
+    Returns:
+        pandas.DataFrame: The features for select model training
+    """
+
+    stages = _get_select_stages()
+    flatten = [func for func, _ in stages].index(get_transcript_offers) + 1
+
+    data = [run_stages(t, stages[:flatten]) for t in iter_transcript_group(directory)]
+
+    if len(data) == 0:
+        data = [run_stages(_get_empty_transcript_group(), stages[:flatten])]
+
+    data = pd.concat(data, ignore_index=True)
+
+    return run_stages(data, stages[flatten:])
+
+def _get_partition_dir(directory, partition):
+    """Gets the directory of a partition, creating it when missing
+
+    Args:
+        directory (str): Directory of the partitions
+        partition (int): The partition number
+
+    Returns:
+        str: The partition directory
+    """
+
+    partition_dir = os.path.join(directory, f"partition-{partition:04d}")
+    os.makedirs(partition_dir, exist_ok=True)
+
+    return partition_dir
+
+def _get_partitions(directory):
+    """Lists the partition directories
+
+    Args:
+        directory (str): Directory of the partitions
+
+    Returns:
+        list: The partition directories, in order
+    """
+
+    return sorted(glob.glob(os.path.join(directory, "partition-*")))
+
+def _read_transcript_partition(partition):
+    """Reads the transcript chunks of a partition
+
+    A partition without chunks, like one only holding profiles, reads as an empty
+    transcript with the columns of the other partitions.
+
+    Args:
+        partition (str): The partition directory
+
+    Returns:
+        pandas.DataFrame: The transcript of the partition customers
+    """
+
+    files = sorted(glob.glob(os.path.join(partition, "transcript-*.parquet")))
+
+    if len(files) == 0:
+        files = sorted(glob.glob(os.path.join(os.path.dirname(partition), "partition-*", "transcript-*.parquet")))
+
+        if len(files) == 0:
+            raise FileNotFoundError(f"No transcript in {os.path.dirname(partition)}.")
+
+        return load_dataset(files[0]).iloc[:0]
+
+    return pd.concat([load_dataset(f) for f in files], ignore_index=True)
+
+def _get_empty_transcript_group(columns=None):
+    """Creates a transcript group without rows, with the dtypes of ``TranscriptGroupSchema``
+
+    Args:
+        columns (list): Columns to keep, all columns if None
+
+    Returns:
+        pandas.DataFrame: The empty transcript group
+    """
+
+    return pd.DataFrame({
+        c: pd.Series(dtype=t) for c, t in TranscriptGroupSchema.items() if columns is None or c in columns
+    })
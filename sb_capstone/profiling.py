@@ -0,0 +1,263 @@
+import functools
+import json
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from contextlib import contextmanager
+
+# the profiler of the current run, stages are called straight through when None
+_profiler = None
+
+class StageProfiler():
+    """Records the cost of the stages called while it is active
+
+    Stages may be nested, each record covers the stage and the stages it calls.
+
+    Only the explicit ``DataFrame.copy`` and ``Series.copy`` calls are counted. The
+    copies made by pandas itself, in ``concat``, ``merge``, ``astype`` or
+    ``get_dummies``, are not, their cost shows in the peak allocation instead.
+
+    Attributes:
+        trace_memory (bool): Whether the peak allocation is traced
+        count_copy_calls (bool): Whether the explicit frame and series copy calls are counted
+        records (list): The measures of each stage call, in call order
+        explicit_copy_calls (int): Number of explicit copy calls so far
+    """
+
+    def __init__(self, trace_memory=True, count_copy_calls=True):
+        """Initializes the class
+
+        Args:
+            trace_memory (bool): Whether to trace the peak allocation with tracemalloc
+            count_copy_calls (bool): Whether to count the explicit frame and series copy calls
+        """
+
+        self.trace_memory = trace_memory
+        self.count_copy_calls = count_copy_calls
+        self.records = []
+        self.explicit_copy_calls = 0
+
+        self._stack = []
+
+    def run(self, stage, func, args, kwargs):
+        """Runs a stage, recording its measures
+
+        Args:
+            stage (str): The name of the stage
+            func (callable): The stage function
+            args (tuple): The function arguments
+            kwargs (dict): The function keyword arguments
+
+        Returns:
+            object: The function result
+        """
+
+        record = {
+            "stage": stage,
+            "parent": self._stack[-1]["stage"] if len(self._stack) > 0 else None,
+            "depth": len(self._stack),
+            "seconds": 0.0,
+            "rows_in": _count_rows(args[0]) if len(args) > 0 else None,
+            "rows_out": None,
+            "peak_mb": None,
+            "explicit_copy_calls": None
+        }
+
+        self.records.append(record)
+
+        copy_calls = self.explicit_copy_calls
+        memory = 0
+
+        if self.trace_memory:
+            memory, peak = tracemalloc.get_traced_memory()
+
+            # hand the peak so far to the calling stage before measuring this one
+            if len(self._stack) > 0:
+                self._stack[-1]["_peak"] = max(self._stack[-1]["_peak"], peak)
+
+            tracemalloc.reset_peak()
+
+        record["_peak"] = memory
+        self._stack.append(record)
+
+        start = time.perf_counter()
+
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            self._stack.pop()
+
+            if self.trace_memory:
+                record["_peak"] = max(record["_peak"], tracemalloc.get_traced_memory()[1])
+                record["peak_mb"] = (record["_peak"] - memory) / 1024 ** 2
+
+                if len(self._stack) > 0:
+                    self._stack[-1]["_peak"] = max(self._stack[-1]["_peak"], record["_peak"])
+
+            if self.count_copy_calls:
+                record["explicit_copy_calls"] = self.explicit_copy_calls - copy_calls
+
+        record["rows_out"] = _count_rows(result)
+
+        return result
+
+    def report(self):
+        """Gets the measures of every stage call
+
+        Returns:
+            pandas.DataFrame: The measures, in call order
+        """
+
+        columns = ["stage", "parent", "depth", "seconds", "rows_in", "rows_out", "peak_mb", "explicit_copy_calls"]
+
+        return pd.DataFrame([{c: r[c] for c in columns} for r in self.records], columns=columns)
+
+    def save_report(self, file):
+        """Saves the measures as JSON
+
+        Args:
+            file (str): File to save the report to
+
+        Returns:
+            str: File where the report is saved.
+        """
+
+        columns = ["stage", "parent", "depth", "seconds", "rows_in", "rows_out", "peak_mb", "explicit_copy_calls"]
+
+        with open(file, "w") as f:
+            json.dump({"stages": [{c: r[c] for c in columns} for r in self.records]}, f, indent=2)
+
+        return file
+
+    def format_table(self):
+        """Formats the measures as a readable table, nested stages indented
+
+        Returns:
+            str: The table
+        """
+
+        report = self.report()
+        stages = [" " * 2 * d + s for s, d in zip(report.stage, report.depth)]
+        width = max([len(s) for s in stages], default=0)
+        report.stage = [s.ljust(width) for s in stages]
+
+        return report.drop(columns=["parent", "depth"]).to_string(index=False)
+
+@contextmanager
+def profile_run(trace_memory=True, count_copy_calls=True):
+    """Profiles the stages called within the block
+
+    Args:
+        trace_memory (bool): Whether to trace the peak allocation with tracemalloc
+        count_copy_calls (bool): Whether to count the explicit frame and series copy calls
+
+    Returns:
+        StageProfiler: The profiler holding the measures
+    """
+
+    global _profiler
+
+    if _profiler is not None:
+        raise RuntimeError("A profiler is already active.")
+
+    profiler = StageProfiler(trace_memory, count_copy_calls)
+    patched = []
+
+    if count_copy_calls:
+        for cls in [pd.DataFrame, pd.Series]:
+            patched.append((cls, cls.copy))
+            cls.copy = _counted_copy(cls.copy, profiler)
+
+    tracing = trace_memory and not tracemalloc.is_tracing()
+
+    if tracing:
+        tracemalloc.start()
+
+    _profiler = profiler
+
+    try:
+        yield profiler
+    finally:
+        _profiler = None
+
+        if tracing:
+            tracemalloc.stop()
+
+        for cls, copy in patched:
+            cls.copy = copy
+
+def call_stage(stage, func, *args, **kwargs):
+    """Calls a function, recording it as a stage when profiling
+
+    Args:
+        stage (str): The name of the stage
+        func (callable): The function to call
+        *args: The function arguments
+        **kwargs: The function keyword arguments
+
+    Returns:
+        object: The function result
+    """
+
+    if _profiler is None:
+        return func(*args, **kwargs)
+
+    return _profiler.run(stage, func, args, kwargs)
+
+def profiled(func):
+    """Records every call of a function as a stage when profiling
+
+    Args:
+        func (callable): The function
+
+    Returns:
+        callable: The wrapped function
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _profiler is None:
+            return func(*args, **kwargs)
+
+        return _profiler.run(func.__name__, func, args, kwargs)
+
+    return wrapper
+
+def _counted_copy(copy, profiler):
+    """Wraps a copy method to count its calls
+
+    Args:
+        copy (callable): The copy method
+        profiler (StageProfiler): The profiler counting the calls
+
+    Returns:
+        callable: The counting copy method
+    """
+
+    @functools.wraps(copy)
+    def wrapper(self, *args, **kwargs):
+        profiler.explicit_copy_calls += 1
+        return copy(self, *args, **kwargs)
+
+    return wrapper
+
+def _count_rows(data):
+    """Counts the rows of a stage input or output
+
+    Args:
+        data (object): A frame, series, array or a tuple starting with one
+
+    Returns:
+        int: The number of rows, None when not tabular
+    """
+
+    if isinstance(data, tuple) and len(data) > 0:
+        data = data[0]
+
+    if isinstance(data, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(data)
+
+    return None
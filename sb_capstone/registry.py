@@ -0,0 +1,168 @@
+import os
+import threading
+import joblib
+
+MODELS_DIR = os.environ.get(
+    "SB_CAPSTONE_MODELS",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models"))
+
+class ModelRegistry():
+    """Loads models lazily and caches them per process
+
+    Every model is registered by name and version, pointing to a joblib artifact.
+    Artifacts are only loaded on first use, and reloaded when the file on disk
+    changes, so a new artifact can be swapped in without restarting the process.
+
+    Attributes:
+        directory (str): The directory where the artifacts are stored
+        mmap_mode (str): Default joblib memory map mode used to load the artifacts
+    """
+
+    def __init__(self, directory=MODELS_DIR, mmap_mode=None):
+        """Initializes the class
+
+        Args:
+            directory (str): The directory where the artifacts are stored
+            mmap_mode (str): Default joblib memory map mode used to load the artifacts
+        """
+
+        self.directory = directory
+        self.mmap_mode = mmap_mode
+
+        self._files = {}
+        self._current = {}
+        self._loaded = {}
+        self._lock = threading.RLock()
+
+    def register(self, name, file=None, version="latest", mmap_mode=None):
+        """Registers an artifact for a model, without loading it
+
+        Args:
+            name (str): The name of the model
+            file (str): The artifact file, defaults to ``<directory>/<name>.pkl``
+            version (str): The version name of the artifact
+            mmap_mode (str): joblib memory map mode, defaults to the registry mode
+
+        Returns:
+            None
+        """
+
+        if file is None:
+            file = os.path.join(self.directory, f"{name}.pkl")
+
+        with self._lock:
+            self._files[name, version] = file, mmap_mode or self.mmap_mode
+            self._current.setdefault(name, version)
+
+    def use(self, name, version):
+        """Switches the version returned by default for a model
+
+        Args:
+            name (str): The name of the model
+            version (str): The registered version to use
+
+        Returns:
+            None
+        """
+
+        with self._lock:
+            if (name, version) not in self._files:
+                raise KeyError(f"Model {name} has no version {version}.")
+
+            self._current[name] = version
+
+    def get(self, name, version=None):
+        """Gets a model, loading it if it is not loaded yet or if its artifact changed
+
+        Args:
+            name (str): The name of the model
+            version (str): The version of the model, defaults to the current version
+
+        Returns:
+            object: The model
+        """
+
+        key = self._get_key(name, version)
+        file, mmap_mode = self._files[key]
+        stamp = self._get_stamp(file)
+
+        with self._lock:
+            loaded = self._loaded.get(key)
+
+            if loaded is None or loaded[0] != stamp:
+                loaded = stamp, joblib.load(file, mmap_mode=mmap_mode)
+                self._loaded[key] = loaded
+
+        return loaded[1]
+
+    def get_version(self, name, version=None):
+        """Gets a token identifying the artifact currently used for a model
+
+        The token changes whenever a different version is used or the artifact is replaced.
+
+        Args:
+            name (str): The name of the model
+            version (str): The version of the model, defaults to the current version
+
+        Returns:
+            tuple: The name, version and file stamp of the artifact
+        """
+
+        key = self._get_key(name, version)
+
+        return key + self._get_stamp(self._files[key][0])
+
+    def unload(self, name=None):
+        """Drops loaded models from the cache, they are loaded again on next use
+
+        Args:
+            name (str): The name of the model, all models if None
+
+        Returns:
+            None
+        """
+
+        with self._lock:
+            for key in list(self._loaded):
+                if name is None or key[0] == name:
+                    del self._loaded[key]
+
+    def _get_key(self, name, version):
+        """Resolves the registered key of a model
+
+        Args:
+            name (str): The name of the model
+            version (str): The version of the model, defaults to the current version
+
+        Returns:
+            tuple: The name and version
+        """
+
+        with self._lock:
+            if name not in self._current:
+                raise KeyError(f"Model {name} is not registered.")
+
+            key = name, version or self._current[name]
+
+            if key not in self._files:
+                raise KeyError(f"Model {name} has no version {key[1]}.")
+
+        return key
+
+    def _get_stamp(self, file):
+        """Gets the modification time and size of an artifact
+
+        Args:
+            file (str): The artifact file
+
+        Returns:
+            tuple: The modification time in nanoseconds and the size
+        """
+
+        stat = os.stat(file)
+
+        return stat.st_mtime_ns, stat.st_size
+
+registry = ModelRegistry()
+registry.register("select_offer")
+registry.register("receive_offer")
@@ -0,0 +1,358 @@
+import argparse
+import asyncio
+import functools
+import json
+import pandas as pd
+
+from sb_capstone.wrangling import clean_profile
+from sb_capstone.cache import PredictionCache
+from sb_capstone.experiment import (
+    receive_offer,
+    select_offer
+)
+
+PROFILE_COLUMNS = ["id", "gender", "age", "income", "became_member_on"]
+
+class MicroBatcher():
+    """Gathers single customer requests into batches scored with one call
+
+    A batch is scored as soon as it reaches ``max_batch_size`` requests or the oldest
+    request waited ``max_wait`` seconds, whichever comes first.
+
+    Attributes:
+        score (callable): Function that takes a profile frame and returns one result per row
+        max_batch_size (int): Maximum number of requests per batch
+        max_wait (float): Maximum time in seconds a request waits for the batch to fill
+        batches (int): Number of batches scored
+        requests (int): Number of requests scored
+    """
+
+    def __init__(self, score, max_batch_size=64, max_wait=0.005):
+        """Initializes the class
+
+        Args:
+            score (callable): Function that takes a profile frame and returns one result per row
+            max_batch_size (int): Maximum number of requests per batch
+            max_wait (float): Maximum time in seconds a request waits for the batch to fill
+        """
+
+        self.score = score
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.requests = 0
+
+        self._queue = None
+        self._worker = None
+
+    async def submit(self, record):
+        """Scores a single customer record
+
+        Args:
+            record (dict): The customer profile
+
+        Returns:
+            object: The result for the customer
+        """
+
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((record, future))
+
+        return await future
+
+    async def close(self):
+        """Stops the batching worker
+
+        Returns:
+            None
+        """
+
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    async def _run(self):
+        """Collects and scores batches until cancelled
+
+        Returns:
+            None
+        """
+
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+
+                if timeout <= 0:
+                    break
+
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            records, futures = zip(*batch)
+
+            try:
+                # predictions hold the GIL for a short time only, keep the loop responsive
+                results = await loop.run_in_executor(None, self.score, list(records))
+
+                if len(results) != len(records):
+                    raise ValueError(f"Scored {len(results)} results for {len(records)} records.")
+            except Exception:
+                # a bad record or a missing result fails the whole batch, score them one by one so only it fails
+                results = await loop.run_in_executor(None, self._score_each, list(records))
+
+            self.batches += 1
+            self.requests += len(futures)
+
+            for future, result in zip(futures, results):
+                if future.done():
+                    continue
+
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _score_each(self, records):
+        """Scores the records one at a time, keeping the error of each failing record
+
+        Args:
+            records (list): The customer profiles
+
+        Returns:
+            list: The result of each record, or the exception it raised
+        """
+
+        results = []
+
+        for record in records:
+            try:
+                result = self.score([record])
+
+                if len(result) != 1:
+                    raise ValueError(f"Scored {len(result)} results for 1 record.")
+
+                results.append(result[0])
+            except Exception as e:
+                results.append(e)
+
+        return results
+
+def _to_profile(records):
+    """Converts request records to a profile frame, using the position as customer id
+
+    Args:
+        records (list): The customer profiles
+
+    Returns:
+        pandas.DataFrame: The profile frame
+    """
+
+    profile = pd.DataFrame.from_records(records, columns=PROFILE_COLUMNS)
+
+    # requests of the same customer may land in the same batch
+    profile["id"] = range(len(profile))
+    profile.age = profile.age.astype(float)
+    profile.income = profile.income.astype(float)
+
+    return clean_profile(profile)
+
+def score_receive(records, model=None, default_value=None, cache=None):
+    """Scores a batch of records with the receive model
+
+    Args:
+        records (list): The customer profiles
+        model (sklearn.model_selection.Model): Model to use, defaults to the registered receive_offer model.
+        default_value (bool): Value returned for anonymous customers
+        cache (PredictionCache): Cache of the receive predictions, kept across batches
+
+    Returns:
+        list: Whether each customer should receive an offer
+    """
+
+    results = receive_offer(_to_profile(records), model=model, default_value=pd.NA, cache=cache) \
+        .set_index("id") \
+        .receive_offer
+
+    return [default_value if pd.isna(r) else bool(r) for r in results.reindex(range(len(records)))]
+
+def score_select(records, model=None, default_offers=[], cache=None):
+    """Scores a batch of records with the select model
+
+    Args:
+        records (list): The customer profiles
+        model (sklearn.model_selection.Model): Model to use, defaults to the registered select_offer model.
+        default_offers (list): Offers returned for anonymous customers
+        cache (PredictionCache): Cache of the select predictions, kept across batches
+
+    Returns:
+        list: The recommended offers of each customer
+    """
+
+    results = select_offer(_to_profile(records), model=model, default_offers=default_offers, cache=cache) \
+        .set_index("id") \
+        .recommended_offers
+
+    return [[int(o) for o in results.get(i, [])] for i in range(len(records))]
+
+class ScoringServer():
+    """Minimal HTTP/1.1 server scoring single customers through micro-batches
+
+    Requests are ``POST /receive_offer`` or ``POST /select_offer`` with a JSON
+    profile record, and responses are JSON objects with the ``result``.
+
+    Attributes:
+        batchers (dict): The micro-batcher of each route
+        caches (dict): The prediction cache of each route, empty without caching
+    """
+
+    def __init__(self, max_batch_size=64, max_wait=0.005, cache_size=None):
+        """Initializes the class
+
+        Args:
+            max_batch_size (int): Maximum number of requests per batch
+            max_wait (float): Maximum time in seconds a request waits for the batch to fill
+            cache_size (int): Maximum number of cached predictions per model, no caching if None
+        """
+
+        scores = {"/receive_offer": score_receive, "/select_offer": score_select}
+        self.caches = {}
+
+        if cache_size is not None:
+            self.caches = {route: PredictionCache(cache_size) for route in scores}
+            scores = {route: functools.partial(score, cache=self.caches[route]) for route, score in scores.items()}
+
+        self.batchers = {route: MicroBatcher(score, max_batch_size, max_wait) for route, score in scores.items()}
+
+    async def serve(self, host="127.0.0.1", port=8080, path=None):
+        """Serves requests until cancelled
+
+        Args:
+            host (str): Host to listen on
+            port (int): Port to listen on
+            path (str): Unix socket to listen on instead of host and port
+
+        Returns:
+            None
+        """
+
+        if path is not None:
+            server = await asyncio.start_unix_server(self._handle, path=path)
+        else:
+            server = await asyncio.start_server(self._handle, host=host, port=port)
+
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        """Handles the requests of a keep-alive connection
+
+        Args:
+            reader (asyncio.StreamReader): The connection reader
+            writer (asyncio.StreamWriter): The connection writer
+
+        Returns:
+            None
+        """
+
+        try:
+            while True:
+                request = await _read_message(reader)
+
+                if request is None:
+                    break
+
+                method, route, body = request
+                batcher = self.batchers.get(route)
+
+                if method != "POST" or batcher is None:
+                    status, payload = "404 Not Found", {"error": f"No route {method} {route}."}
+                else:
+                    try:
+                        status, payload = "200 OK", {"result": await batcher.submit(json.loads(body))}
+                    except Exception as e:
+                        status, payload = "400 Bad Request", {"error": str(e)}
+
+                _write_message(writer, f"HTTP/1.1 {status}", json.dumps(payload).encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+async def _read_message(reader):
+    """Reads an HTTP message from a stream
+
+    Args:
+        reader (asyncio.StreamReader): The stream reader
+
+    Returns:
+        tuple: The two first words of the start line and the body, None when the stream ended
+    """
+
+    start = await reader.readline()
+
+    if not start:
+        return None
+
+    length = 0
+
+    while True:
+        line = await reader.readline()
+
+        if line in (b"\r\n", b"\n", b""):
+            break
+
+        name, _, value = line.decode().partition(":")
+
+        if name.strip().lower() == "content-length":
+            length = int(value)
+
+    body = await reader.readexactly(length)
+    words = start.decode().split()
+
+    return words[0], words[1], body
+
+def _write_message(writer, start, body):
+    """Writes an HTTP message with a JSON body to a stream
+
+    Args:
+        writer (asyncio.StreamWriter): The stream writer
+        start (str): The start line
+        body (bytes): The body
+
+    Returns:
+        None
+    """
+
+    writer.write(
+        f"{start}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+
+def main():
+    """Runs the scoring server from the command line
+    """
+
+    parser = argparse.ArgumentParser(description="Micro-batching scoring server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--unix", default=None, help="Unix socket to listen on instead of host and port.")
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait", type=float, default=0.005, help="Maximum wait in seconds for a batch to fill.")
+    parser.add_argument("--cache-size", type=int, default=None, help="Cache up to this many predictions per model.")
+    args = parser.parse_args()
+
+    server = ScoringServer(args.max_batch_size, args.max_wait, args.cache_size)
+    asyncio.run(server.serve(args.host, args.port, args.unix))
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
+import os
 import pandas as pd
 import numpy as np
-from sklearn.experimental import enable_iterative_imputer
-from sklearn.impute import IterativeImputer
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 
 from sb_capstone.wrangling import (
     GenerationType,
@@ -9,200 +9,501 @@ from sb_capstone.wrangling import (
     OfferIDType,
     OfferType,
     GenderType,
+    EventType,
+    ChannelType,
+    get_channel_mask,
+    apply_schema,
+    TranscriptGroupSchema,
+    ReceiveTrainingSchema,
+    SelectTrainingSchema,
     tukey_rule
 )
 
-class OfferGroup():
-    """Helper class to store offer groups
+from sb_capstone.features import get_receive_imputer
+from sb_capstone.storage import save_dataset, load_dataset
+from sb_capstone.cache import run_stages
+from sb_capstone.profiling import profiled
 
-    Attributes:
-        offer_id (int): The offer id
-        offer_type (str): The offer type
-        expires (int): The time the offer expires
-        events (list): The events that have been added to the offer group
-        difficulty (float): The difficulty of the offer group
-        redeemed (bool): Whether the offer has been redeemed
-        active (bool): Whether the offer is active
-    """
+# the event state of an offer group holds its first three events in 2 bits each
+STATE_RECEIVED = 1
+STATE_VIEWED = 2
+STATE_COMPLETED = 3
 
-    def __init__(self, row):
-        """Initializes the class
+# the time bins of the waves in hours, wave w spans (WAVE_BINS[w - 1], WAVE_BINS[w]]
+WAVE_BINS = [-1, 167, 335, 407, 503, 575, 714]
 
-        Args:
-            row (pandas.Series): The row to initialize the class with
-        """
+def merge_portfolio(transcript, portfolio):
+    """Attaches the offer of every event to the transcript
 
-        self.offer_id = row.offer_id
-        self.offer_type = row.offer_type
-        self.expires = (row.duration * 24) + row.time
-        self.events = []
-        self.difficulty = row.difficulty
-        self.redeemed = False
-        self.active = True
+    Args:
+        transcript (pandas.DataFrame): The cleaned transcript
+        portfolio (pandas.DataFrame): The cleaned portfolio
 
-    def can_add_event(self, row):
-        """Determines whether the offer group can add an event
-        
-        Args:
-            row (pandas.Series): The row to check
+    Returns:
+        pandas.DataFrame: The transcript with the offers, ready for ``get_transcript_combined``
+    """
 
-        Returns:
-            bool: Whether the offer group can add the event
-        """
+    return transcript \
+        .merge(portfolio, left_on="offer_id", right_on="id", how="left") \
+        .rename(columns={"reward_x": "reward", "reward_y": "offer_reward"})
 
-        if row.event != "transaction":
-            return (row.offer_id == self.offer_id) and  \
-                (not row.event in self.events)
-        else:
-            return (row.time <= self.expires) and (not self.redeemed) and (self.active)
+@profiled
+def get_transcript_combined(transcript, n_jobs=None, chunk_size=100000):
+    """Gets an enriched transcript with new features
 
-    def add_event(self, row):
-        """Adds an event to the offer group
+    Args:
+        transcript(pandas.DataFrame): The transcript table to transform
+        n_jobs (int): Number of worker processes, runs serially if None or 1
+        chunk_size (int): Approximate number of events per partition when running in parallel
 
-        Args:
-            row (pandas.Series): The row event to add
+    Returns:
+        pandas.DataFrame: The enriched transcript
+    """
 
-        Returns:
-            None
-        """
+    transcript, arrays = _prepare_transcript(transcript)
 
-        if row.event != "transaction":
-            self.events.append(row.event)
-        else:
-            self.difficulty = self.difficulty - row.amount
-            self.redeemed = self.difficulty <= 0.0
+    if n_jobs is None or n_jobs == 1:
+        offer_group, offer_id = _get_offer_groups(*arrays)
+    else:
+        offer_group, offer_id = _get_offer_groups_parallel(arrays, n_jobs, chunk_size)
 
-    def deactivate(self):
-        """Deactivates the offer group
+    transcript["offer_group"] = offer_group
+    transcript["offer_id"] = offer_id
 
-        Args:
-            None
+    transcript.mapped_offer = transcript.mapped_offer.astype(OfferIDType)
 
-        Returns:
-            None
-        """
+    transcript = transcript.sort_values(by=["person_id", "time"])
+    transcript["diffs"] = transcript.groupby("person_id").time.diff()
+    transcript = transcript.sort_index()
+    transcript.diffs = transcript.diffs.apply(lambda x: np.NaN if x == 0 else x)
+
+    return transcript
+
+def get_transcript_combined_incremental(transcript, state=None, n_jobs=None, chunk_size=100000):
+    """Gets the enriched transcript of newly arrived events, resuming from a previous state
 
-        self.active = False
+    Only the customers that have new events are resumed and updated, the rest of the
+    state is carried over as is.
 
-class OfferGroups():
-    """Helper class to store offer groups
+    Args:
+        transcript (pandas.DataFrame): The new events of the transcript table to transform
+        state (pandas.DataFrame): The offer group state returned by a previous call, None to start over
+        n_jobs (int): Number of worker processes, runs serially if None or 1
+        chunk_size (int): Approximate number of events per partition when running in parallel
+
+    Returns:
+        pandas.DataFrame: The enriched new events
+        pandas.DataFrame: The updated offer group state
     """
 
-    def __init__(self):
-        """Initializes the class
-        """
+    transcript, arrays = _prepare_transcript(transcript)
+
+    if state is None:
+        state = _get_empty_offer_group_state(transcript.person_id.dtype)
+
+    touched = state.person_id.isin(transcript.person_id.unique())
+    groups = _offer_group_state_to_dict(state[touched])
+
+    previous_time = {p: g[-1] for p, g in groups.items()}
+
+    if n_jobs is None or n_jobs == 1:
+        offer_group, offer_id = _get_offer_groups(*arrays, state=groups)
+    else:
+        offer_group, offer_id = _get_offer_groups_parallel(arrays, n_jobs, chunk_size, state=groups)
+
+    transcript["offer_group"] = offer_group
+    transcript["offer_id"] = offer_id
+
+    transcript.mapped_offer = transcript.mapped_offer.astype(OfferIDType)
 
-        self._groups = {}
-        self._index = 0
+    transcript = transcript.sort_values(by=["person_id", "time"])
+    transcript["diffs"] = transcript.groupby("person_id").time.diff()
 
-    def get_group(self, row):
-        """Returns the group that the row event belongs to
+    # the first new event of a customer follows the last event of the previous run
+    first = ~transcript.person_id.duplicated()
+    transcript.loc[first, "diffs"] = \
+        transcript.loc[first, "time"] - transcript.loc[first, "person_id"].map(previous_time)
 
-        Args:
-            row (pandas.Series): The row event to add
+    transcript = transcript.sort_index()
+    transcript.diffs = transcript.diffs.apply(lambda x: np.NaN if x == 0 else x)
 
-        Returns:
-            None
-        """
+    # a group is only viewed along with an event of its offer, so the offers of
+    # these events are enough to tell which of the changed groups are informational
+    informational = set(transcript.offer_id[transcript.offer_type == "informational"].dropna())
 
-        # there should have only one unique event per group
-        result = -row.wave, 0
+    state = pd.concat([state[~touched], _offer_group_state_to_frame(groups, state.person_id.dtype, informational)]) \
+        .sort_values(by=["person_id", "offer_group"]) \
+        .reset_index(drop=True)
 
-        for idx  in self._groups:
-            group = self._groups[idx]
-            if group.can_add_event(row):
-                group.add_event(row)
-                result = idx, group.offer_id
-                break
-        
-        return result
+    return transcript, state
 
-    def add_group(self, row):
-        """Adds a new group to the offer groups
+def save_offer_group_state(state, file):
+    """Saves the offer group state to a parquet file, keeping its dtypes
 
-        Args:
-            row (pandas.Series): The row event to add
+    Args:
+        state (pandas.DataFrame): The offer group state
+        file (str): File to save the state to
 
-        Returns:
-            None
-        """
+    Returns:
+        str: File where the state is saved.
+    """
 
-        # create a new group, initializing all variables
+    # write aside first so a crash never leaves a partial state behind
+    save_dataset(state, file + ".tmp")
+    os.replace(file + ".tmp", file)
 
-        for g in self._groups:
-            self._groups[g].deactivate()
+    return file
 
-        self._index = self._index + 1
-        self._groups[self._index] = OfferGroup(row)
+def load_offer_group_state(file):
+    """Loads the offer group state saved with ``save_offer_group_state``
 
+    Args:
+        file (str): File to load the state from
 
-def get_transcript_combined(transcript):
-    """Gets an enriched transcript with new features
+    Returns:
+        pandas.DataFrame: The offer group state
+    """
+
+    return load_dataset(file)
+
+def _prepare_transcript(transcript):
+    """Adds the time bins and extracts the arrays used by the offer group attribution
 
     Args:
-        transcript(pandas.DataFrame): The transcript table to transform
+        transcript (pandas.DataFrame): The transcript table to transform
 
     Returns:
-        pandas.DataFrame: The enriched transcript
+        pandas.DataFrame: The transcript with time bins and offer columns renamed
+        tuple: The arrays expected by ``_get_offer_groups``
     """
-    
-    transcript["wave"] = pd.cut(transcript.time, bins=[-1, 167, 335, 407, 503, 575, 714], labels=np.arange(1,7))
+
+    transcript["wave"] = pd.cut(transcript.time, bins=WAVE_BINS, labels=np.arange(1,7))
     transcript["day"] = pd.cut(transcript.time, bins=np.arange(-1, 714 + 24, step=24), labels=np.arange(1, 30 + 1))
 
     transcript = transcript.rename(columns={"offer_id": "mapped_offer", "id": "offer_id"})
 
-    transcript = transcript.groupby("person_id").apply(_get_offer_group)
+    arrays = (
+        transcript.person_id.to_numpy(),
+        transcript.time.to_numpy(),
+        transcript.event.astype(EventType).cat.codes.to_numpy(),
+        transcript.offer_id.to_numpy(dtype=float),
+        transcript.amount.to_numpy(dtype=float),
+        ((transcript.duration * 24) + transcript.time).to_numpy(dtype=float),
+        transcript.difficulty.to_numpy(dtype=float),
+        transcript.wave.astype(int).to_numpy())
 
-    transcript.mapped_offer = transcript.mapped_offer.astype(OfferIDType)
+    return transcript, arrays
 
-    transcript = transcript.sort_values(by=["person_id", "time"])
-    transcript["diffs"] = transcript.groupby("person_id").time.diff()
-    transcript = transcript.sort_index()
-    transcript.diffs = transcript.diffs.apply(lambda x: np.NaN if x == 0 else x)
+def _get_empty_offer_group_state(person_id_dtype):
+    """Creates an offer group state without customers
 
-    return transcript
+    Args:
+        person_id_dtype (numpy.dtype): The dtype of the person ids
+
+    Returns:
+        pandas.DataFrame: The empty offer group state
+    """
 
-def _get_offer_group(user_group):
-    """Gets the offer group object
+    return pd.DataFrame({
+        "person_id": pd.Series(dtype=person_id_dtype),
+        "offer_group": pd.Series(dtype="int32"),
+        "offer_id": pd.Series(dtype="float64"),
+        "expires": pd.Series(dtype="float64"),
+        "difficulty": pd.Series(dtype="float64"),
+        "events": pd.Series(dtype="int8"),
+        "active": pd.Series(dtype="bool"),
+        "redeemed": pd.Series(dtype="bool"),
+        "last_time": pd.Series(dtype="int64")
+    })
+
+def _offer_group_state_to_frame(groups, person_id_dtype, informational):
+    """Flattens the offer group state of ``_get_offer_groups`` into a frame
+
+    Only the active group takes transactions, the others only take offer events.
+    An offer event goes to the oldest group of its offer still missing it, even
+    after the group expired, so groups that are no longer active are only left
+    out once they have every offer event. Informational offers are never
+    completed, their groups are left out once viewed. The state holds at most
+    the offers a customer has not answered yet, and the active group, which
+    numbers the next groups. Customers without groups keep a row with
+    ``offer_group`` 0 to remember their last event time.
 
     Args:
-        user_group (pandas.DataFrame): The user group to get the offer group for
+        groups (dict): The offer groups per person
+        person_id_dtype (numpy.dtype): The dtype of the person ids
+        informational (set): The ids of the informational offers
 
     Returns:
-        pandas.DataFrame: The enriched offer group
+        pandas.DataFrame: The offer group state
     """
 
-    offer_groups = OfferGroups()
+    viewed = 0
 
-    for i, row in user_group.iterrows():
-        if row.event == "offer_received":
-            offer_groups.add_group(row)
+    for e in ["offer_received", "offer_viewed"]:
+        viewed |= 1 << EventType.categories.get_loc(e)
 
-        group_id, offer_id = offer_groups.get_group(row)
+    complete = viewed | (1 << EventType.categories.get_loc("offer_completed"))
 
-        user_group.loc[i, "offer_group"] = group_id
-        user_group.loc[i, "offer_id"] = offer_id
+    rows = []
 
-    return user_group
+    for person, (number, offer, expires, difficulty, events, redeemed, last_time) in groups.items():
+        last = len(number) - 1
+        answered = [viewed if offer[k] in informational else complete for k in range(len(number))]
+        kept = [k for k in range(len(number)) if k == last or events[k] & answered[k] != answered[k]]
 
-def _mark_information_completed(transcript_group):
-    """Marks whether the offer event is completed properly on informational offers
+        for k in kept:
+            rows.append((person, number[k], offer[k], expires[k], difficulty[k], events[k], k == last, redeemed and k == last, last_time))
+
+        if len(kept) == 0:
+            rows.append((person, 0, np.NaN, np.NaN, np.NaN, 0, False, False, last_time))
+
+    state = _get_empty_offer_group_state(person_id_dtype)
+
+    return pd.DataFrame(rows, columns=state.columns).astype(state.dtypes.to_dict())
+
+def _offer_group_state_to_dict(state):
+    """Expands the offer group state frame into the state used by ``_get_offer_groups``
 
     Args:
-        transcript_group (pandas.DataFrame): The transcript group to mark
+        state (pandas.DataFrame): The offer group state
 
     Returns:
-        pandas.DataFrame: The modified transcript with updated informational event
+        dict: The offer groups per person
     """
 
-    mask = transcript_group.event.fillna("").apply(lambda x: "transaction" in x)
+    groups = {}
 
-    transcript_group.loc[(transcript_group.offer_type == "informational") & mask, "event"] = \
-        transcript_group[(transcript_group.offer_type == "informational") & mask] \
-            .event  \
-            .apply(lambda x: [e if e != "transaction" else "offer_completed" for e in x])
+    for row in state.sort_values(by=["person_id", "offer_group"]).itertuples(index=False):
+        if row.person_id not in groups:
+            groups[row.person_id] = [[], [], [], [], [], False, int(row.last_time)]
 
-    return transcript_group
+        group = groups[row.person_id]
+
+        if row.offer_group > 0:
+            group[0].append(int(row.offer_group))
+            group[1].append(row.offer_id)
+            group[2].append(row.expires)
+            group[3].append(row.difficulty)
+            group[4].append(int(row.events))
+            group[5] = bool(row.redeemed)
+
+    return groups
+
+def _partition_by_person(person_id, n_partitions):
+    """Hash partitions the events by person
+
+    Args:
+        person_id (numpy.ndarray): The person of each event
+        n_partitions (int): Number of partitions
+
+    Returns:
+        list: The positions of the events in each non-empty partition
+    """
+
+    partition = _get_person_partition(person_id, n_partitions)
+
+    order = np.argsort(partition, kind="stable")
+    bounds = np.searchsorted(partition[order], np.arange(1, n_partitions, dtype=np.uint64))
+
+    return [p for p in np.split(order, bounds) if len(p) > 0]
+
+def _get_person_partition(person_id, n_partitions):
+    """Gets the hash partition of each person
+
+    The ids are hashed as they are, so any id type works. Non-negative integer ids
+    get the same partition whatever their width, like the int32 transcript ids
+    and the int64 profile ids.
+
+    Args:
+        person_id (numpy.ndarray): The person ids
+        n_partitions (int): Number of partitions
+
+    Returns:
+        numpy.ndarray: The partition of each person
+    """
+
+    return pd.util.hash_array(np.asarray(person_id)) % np.uint64(n_partitions)
+
+def _get_offer_groups_parallel(arrays, n_jobs, chunk_size, state=None):
+    """Runs ``_get_offer_groups`` over person partitions in a process pool
+
+    The events of a partition are only gathered when it is sent to a worker,
+    with at most two partitions waiting per worker, so the transcript arrays are
+    not held twice. Each partition is sent the state of its own customers.
+
+    Args:
+        arrays (tuple): The arrays expected by ``_get_offer_groups``
+        n_jobs (int): Number of worker processes, -1 uses all the cores
+        chunk_size (int): Approximate number of events per partition
+        state (dict): Offer groups per person to resume from, updated in place
+
+    Returns:
+        numpy.ndarray: The offer group of each event
+        numpy.ndarray: The offer id of each event
+    """
+
+    if n_jobs < 0:
+        n_jobs = os.cpu_count()
+
+    n_partitions = max(1, -(-len(arrays[0]) // chunk_size))
+    partitions = _partition_by_person(arrays[0], n_partitions)
+
+    offer_group = np.empty(len(arrays[0]), dtype=float)
+    offer_id = np.empty(len(arrays[0]), dtype=float)
+
+    pending = {}
+
+    def finish(futures):
+        # partitions keep the original order of their events, write them back in place
+        for future in futures:
+            p = pending.pop(future)
+            offer_group[p], offer_id[p], partition_state = future.result()
+
+            if state is not None:
+                state.update(partition_state)
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        for p in partitions:
+            if len(pending) >= 2 * n_jobs:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                finish(finished)
+
+            partition_state = None
+
+            if state is not None:
+                partition_state = {person: state[person] for person in set(arrays[0][p].tolist()) if person in state}
+
+            pending[executor.submit(_get_partition_offer_groups, [a[p] for a in arrays], partition_state)] = p
+
+        finish(list(pending))
+
+    return offer_group, offer_id
+
+def _get_partition_offer_groups(arrays, state):
+    """Runs ``_get_offer_groups`` on a partition, in a worker process
+
+    Args:
+        arrays (list): The arrays expected by ``_get_offer_groups``, for the partition events
+        state (dict): Offer groups of the partition customers to resume from, None without state
+
+    Returns:
+        numpy.ndarray: The offer group of each event
+        numpy.ndarray: The offer id of each event
+        dict: The updated offer groups of the partition customers, None without state
+    """
+
+    offer_group, offer_id = _get_offer_groups(*arrays, state=state)
+
+    return offer_group, offer_id, state
+
+def _get_offer_groups(person_id, time, event, offer_id, amount, expires, difficulty, wave, state=None):
+    """Assigns every event to an offer group in a single pass over flat arrays
+
+    An offer received opens a new group and deactivates the previous ones, offer
+    events go to the oldest group of the same offer that has not seen them yet,
+    and transactions go to the active group while it has not expired nor been
+    redeemed. Events outside of any group get the negative wave.
+
+    Args:
+        person_id (numpy.ndarray): The person of each event
+        time (numpy.ndarray): The time of each event
+        event (numpy.ndarray): The ``EventType`` code of each event
+        offer_id (numpy.ndarray): The offer id of each event
+        amount (numpy.ndarray): The transaction amount of each event
+        expires (numpy.ndarray): The expiry of the offer, used on offers received
+        difficulty (numpy.ndarray): The difficulty of the offer, used on offers received
+        wave (numpy.ndarray): The wave of each event
+        state (dict): Offer groups per person to resume from, updated in place
+
+    Returns:
+        numpy.ndarray: The offer group of each event
+        numpy.ndarray: The offer id of each event
+    """
+
+    received = EventType.categories.get_loc("offer_received")
+    transaction = EventType.categories.get_loc("transaction")
+
+    # stable sort keeps the original event order within a person
+    order = np.argsort(person_id, kind="stable")
+
+    persons = person_id[order].tolist()
+    times = time[order].tolist()
+    events = event[order].tolist()
+    offers = offer_id[order].tolist()
+    amounts = amount[order].tolist()
+    expiries = expires[order].tolist()
+    difficulties = difficulty[order].tolist()
+    waves = wave[order].tolist()
+
+    group_out = np.empty(len(order), dtype=float)
+    offer_out = np.empty(len(order), dtype=float)
+
+    current = None
+
+    for i in range(len(order)):
+        if persons[i] != current:
+            if state is not None and current is not None:
+                state[current] = group_number, group_offer, group_expires, group_difficulty, group_events, redeemed, last_time
+
+            current = persons[i]
+
+            if state is not None and current in state:
+                group_number, group_offer, group_expires, group_difficulty, group_events, redeemed, last_time = state[current]
+            else:
+                # group state, one entry per group in the order they were received
+                group_number, group_offer, group_expires, group_difficulty, group_events = [], [], [], [], []
+                redeemed = False
+                last_time = None
+
+            # group positions per offer id, oldest first
+            offer_index = {}
+
+            for k, o in enumerate(group_offer):
+                offer_index.setdefault(o, []).append(k)
+
+        if events[i] == received:
+            group_number.append(group_number[-1] + 1 if len(group_number) > 0 else 1)
+            group_offer.append(offers[i])
+            group_expires.append(expiries[i])
+            group_difficulty.append(difficulties[i])
+            group_events.append(0)
+            offer_index.setdefault(offers[i], []).append(len(group_offer) - 1)
+            redeemed = False
+
+        group = -waves[i]
+        offer = 0
+
+        if events[i] == transaction:
+            # only the latest group is active, the rest are deactivated on receive
+            if len(group_offer) > 0 and not redeemed and times[i] <= group_expires[-1]:
+                group_difficulty[-1] = group_difficulty[-1] - amounts[i]
+                redeemed = group_difficulty[-1] <= 0.0
+                group, offer = group_number[-1], group_offer[-1]
+        elif events[i] >= 0:
+            bit = 1 << events[i]
+
+            for k in offer_index.get(offers[i], ()):
+                if not group_events[k] & bit:
+                    group_events[k] |= bit
+                    group, offer = group_number[k], group_offer[k]
+                    break
+
+        if last_time is None or times[i] > last_time:
+            last_time = times[i]
+
+        group_out[i] = group
+        offer_out[i] = offer
+
+    if state is not None and current is not None:
+        state[current] = group_number, group_offer, group_expires, group_difficulty, group_events, redeemed, last_time
+
+    offer_group = np.empty(len(order), dtype=float)
+    offer_group[order] = group_out
+
+    offer_id = np.empty(len(order), dtype=float)
+    offer_id[order] = offer_out
+
+    return offer_group, offer_id
 
 def _get_non_offer_amount(transcript_group):
     """Extracts the amount not related to offer
@@ -224,38 +525,60 @@ def _get_non_offer_amount(transcript_group):
     transcript_group = transcript_offer \
         .merge(transcript_non_offer, on=["person_id", "wave"], how="outer")
 
-    transcript_group.event = transcript_group.event.apply(lambda x: [] if x is np.NaN else x)
+    transcript_group.event_state = transcript_group.event_state.fillna(0).astype(np.int8)
     transcript_group.channels = transcript_group.channels.apply(lambda x: [] if x is np.NaN else x)
 
     return transcript_group
 
-def _add_profiles_with_notrans(transcript_group, profile):
+def _add_profiles_with_notrans(transcript_group, profile, waves=None):
     """Attach customer profile to transcript
 
     Args:
         transcript_group (pandas.DataFrame): The transcript group to attach the profile to
         profile (pandas.DataFrame): The customer profile to attach
+        waves (numpy.ndarray): The waves every customer gets a row for, the waves of the transcript if None
 
     Returns:
         pandas.DataFrame: The modified transcript with the profile attached
     """
 
-    waves = []
-
-    for i in transcript_group.wave.unique():
-        wave = profile.copy()
-        wave["wave"] = i
-        waves.append(wave)
+    if waves is None:
+        waves = transcript_group.wave.unique()
 
-    profile_wave = pd.concat(waves)
+    waves = np.asarray(waves)
 
-    transcript_group = profile_wave \
+    # join the customer and wave keys to the group positions only, then take every
+    # column once, so neither the profile nor the groups are copied per wave
+    keys = pd.DataFrame({
+            "id": np.tile(profile.id.to_numpy(), len(waves)),
+            "wave": np.repeat(waves, len(profile))
+        }) \
         .merge( \
-            transcript_group,  
+            pd.DataFrame({
+                "person_id": transcript_group.person_id,
+                "wave": transcript_group.wave,
+                "group_position": np.arange(len(transcript_group))
+            }),
             left_on=["id", "wave"], 
             right_on=["person_id", "wave"], 
             how="left")
 
+    profile_positions = pd.Index(profile.id).get_indexer(keys.id)
+    group_positions = keys.group_position.fillna(-1).astype(np.int64).to_numpy()
+
+    columns = {}
+
+    for col in profile.columns:
+        columns[col] = keys.id if col == "id" else profile[col].take(profile_positions).reset_index(drop=True)
+
+    columns["wave"] = keys.wave
+    columns["person_id"] = keys.person_id
+
+    for col in transcript_group.columns:
+        if col not in columns:
+            columns[col] = pd.api.extensions.take(transcript_group[col].array, group_positions, allow_fill=True)
+
+    transcript_group = pd.DataFrame(columns, copy=False)
     transcript_group.gender = transcript_group.gender.astype(GenderType)
 
     return transcript_group
@@ -270,15 +593,15 @@ def _promote_events_to_columns(transcript_group):
         pandas.DataFrame: The modified transcript with the events promoted as columns
     """
 
-    transcript_group["received"] = transcript_group.event \
-        .fillna("") \
-        .apply(lambda x: x[0] == "offer_received" if len(x) > 0 else False)
-    transcript_group["viewed"] = transcript_group.event \
-        .fillna("") \
-        .apply(lambda x: x[1] == "offer_viewed" if len(x) > 1 else False)
-    transcript_group["completed"] = transcript_group.event \
-        .fillna("") \
-        .apply(lambda x: (x[2] == "offer_completed" or x[1] == "offer_completed") if len(x) > 2 else False)
+    state = transcript_group.event_state.fillna(0).astype(np.int8).to_numpy()
+
+    first = state & 3
+    second = (state >> 2) & 3
+    third = (state >> 4) & 3
+
+    transcript_group["received"] = first == STATE_RECEIVED
+    transcript_group["viewed"] = second == STATE_VIEWED
+    transcript_group["completed"] = (third != 0) & ((third == STATE_COMPLETED) | (second == STATE_COMPLETED))
 
     return transcript_group
 
@@ -292,21 +615,26 @@ def _promote_channels_to_columns(transcript_group):
         pandas.DataFrame: The modified transcript with the channels promoted as columns
     """
 
-    transcript_group \
-        .loc[~transcript_group.channels.isna(), ["web", "email", "mobile", "social"]] =  \
-            transcript_group \
-                .loc[~transcript_group.channels.isna()] \
-                .channels \
-                .apply(lambda x: pd.Series([1] * len(x), index=x)) \
-                .fillna(0, downcast='infer')
+    # every offer has the same channels, so build them once per offer and look them up
+    offers = transcript_group \
+        .loc[~transcript_group.channels.isna() & ~transcript_group.mapped_offer.isna(), ["mapped_offer", "channels"]] \
+        .drop_duplicates(subset="mapped_offer") \
+        .rename(columns={"mapped_offer": "id"})
+
+    mask = get_channel_mask(offers)
+    channels = mask[transcript_group.mapped_offer.astype(float).fillna(0).astype(int).to_numpy()]
+
+    for channel in ["web", "email", "mobile", "social"]:
+        transcript_group[channel] = channels[:, ChannelType.categories.get_loc(channel)]
 
     return transcript_group
 
-def _impute_missing_values(transcript_group):
+def _impute_missing_values(transcript_group, diffs_mean=None):
     """Impute the missing values
 
     Args:
         transcript_group (pandas.DataFrame): The transcript dataset
+        diffs_mean (float): The mean imputed for the missing diffs, the mean of the transcript if None
 
     Returns:
         pandas.DataFrame: The modified transcript with the missing values imputed
@@ -325,23 +653,10 @@ def _impute_missing_values(transcript_group):
     transcript_group.gender = transcript_group.gender.fillna("U")
     transcript_group.offer_type = transcript_group.offer_type.fillna("no_offer")
 
-    diffs_mean = transcript_group.diffs.mean()
-    transcript_group.diffs = transcript_group.diffs.fillna(diffs_mean)
-
-    return transcript_group
-
-def _remove_transaction_in_event(transcript_group):
-    """Removes the transaction in the list of events
-
-    Args:
-        transcript_group (pandas.DataFrame): The transcript dataset
+    if diffs_mean is None:
+        diffs_mean = transcript_group.diffs.mean()
 
-    Returns:
-        pandas.DataFrame: The modified transcript with the transaction removed
-    """
-
-    transcript_group.event = transcript_group.event \
-        .apply(lambda x: list(filter(lambda a: a != "transaction", x)) if x != np.NaN else [])
+    transcript_group.diffs = transcript_group.diffs.fillna(diffs_mean)
 
     return transcript_group
 
@@ -398,8 +713,10 @@ def _extract_purchased(transcript_group):
         pandas.DataFrame: The modified transcript with the purchased column extracted
     """
 
-    transcript_group.loc[~transcript_group.received, "purchased"] = transcript_group.non_offer_amount > 0.0
-    transcript_group.loc[transcript_group.received, "purchased"] = transcript_group.viewed & transcript_group.completed
+    transcript_group["purchased"] = np.where(
+        transcript_group.received,
+        transcript_group.viewed & transcript_group.completed,
+        transcript_group.non_offer_amount > 0.0)
 
     return transcript_group
 
@@ -419,22 +736,21 @@ def _extract_offer_spendings(transcript_group):
     return transcript_group
 
 
-def get_transcript_group(transcript, profile):
-    """Flattens the transcript dataset and extracts features
+def _group_transcript(transcript):
+    """Aggregates the transcript events per customer and offer group
 
     Args:
-        transcript (pandas.DataFrame): The transcript dataset
-        profile (pandas.DataFrame): The profile dataset
+        transcript (pandas.DataFrame): The enriched transcript
 
     Returns:
-        pandas.DataFrame: The flattened transcript dataset
+        pandas.DataFrame: The transcript groups
     """
 
-    transcript_group = transcript \
-        .sort_values(by=["person_id", "time", "event"]) \
-        .groupby(["person_id", "offer_group"]) \
+    transcript = transcript.sort_values(by=["person_id", "time", "event"])
+    groups = transcript.groupby(["person_id", "offer_group"])
+
+    transcript_group = groups \
         .agg({
-            "event": lambda x: x.tolist(), 
             "mapped_offer": "max", 
             "amount": "sum", 
             "reward": "max", 
@@ -450,21 +766,58 @@ def get_transcript_group(transcript, profile):
 
     transcript_group.offer_type = transcript_group.offer_type.astype(OfferType)
 
-    transcript_group = \
-        _extract_offer_spendings(
-            _impute_missing_values(
-                _extract_purchased(
-                    _extract_age_bins(
-                        _promote_channels_to_columns(
-                            _promote_events_to_columns(
-                                _explode_membership_date(
-                                    _add_profiles_with_notrans( \
-                                        _remove_transaction_in_event( \
-                                            _get_non_offer_amount( \
-                                                _mark_information_completed(transcript_group))), profile))))))))
+    transcript_group.insert(2, "event_state", _get_event_states(
+        transcript.event.astype(EventType).cat.codes.to_numpy(),
+        groups.ngroup().to_numpy(),
+        (transcript_group.offer_type == "informational").to_numpy()))
 
+    return transcript_group
+
+def _get_event_states(event, group, informational):
+    """Encodes the first three offer events of every group in 2 bits each
+
+    Transactions complete informational offers and are left out of the other groups.
+
+    Args:
+        event (numpy.ndarray): The EventType code of each event, in time order
+        group (numpy.ndarray): The group number of each event
+        informational (numpy.ndarray): Whether each group is of an informational offer
+
+    Returns:
+        numpy.ndarray: The event state of each group
+    """
+
+    codes = np.array([STATE_RECEIVED, STATE_VIEWED, STATE_COMPLETED, 0], dtype=np.int8)[event]
+
+    transaction = event == EventType.categories.get_loc("transaction")
+    codes[transaction & informational[group]] = STATE_COMPLETED
+
+    group = group[codes > 0]
+    codes = codes[codes > 0]
+
+    # position of every event within its group
+    order = np.argsort(group, kind="stable")
+    group = group[order]
+    codes = codes[order]
+
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(group)) + 1])
+    position = np.arange(len(group)) - np.repeat(starts, np.diff(np.append(starts, len(group))))
+
+    first = position < 3
+    values = codes[first].astype(np.int64) << (2 * position[first])
+
+    return np.bincount(group[first], weights=values, minlength=len(informational)).astype(np.int8)
+
+def _select_fields_for_group(transcript_group):
+    """Selects the fields of the flattened transcript
+
+    Args:
+        transcript_group (pandas.DataFrame): The transcript dataset
+
+    Returns:
+        pandas.DataFrame: The flattened transcript fields
+    """
 
-    
     transcript_group = transcript_group[[
         "id",
         "wave",
@@ -496,7 +849,48 @@ def get_transcript_group(transcript, profile):
         "membership_day"
     ]]
 
-    return transcript_group
+    return apply_schema(transcript_group, TranscriptGroupSchema)
+
+@profiled
+def get_transcript_group(transcript, profile, cache=None):
+    """Flattens the transcript dataset and extracts features
+
+    Args:
+        transcript (pandas.DataFrame): The transcript dataset
+        profile (pandas.DataFrame): The profile dataset
+        cache (sb_capstone.cache.StageCache): Cache of the stage results, None to run every stage
+
+    Returns:
+        pandas.DataFrame: The flattened transcript dataset
+    """
+
+    return run_stages(transcript, _get_group_stages(profile), cache)
+
+def _get_group_stages(profile, waves=None, diffs_mean=None):
+    """Gets the stages flattening the transcript
+
+    Args:
+        profile (pandas.DataFrame): The profile dataset
+        waves (numpy.ndarray): The waves every customer gets a row for, the waves of the transcript if None
+        diffs_mean (float): The mean imputed for the missing diffs, the mean of the transcript if None
+
+    Returns:
+        list: Pairs of stage function and keyword parameters
+    """
+
+    return [
+        (_group_transcript, {}),
+        (_get_non_offer_amount, {}),
+        (_add_profiles_with_notrans, {"profile": profile, "waves": waves}),
+        (_explode_membership_date, {}),
+        (_promote_events_to_columns, {}),
+        (_promote_channels_to_columns, {}),
+        (_extract_age_bins, {}),
+        (_extract_purchased, {}),
+        (_impute_missing_values, {"diffs_mean": diffs_mean}),
+        (_extract_offer_spendings, {}),
+        (_select_fields_for_group, {})
+    ]
 
 def _convert_gender(gender):
     """Helper method to transform gender
@@ -516,7 +910,7 @@ def _convert_gender(gender):
         return np.NaN
 
 def _transform_bools(transcript_group):
-    """Transform booleans to integers
+    """Transform booleans to small integers
 
     Args:
         transcript_group (pandas.DataFrame): The transcript dataset
@@ -525,14 +919,17 @@ def _transform_bools(transcript_group):
         pandas.DataFrame: The modified transcript with the booleans transformed
     """
 
-    transcript_group["received"] = transcript_group["received"].astype(int)
-    transcript_group["viewed"] = transcript_group["viewed"].astype(int)
-    transcript_group["completed"] = transcript_group["completed"].astype(int)
-    transcript_group["purchased"] = transcript_group["purchased"].astype(int)
-    transcript_group["web"] = transcript_group["web"].astype(int)
-    transcript_group["email"] = transcript_group["email"].astype(int)
-    transcript_group["mobile"] = transcript_group["mobile"].astype(int)
-    transcript_group["social"] = transcript_group["social"].astype(int)
+    # the input may be a slice of the caller's frame, don't write into it
+    transcript_group = transcript_group.copy()
+
+    transcript_group["received"] = transcript_group["received"].astype(np.int8)
+    transcript_group["viewed"] = transcript_group["viewed"].astype(np.int8)
+    transcript_group["completed"] = transcript_group["completed"].astype(np.int8)
+    transcript_group["purchased"] = transcript_group["purchased"].astype(np.int8)
+    transcript_group["web"] = transcript_group["web"].astype(np.int8)
+    transcript_group["email"] = transcript_group["email"].astype(np.int8)
+    transcript_group["mobile"] = transcript_group["mobile"].astype(np.int8)
+    transcript_group["social"] = transcript_group["social"].astype(np.int8)
 
     return transcript_group
 
@@ -650,7 +1047,7 @@ def _select_fields_for_receive(transcript_group):
 
     transcript_group = transcript_group[cols]
 
-    return transcript_group
+    return apply_schema(transcript_group, ReceiveTrainingSchema)
 
 def _filter_for_receive(transcript_group):
     """Remove the data that we are not going to use.
@@ -666,40 +1063,73 @@ def _filter_for_receive(transcript_group):
 
     return transcript_group
 
-def _impute_missing(transcript_group):
+def _impute_missing(transcript_group, fast=False):
     """Impute missing values
 
+    The imputer only sees the features, the same way the receive model imputes at scoring.
+
     Args:
         transcript_group (pandas.DataFrame): The transcript dataset
+        fast (bool): Whether to use the fast fitting imputer
 
     Returns:
         pandas.DataFrame: The modified transcript with missing imputed.
     """
 
-    imputer = IterativeImputer(initial_strategy="most_frequent")
-    transcript_group = pd.DataFrame(imputer.fit_transform(transcript_group), columns=transcript_group.columns)
+    # impute in float64 so compact columns don't change the imputed values
+    features = transcript_group.drop(columns=["purchased"]).astype(np.float64)
+    imputer = get_receive_imputer(fast)
 
-    return transcript_group
+    imputed = pd.DataFrame(imputer.fit_transform(features), columns=features.columns)
+    imputed.insert(0, "purchased", transcript_group.purchased.to_numpy())
 
-def convert_for_receive_training(transcript_group):
+    return apply_schema(imputed, ReceiveTrainingSchema)
+
+@profiled
+def convert_for_receive_training(transcript_group, cache=None, impute=False, fast=False):
     """Convert the transcript dataset for the receive model training
 
+    The missing features are left to the imputer of the receive model by default,
+    imputing them here as well would fit that imputer on imputed values.
+
     Args:
         transcript_group (pandas.DataFrame): The transcript dataset
+        cache (sb_capstone.cache.StageCache): Cache of the stage results, None to run every stage
+        impute (bool): Whether to impute the missing features, leave them to the model imputer if False
+        fast (bool): Whether to use the fast fitting imputer
 
     Returns:
         pandas.DataFrame: The modified transcript with the features for receive model training
     """
 
-    return _impute_missing(
-        _select_fields_for_receive(
-            _filter_for_receive(
-                _transform_age_group(
-                    _transform_generation(
-                        _transform_gender(
-                            _transform_offer_types(
-                                _transform_offers(
-                                    _transform_bools(transcript_group)))))))))
+    stages = _get_receive_stages(fast)
+
+    if not impute:
+        stages = stages[:-1]
+
+    return run_stages(transcript_group, stages, cache)
+
+def _get_receive_stages(fast=False):
+    """Gets the stages building the receive model training set
+
+    Args:
+        fast (bool): Whether to use the fast fitting imputer
+
+    Returns:
+        list: Pairs of stage function and keyword parameters
+    """
+
+    return [
+        (_transform_bools, {}),
+        (_transform_offers, {}),
+        (_transform_offer_types, {}),
+        (_transform_gender, {}),
+        (_transform_generation, {}),
+        (_transform_age_group, {}),
+        (_filter_for_receive, {}),
+        (_select_fields_for_receive, {}),
+        (_impute_missing, {"fast": fast})
+    ]
 
 def get_transcript_offers(transcript_group):
     """Flatten the transcript further to get only the successful offers.
@@ -782,20 +1212,33 @@ def _select_fields_for_select(transcript_group):
     """
 
     transcript_group = transcript_group.drop(columns=["id"])
-    return transcript_group
+    return apply_schema(transcript_group, SelectTrainingSchema)
 
-def convert_for_select_training(transcript_group):
+@profiled
+def convert_for_select_training(transcript_group, cache=None):
     """Convert data for the select model training
 
     Args:
         transcript_group (pandas.DataFrame): The transcript dataset
+        cache (sb_capstone.cache.StageCache): Cache of the stage results, None to run every stage
 
     Returns:
         pandas.DataFrame: The modified transcript with the features for select model training
     """
 
-    return _select_fields_for_select(
-        _dummify_recommended_offer(
-            _simplify_gender(
-                _filter_for_select(
-                    get_transcript_offers(transcript_group)))))
\ No newline at end of file
+    return run_stages(transcript_group, _get_select_stages(), cache)
+
+def _get_select_stages():
+    """Gets the stages building the select model training set
+
+    Returns:
+        list: Pairs of stage function and keyword parameters
+    """
+
+    return [
+        (get_transcript_offers, {}),
+        (_filter_for_select, {}),
+        (_simplify_gender, {}),
+        (_dummify_recommended_offer, {}),
+        (_select_fields_for_select, {})
+    ]
@@ -0,0 +1,104 @@
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DTYPES_KEY = b"sb_capstone.dtypes"
+
+def save_dataset(data, file):
+    """Saves a dataset to a parquet file, keeping its dtypes
+
+    Categorical, datetime and list columns are stored as their arrow
+    counterparts, so they come back as they were without cleaning.
+
+    Args:
+        data (pandas.DataFrame): The dataset to save
+        file (str): File to save the dataset to
+
+    Returns:
+        str: File where the dataset is saved.
+    """
+
+    table = pa.Table.from_pandas(data, preserve_index=False)
+
+    dtypes = json.dumps({c: _dump_dtype(t) for c, t in data.dtypes.items()})
+    table = table.replace_schema_metadata({**table.schema.metadata, DTYPES_KEY: dtypes.encode()})
+
+    pq.write_table(table, file)
+
+    return file
+
+def load_dataset(file, columns=None, memory_map=True):
+    """Loads a dataset saved with ``save_dataset``
+
+    Args:
+        file (str): File to load the dataset from
+        columns (list): Columns to read, all columns if None
+        memory_map (bool): Whether to memory map the file instead of reading it
+
+    Returns:
+        pandas.DataFrame: The dataset
+    """
+
+    table = pq.read_table(file, columns=columns, memory_map=memory_map)
+    data = table.to_pandas()
+
+    # arrow hands list columns back as arrays, the shaping steps expect lists
+    for field in table.schema:
+        if pa.types.is_list(field.type) or pa.types.is_large_list(field.type):
+            data[field.name] = [np.NaN if x is None else x.tolist() for x in data[field.name]]
+
+    metadata = table.schema.metadata or {}
+    dtypes = json.loads(metadata.get(DTYPES_KEY, b"{}"))
+
+    for col in data.columns:
+        if col in dtypes:
+            dtype = _load_dtype(dtypes[col])
+
+            if data[col].dtype != dtype:
+                data[col] = data[col].astype(dtype)
+
+    return data
+
+def get_dataset_columns(file):
+    """Gets the columns of a dataset without reading it
+
+    Args:
+        file (str): The dataset file
+
+    Returns:
+        list: The column names
+    """
+
+    return pq.read_schema(file).names
+
+def _dump_dtype(dtype):
+    """Describes a column dtype in plain JSON types
+
+    Args:
+        dtype (numpy.dtype): The column dtype
+
+    Returns:
+        dict: The dtype description
+    """
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        return {"categories": dtype.categories.tolist(), "ordered": bool(dtype.ordered)}
+
+    return {"dtype": str(dtype)}
+
+def _load_dtype(description):
+    """Restores a column dtype described by ``_dump_dtype``
+
+    Args:
+        description (dict): The dtype description
+
+    Returns:
+        numpy.dtype: The column dtype
+    """
+
+    if "categories" in description:
+        return pd.CategoricalDtype(categories=description["categories"], ordered=description["ordered"])
+
+    return pd.api.types.pandas_dtype(description["dtype"])
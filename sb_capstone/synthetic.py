@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+
+from sb_capstone.wrangling import (
+    clean_portfolio,
+    clean_profile,
+    EventType,
+    OfferIDType
+)
+
+# the offers of the Starbucks experiment
+PORTFOLIO = [
+    [1, "bogo", ["email", "mobile", "social"], 10, 10, 7],
+    [2, "bogo", ["web", "email", "mobile", "social"], 10, 10, 5],
+    [3, "informational", ["web", "email", "mobile"], 0, 0, 4],
+    [4, "bogo", ["web", "email", "mobile"], 5, 5, 7],
+    [5, "discount", ["web", "email"], 5, 20, 10],
+    [6, "discount", ["web", "email", "mobile", "social"], 3, 7, 7],
+    [7, "discount", ["web", "email", "mobile", "social"], 2, 10, 10],
+    [8, "informational", ["email", "mobile", "social"], 0, 0, 3],
+    [9, "bogo", ["web", "email", "mobile", "social"], 5, 5, 5],
+    [10, "discount", ["web", "email", "mobile"], 2, 10, 7]
+]
+
+WAVES = np.array([0, 168, 336, 408, 504, 576])
+END_TIME = 714
+BASE_CUSTOMERS = 17000
+
+def generate_portfolio():
+    """Generates the portfolio of the experiment offers
+
+    Returns:
+        pandas.DataFrame: The cleaned portfolio
+    """
+
+    portfolio = pd.DataFrame(PORTFOLIO, columns=["id", "offer_type", "channels", "reward", "difficulty", "duration"])
+    portfolio.duration = portfolio.duration.astype(float)
+    portfolio.channels = portfolio.channels.astype(str)
+
+    return clean_portfolio(portfolio)
+
+def generate_profile(n_customers, seed=0):
+    """Generates customer profiles with the distributions of the experiment
+
+    Args:
+        n_customers (int): Number of customers
+        seed (int): Random seed
+
+    Returns:
+        pandas.DataFrame: The cleaned profile
+    """
+
+    rng = np.random.default_rng(seed)
+
+    gender = rng.choice(np.array(["F", "M", "O", None], dtype=object), size=n_customers, p=[0.36, 0.5, 0.012, 0.128])
+    anonymous = pd.isna(gender)
+
+    age = np.clip(rng.normal(54, 17, size=n_customers).round(), 18, 101)
+    income = np.clip((rng.normal(65000, 21000, size=n_customers) / 1000).round() * 1000, 30000, 120000)
+
+    age[anonymous] = np.NaN
+    income[anonymous] = np.NaN
+
+    # recent members are more common
+    start = np.datetime64("2013-07-29")
+    days = (np.datetime64("2018-07-26") - start).astype(int)
+    member = days - np.minimum(rng.exponential(days / 2.5, size=n_customers), days).astype(int)
+
+    profile = pd.DataFrame({
+        "id": np.arange(1, n_customers + 1),
+        "gender": gender,
+        "age": age,
+        "income": income,
+        "became_member_on": start + member.astype("timedelta64[D]")
+    })
+
+    return clean_profile(profile)
+
+def generate_transcript(profile, portfolio, seed=0):
+    """Generates the events of an offer experiment over the given customers
+
+    Every customer gets offers in some of the six waves, views some of them,
+    makes transactions, and completes the offers whose difficulty their
+    spending reaches before the offer expires.
+
+    Args:
+        profile (pandas.DataFrame): The customer profiles
+        portfolio (pandas.DataFrame): The offers
+        seed (int): Random seed
+
+    Returns:
+        pandas.DataFrame: The cleaned transcript, ordered by time
+    """
+
+    rng = np.random.default_rng(seed)
+
+    person = profile.id.to_numpy()
+    n = len(person)
+
+    difficulty = np.zeros(len(portfolio) + 1)
+    duration = np.zeros(len(portfolio) + 1)
+    reward = np.zeros(len(portfolio) + 1)
+    informational = np.zeros(len(portfolio) + 1, dtype=bool)
+    channels = np.zeros(len(portfolio) + 1)
+
+    difficulty[portfolio.id] = portfolio.difficulty
+    duration[portfolio.id] = portfolio.duration
+    reward[portfolio.id] = portfolio.reward
+    informational[portfolio.id] = portfolio.offer_type == "informational"
+    channels[portfolio.id] = portfolio.channels.apply(len)
+
+    # offers received, about 75% of the customers per wave
+    received = rng.random((n, len(WAVES))) < 0.75
+    receive_person = np.broadcast_to(person[:, None], received.shape)[received]
+    receive_time = np.broadcast_to(WAVES[None, :], received.shape)[received]
+    receive_offer = rng.integers(1, len(portfolio) + 1, size=len(receive_person))
+    expires = receive_time + duration[receive_offer] * 24
+
+    # more channels, more views
+    viewed = rng.random(len(receive_person)) < 0.35 + 0.12 * channels[receive_offer]
+    view_time = receive_time + rng.exponential(30, size=len(receive_person)).astype(int)
+    view_time = np.minimum(view_time, np.minimum(expires, END_TIME).astype(int))
+
+    # transactions, customers differ in how often and how much they spend
+    activity = rng.gamma(2.0, 4.0, size=n)
+    spending = np.where(np.isnan(profile.income.to_numpy()), 50000, profile.income.to_numpy()) / 5000
+    counts = rng.poisson(activity)
+
+    transaction_person = np.repeat(person, counts)
+    transaction_time = rng.integers(0, END_TIME + 1, size=len(transaction_person))
+    transaction_amount = np.round(rng.lognormal(0, 0.8, size=len(transaction_person)) * np.repeat(spending, counts), 2)
+
+    order = np.lexsort((transaction_time, transaction_person))
+    transaction_person = transaction_person[order]
+    transaction_time = transaction_time[order]
+    transaction_amount = transaction_amount[order]
+
+    # an offer is completed on the transaction that reaches its difficulty before it expires
+    key = transaction_person * (END_TIME + 1) + transaction_time
+    spent = np.concatenate([[0.0], np.cumsum(transaction_amount)])
+    first = np.searchsorted(key, receive_person * (END_TIME + 1) + receive_time, side="left")
+    last = np.searchsorted(key, receive_person * (END_TIME + 1) + expires, side="right")
+    reach = np.searchsorted(spent, spent[first] + difficulty[receive_offer], side="left")
+
+    completed = ~informational[receive_offer] & (reach <= last) & (reach > first)
+    complete_time = transaction_time[np.minimum(reach, len(transaction_time)) - 1][completed]
+
+    events = [
+        (receive_person, "offer_received", receive_time, receive_offer, np.NaN, np.NaN),
+        (receive_person[viewed], "offer_viewed", view_time[viewed], receive_offer[viewed], np.NaN, np.NaN),
+        (transaction_person, "transaction", transaction_time, 0, transaction_amount, np.NaN),
+        (receive_person[completed], "offer_completed", complete_time, receive_offer[completed], np.NaN, reward[receive_offer[completed]])
+    ]
+
+    transcript = pd.concat([
+        pd.DataFrame({
+            "person_id": p,
+            "event": pd.Categorical.from_codes(np.full(len(p), EventType.categories.get_loc(e)), dtype=EventType),
+            "time": np.asarray(t, dtype=np.int64),
+            "offer_id": pd.Categorical.from_codes(np.broadcast_to(o, len(p)).astype(np.int8), dtype=OfferIDType),
+            "amount": np.broadcast_to(a, len(p)).astype(float),
+            "reward": np.broadcast_to(r, len(p)).astype(float)
+        }) for p, e, t, o, a, r in events], ignore_index=True)
+
+    return transcript.sort_values("time", kind="stable").reset_index(drop=True)
+
+def generate_dataset(scale=1, seed=0):
+    """Generates a portfolio, profile and transcript the size of the experiment times ``scale``
+
+    Args:
+        scale (float): Size relative to the 17,000 customers of the experiment
+        seed (int): Random seed
+
+    Returns:
+        pandas.DataFrame: The portfolio
+        pandas.DataFrame: The profile
+        pandas.DataFrame: The transcript
+    """
+
+    portfolio = generate_portfolio()
+    profile = generate_profile(int(BASE_CUSTOMERS * scale), seed)
+    transcript = generate_transcript(profile, portfolio, seed)
+
+    return portfolio, profile, transcript
@@ -0,0 +1,304 @@
+import hashlib
+import math
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import KFold, StratifiedKFold, ParameterGrid
+
+# the offer columns the select model predicts
+SELECT_TARGETS = np.arange(1, 11).astype(str).tolist()
+
+def get_training_arrays(data, targets):
+    """Splits a training set into feature and target arrays
+
+    The features are converted once to float32, the type the trees fit on, so
+    the folds don't convert them again on every fit.
+
+    Args:
+        data (pandas.DataFrame): The training set
+        targets (str): The target column, or a list of target columns
+
+    Returns:
+        numpy.ndarray: The features
+        numpy.ndarray: The targets
+    """
+
+    y = data[targets].to_numpy()
+    X = data.drop(columns=targets).to_numpy(dtype=np.float32)
+
+    return X, y
+
+def make_folds(y, n_splits=5, seed=0):
+    """Materializes the train and test rows of every fold once
+
+    Single targets are stratified. The train rows of each fold are shuffled, so
+    their first ``n`` rows are a random sample to fit on with less data.
+
+    Args:
+        y (numpy.ndarray): The targets
+        n_splits (int): Number of folds
+        seed (int): Random seed of the folds and of the train rows order
+
+    Returns:
+        list: Pairs of train and test row indexes of each fold
+    """
+
+    rng = np.random.default_rng(seed)
+
+    if np.ndim(y) == 1:
+        splitter = StratifiedKFold(n_splits, shuffle=True, random_state=seed)
+    else:
+        splitter = KFold(n_splits, shuffle=True, random_state=seed)
+
+    folds = []
+
+    for train, test in splitter.split(np.zeros((len(y), 1)), y if np.ndim(y) == 1 else None):
+        folds.append((rng.permutation(train).astype(np.int32), test.astype(np.int32)))
+
+    return folds
+
+def cross_validate(estimator, X, y, folds, scoring="f1_weighted", n_jobs=-1, cache=None):
+    """Scores an estimator on every fold, fitting the folds in parallel
+
+    Args:
+        estimator (sklearn.base.BaseEstimator): The estimator, not fitted
+        X (numpy.ndarray): The features
+        y (numpy.ndarray): The targets
+        folds (list): The folds from ``make_folds``
+        scoring (str): The sklearn scorer name
+        n_jobs (int): Number of worker processes, -1 for every core
+        cache (StageCache): Cache of the scores, evaluates every fold if None
+
+    Returns:
+        numpy.ndarray: The score of each fold
+    """
+
+    n_train = max(len(train) for train, _ in folds)
+
+    with tempfile.TemporaryDirectory() as directory:
+        if n_jobs != 1:
+            X, y, folds = _share_arrays(directory, X, y, folds)
+
+        scores, _ = _evaluate(estimator, [{}], X, y, folds, n_train, scoring, n_jobs, cache)
+
+    return scores[0]
+
+def successive_halving(estimator, param_grid, X, y, folds, scoring="f1_weighted", factor=3,
+        min_resources=None, n_jobs=-1, cache=None):
+    """Searches the parameters by successive halving
+
+    Every candidate is first fitted on a sample of the train rows of each fold.
+    The best ``1 / factor`` of them are kept and fitted on ``factor`` times more
+    rows, until one is left or the whole train rows are used. Every round is
+    scored on the whole test rows, on the same folds.
+
+    With a cache, the score of a candidate on a number of rows is stored, and a
+    repeated search only fits the candidates it hasn't scored yet.
+
+    Args:
+        estimator (sklearn.base.BaseEstimator): The estimator, not fitted
+        param_grid (dict): The parameter values to search, like ``GridSearchCV``
+        X (numpy.ndarray): The features
+        y (numpy.ndarray): The targets
+        folds (list): The folds from ``make_folds``
+        scoring (str): The sklearn scorer name
+        factor (int): How many times fewer candidates and more rows each round
+        min_resources (int): Train rows of the first round, enough for the last round to use every row if None,
+            and at least the number of folds and of classes
+        n_jobs (int): Number of worker processes, -1 for every core
+        cache (StageCache): Cache of the scores, evaluates every candidate if None
+
+    Returns:
+        dict: The best parameters
+        pandas.DataFrame: The score of each candidate in each round
+    """
+
+    candidates = list(ParameterGrid(param_grid))
+    max_resources = max(len(train) for train, _ in folds)
+
+    n_rounds = 1 + math.ceil(math.log(len(candidates), factor)) if len(candidates) > 1 else 1
+
+    if min_resources is None:
+        min_resources = max_resources // factor ** (n_rounds - 1)
+
+        # many candidates on few rows would leave the first round without rows,
+        # fit on at least as many rows as folds and classes
+        min_resources = min(max(min_resources, len(folds), len(np.unique(y))), max_resources)
+
+    results = []
+    n_train = min_resources
+
+    with tempfile.TemporaryDirectory() as directory:
+        # workers map the same files instead of getting their own copy every round
+        if n_jobs != 1:
+            X, y, folds = _share_arrays(directory, X, y, folds)
+
+        for i in range(n_rounds):
+            n_train = min(n_train, max_resources)
+
+            scores, cached = _evaluate(estimator, candidates, X, y, folds, n_train, scoring, n_jobs, cache)
+
+            round_results = pd.DataFrame({
+                "round": i,
+                "n_train": n_train,
+                "params": candidates,
+                "mean_score": scores.mean(axis=1),
+                "std_score": scores.std(axis=1),
+                "cached": cached
+            })
+
+            results.append(round_results)
+
+            if len(candidates) == 1 or n_train == max_resources:
+                break
+
+            keep = max(1, math.ceil(len(candidates) / factor))
+            best = np.argsort(-round_results.mean_score.to_numpy(), kind="stable")[:keep]
+            candidates = [candidates[b] for b in best]
+            n_train *= factor
+
+    results = pd.concat(results, ignore_index=True)
+    last = results[results["round"] == results["round"].max()]
+
+    return last.params[last.mean_score.idxmax()], results
+
+def _evaluate(estimator, candidates, X, y, folds, n_train, scoring, n_jobs, cache):
+    """Scores the candidates on every fold, reusing the cached scores
+
+    Args:
+        estimator (sklearn.base.BaseEstimator): The estimator, not fitted
+        candidates (list): The parameters of each candidate
+        X (numpy.ndarray): The features
+        y (numpy.ndarray): The targets
+        folds (list): The folds from ``make_folds``
+        n_train (int): Number of train rows to fit on
+        scoring (str): The sklearn scorer name
+        n_jobs (int): Number of worker processes
+        cache (StageCache): Cache of the scores, or None
+
+    Returns:
+        numpy.ndarray: The candidate by fold scores
+        numpy.ndarray: Whether the scores of each candidate were cached
+    """
+
+    scores = np.full((len(candidates), len(folds)), np.NaN)
+    cached = np.zeros(len(candidates), dtype=bool)
+    keys = [None] * len(candidates)
+
+    if cache is not None:
+        data_key = _hash_arrays(X, y, folds)
+
+        for i, params in enumerate(candidates):
+            keys[i] = _get_score_key(data_key, estimator, params, scoring, n_train)
+
+            if cache.contains(keys[i]):
+                scores[i] = cache.get(keys[i])
+                cached[i] = True
+
+    tasks = [(i, f) for i in np.flatnonzero(~cached) for f in range(len(folds))]
+
+    fold_scores = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_and_score)(estimator, candidates[i], X, y, folds[f][0][:n_train], folds[f][1], scoring)
+        for i, f in tasks)
+
+    for (i, f), score in zip(tasks, fold_scores):
+        scores[i, f] = score
+
+    if cache is not None:
+        for i in np.flatnonzero(~cached):
+            cache.put(keys[i], scores[i])
+
+    return scores, cached
+
+def _fit_and_score(estimator, params, X, y, train, test, scoring):
+    """Fits a candidate on the train rows and scores it on the test rows
+
+    Args:
+        estimator (sklearn.base.BaseEstimator): The estimator, not fitted
+        params (dict): The candidate parameters
+        X (numpy.ndarray): The features
+        y (numpy.ndarray): The targets
+        train (numpy.ndarray): The train rows
+        test (numpy.ndarray): The test rows
+        scoring (str): The sklearn scorer name
+
+    Returns:
+        float: The score
+    """
+
+    estimator = clone(estimator).set_params(**params)
+    estimator.fit(X[train], y[train])
+
+    return get_scorer(scoring)(estimator, X[test], y[test])
+
+def _share_arrays(directory, X, y, folds):
+    """Saves the arrays to files and maps them back, to share them with the workers
+
+    Args:
+        directory (str): Directory of the files
+        X (numpy.ndarray): The features
+        y (numpy.ndarray): The targets
+        folds (list): The folds from ``make_folds``
+
+    Returns:
+        numpy.memmap: The features
+        numpy.memmap: The targets
+        list: The folds, as mapped arrays
+    """
+
+    def share(name, array):
+        file = os.path.join(directory, f"{name}.npy")
+        np.save(file, np.ascontiguousarray(array))
+        return np.load(file, mmap_mode="r")
+
+    folds = [(share(f"train-{i}", train), share(f"test-{i}", test)) for i, (train, test) in enumerate(folds)]
+
+    return share("X", X), share("y", y), folds
+
+def _hash_arrays(X, y, folds):
+    """Hashes the features, targets and folds
+
+    Args:
+        X (numpy.ndarray): The features
+        y (numpy.ndarray): The targets
+        folds (list): The folds from ``make_folds``
+
+    Returns:
+        str: The hex digest
+    """
+
+    digest = hashlib.sha256()
+
+    for array in [X, y] + [a for fold in folds for a in fold]:
+        array = np.ascontiguousarray(array)
+        digest.update(repr((array.dtype.str, array.shape)).encode())
+        digest.update(array.tobytes())
+
+    return digest.hexdigest()
+
+def _get_score_key(data_key, estimator, params, scoring, n_train):
+    """Gets the cache key of the fold scores of a candidate
+
+    Args:
+        data_key (str): The hash of the features, targets and folds
+        estimator (sklearn.base.BaseEstimator): The estimator, not fitted
+        params (dict): The candidate parameters
+        scoring (str): The sklearn scorer name
+        n_train (int): Number of train rows to fit on
+
+    Returns:
+        str: The hex digest
+    """
+
+    # every nested parameter is listed, the estimator repr alone may be shortened
+    params = clone(estimator).set_params(**params).get_params(deep=True)
+    params = sorted((name, repr(value)) for name, value in params.items())
+
+    key = repr((data_key, type(estimator).__name__, params, scoring, n_train))
+
+    return hashlib.sha256(key.encode()).hexdigest()
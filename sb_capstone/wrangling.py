@@ -19,6 +19,30 @@ def clean_portfolio(portfolio):
 
     return portfolio
 
+def get_channel_mask(portfolio):
+    """Gets the channels each offer is sent through, raising a ValueError on unknown channels
+
+    Args:
+        portfolio (pandas.DataFrame): DataFrame with the offer id and channels
+
+    Returns:
+        numpy.ndarray: Boolean matrix of offer id by ChannelType category, row 0 is no offer
+    """
+
+    mask = np.zeros((len(OfferIDType.categories), len(ChannelType.categories)), dtype=bool)
+
+    for id, channels in zip(portfolio.id, portfolio.channels):
+        indexes = ChannelType.categories.get_indexer(channels)
+
+        # an unknown channel is -1, which would set the last channel instead
+        if (indexes < 0).any():
+            unknown = [c for c, i in zip(channels, indexes) if i < 0]
+            raise ValueError(f"Unknown channels {unknown} for offer {id}.")
+
+        mask[int(id), indexes] = True
+
+    return mask
+
 GenderType = pd.CategoricalDtype(categories=['F', 'M', 'O', 'U'])
 
 def clean_profile(profile):
@@ -77,6 +101,97 @@ def clean_transcript_group(transcript_group):
 
     return transcript_group
 
+# compact dtypes of the shaped datasets, the values are booleans, small counts and
+# amounts far within float32 precision
+TranscriptGroupSchema = {
+    "id": np.int32,
+    "wave": np.int8,
+    "diffs": np.float32,
+    "received": bool,
+    "viewed": bool,
+    "completed": bool,
+    "purchased": bool,
+    "amount": np.float32,
+    "reward": np.float32,
+    "non_offer_amount": np.float32,
+    "mapped_offer": OfferIDType,
+    "spendings": np.float32,
+    "recommended_offer": np.int8,
+    "offer_type": OfferType,
+    "difficulty": np.float32,
+    "duration": np.float32,
+    "web": bool,
+    "email": bool,
+    "mobile": bool,
+    "social": bool,
+    "gender": GenderType,
+    "age": np.float32,
+    "generation": GenerationType,
+    "group": AgeGroupType,
+    "income": np.float32,
+    "membership_year": np.int16,
+    "membership_month": np.int8,
+    "membership_day": np.int8
+}
+
+ReceiveTrainingSchema = {
+    col: np.float32 for col in [
+        "purchased",
+        "gender",
+        "age",
+        "income",
+        "membership_year",
+        "membership_month",
+        "membership_day",
+        "gen_z",
+        "millenials",
+        "gen_x",
+        "boomers",
+        "silent",
+        "young",
+        "adult",
+        "middle_age",
+        "old"
+    ]
+}
+
+SelectTrainingSchema = {
+    "gender": np.int8,
+    "age": np.float32,
+    "income": np.float32,
+    "membership_year": np.int16,
+    "membership_month": np.int8,
+    "membership_day": np.int8,
+    **{str(i): np.uint8 for i in range(1, 11)}
+}
+
+def apply_schema(data, schema):
+    """Casts the columns of a DataFrame to the dtypes of a schema
+
+    Columns missing from the schema are left as they are. Integer columns with
+    missing values, like the membership year of a customer without a membership
+    date, are cast to float32 instead, keeping the missing values.
+
+    Args:
+        data (pandas.DataFrame): DataFrame to cast
+        schema (dict): The dtype of each column
+
+    Returns:
+        data (pandas.DataFrame): DataFrame with the schema dtypes
+    """
+
+    dtypes = {c: t for c, t in schema.items() if c in data.columns and data[c].dtype != t}
+    dtypes = {
+        c: np.float32 if pd.api.types.is_integer_dtype(t) and data[c].isna().any() else t
+        for c, t in dtypes.items()
+    }
+    dtypes = {c: t for c, t in dtypes.items() if data[c].dtype != t}
+
+    if len(dtypes) == 0:
+        return data
+
+    return data.astype(dtypes)
+
 def tukey_rule(data, col):
     """Applies Tukey rule to a column of a DataFrame
 
@@ -88,8 +203,11 @@ def tukey_rule(data, col):
         data (pandas.DataFrame): DataFrame containing the cleaned data
     """
 
-    Q1 = data[col].quantile(0.25)
-    Q3 = data[col].quantile(0.75)
+    # bounds in float64, whatever the column precision
+    values = data[col].astype(np.float64)
+
+    Q1 = values.quantile(0.25)
+    Q3 = values.quantile(0.75)
     
     IQR = Q3 - Q1
     
@@ -0,0 +1,46 @@
+import joblib
+import pytest
+
+from sb_capstone.synthetic import generate_dataset
+from sb_capstone.experiment import train_receive_offer, train_select_offer
+from sb_capstone.shaping import (
+    merge_portfolio,
+    get_transcript_combined,
+    get_transcript_group,
+    convert_for_receive_training,
+    convert_for_select_training
+)
+
+@pytest.fixture(scope="session")
+def dataset():
+    """Small synthetic portfolio, profile and transcript, copy them before changing them"""
+
+    return generate_dataset(0.01, seed=0)
+
+@pytest.fixture(scope="session")
+def transcript_group(dataset):
+    """The transcript group of the small dataset, copy it before changing it"""
+
+    portfolio, profile, transcript = dataset
+    transcript = get_transcript_combined(merge_portfolio(transcript.copy(), portfolio))
+
+    return get_transcript_group(transcript, profile.copy())
+
+@pytest.fixture(scope="session")
+def models(transcript_group, tmp_path_factory):
+    """Receive and select models trained on the small dataset"""
+
+    directory = tmp_path_factory.mktemp("models")
+
+    receive, _ = train_receive_offer(
+        convert_for_receive_training(transcript_group.copy()), str(directory / "receive_offer.pkl"), fast=True)
+    select, _ = train_select_offer(
+        convert_for_select_training(transcript_group.copy()), str(directory / "select_offer.pkl"))
+    select_native, _ = train_select_offer(
+        convert_for_select_training(transcript_group.copy()), str(directory / "select_offer-native.pkl"), native=True)
+
+    return {
+        "receive_offer": joblib.load(receive),
+        "select_offer": joblib.load(select),
+        "select_offer_native": joblib.load(select_native)
+    }
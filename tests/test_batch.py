@@ -0,0 +1,134 @@
+import json
+import os
+import joblib
+import pandas as pd
+import pytest
+
+from sb_capstone import batch
+from sb_capstone.batch import run_batch_job, read_batch_results, MANIFEST
+from sb_capstone.experiment import receive_offer, select_offer
+from sb_capstone.wrangling import clean_profile
+
+CHUNK_SIZE = 40
+
+@pytest.fixture(scope="module")
+def batch_files(models, dataset, tmp_path_factory):
+    directory = tmp_path_factory.mktemp("batch")
+
+    # shuffled, so the profile order differs from the id order
+    profile_file = str(directory / "profile.csv")
+    dataset[1].sample(frac=1, random_state=0).to_csv(profile_file, index=False)
+
+    receive_file = str(directory / "receive_offer.pkl")
+    select_file = str(directory / "select_offer.pkl")
+    joblib.dump(models["receive_offer"], receive_file)
+    joblib.dump(models["select_offer"], select_file)
+
+    return profile_file, receive_file, select_file
+
+def run_job(batch_files, directory, **kwargs):
+    profile_file, receive_file, select_file = batch_files
+
+    return run_batch_job(profile_file, str(directory), chunk_size=CHUNK_SIZE, receive_model=receive_file,
+        select_model=select_file, default_value=False, default_offers=[6, 7], **kwargs)
+
+@pytest.fixture(scope="module")
+def full_results(batch_files, tmp_path_factory):
+    directory = tmp_path_factory.mktemp("full")
+    run_job(batch_files, directory)
+
+    return read_batch_results(str(directory))
+
+def count_chunks(monkeypatch, fail_at=None):
+    """Counts the chunks scored, failing the chunk ``fail_at`` if given"""
+
+    scored = []
+
+    def select(profile, *args, **kwargs):
+        if len(scored) == fail_at:
+            raise RuntimeError("Scoring failed.")
+
+        scored.append(len(profile))
+
+        return select_offer(profile, *args, **kwargs)
+
+    monkeypatch.setattr(batch, "select_offer", select)
+
+    return scored
+
+def test_batch_results_match_the_scoring(models, batch_files, full_results):
+    profile = clean_profile(pd.read_csv(batch_files[0]))
+
+    received = receive_offer(profile.copy(), models["receive_offer"], default_value=False)
+    selected = select_offer(profile.copy(), models["select_offer"], default_offers=[6, 7], output="bitmask")
+    selected = pd.Series(selected.to_lists(), index=selected.id)
+
+    assert full_results.id.tolist() == profile.id.tolist()
+    assert full_results.receive_offer.tolist() == received.set_index("id").receive_offer[profile.id].tolist()
+
+    # customers select_offer leaves out have no offers
+    left_out = ~full_results.id.isin(selected.index)
+
+    assert full_results.recommended_offers[left_out].isna().all()
+    assert full_results.recommended_offers[~left_out].tolist() == selected[full_results.id[~left_out]].tolist()
+
+def test_batch_job_resumes_after_a_failure(batch_files, full_results, tmp_path, monkeypatch):
+    n_chunks = -(-len(full_results) // CHUNK_SIZE)
+
+    count_chunks(monkeypatch, fail_at=2)
+
+    with pytest.raises(RuntimeError):
+        run_job(batch_files, tmp_path)
+
+    with open(tmp_path / MANIFEST) as f:
+        manifest = json.load(f)
+
+    assert sorted(manifest["chunks"]) == ["0", "1"]
+    assert not manifest["complete"]
+
+    # only the chunks left are scored again
+    scored = count_chunks(monkeypatch)
+    manifest = run_job(batch_files, tmp_path)
+
+    assert len(scored) == n_chunks - 2
+    assert manifest["complete"]
+    assert manifest["rows"] == len(full_results)
+    pd.testing.assert_frame_equal(read_batch_results(str(tmp_path)), full_results)
+
+def test_batch_job_adopts_the_chunks_of_its_manifest(batch_files, full_results, tmp_path, monkeypatch):
+    run_job(batch_files, tmp_path)
+
+    with open(tmp_path / MANIFEST) as f:
+        manifest = json.load(f)
+
+    # a chunk written after the last manifest update, and a chunk whose file is lost
+    del manifest["chunks"]["1"]
+    manifest["complete"] = False
+    os.remove(tmp_path / manifest["chunks"]["2"]["file"])
+
+    with open(tmp_path / MANIFEST, "w") as f:
+        json.dump(manifest, f)
+
+    scored = count_chunks(monkeypatch)
+    manifest = run_job(batch_files, tmp_path)
+
+    assert scored == [CHUNK_SIZE]
+    assert manifest["chunks"]["1"]["rows"] == CHUNK_SIZE
+    assert manifest["rows"] == len(full_results)
+    pd.testing.assert_frame_equal(read_batch_results(str(tmp_path)), full_results)
+
+def test_batch_job_refuses_another_input(batch_files, tmp_path):
+    run_job(batch_files, tmp_path)
+
+    other = str(tmp_path / "other.csv")
+    pd.read_csv(batch_files[0]).iloc[:10].to_csv(other, index=False)
+
+    with pytest.raises(ValueError):
+        run_job((other,) + batch_files[1:], tmp_path)
+
+    with pytest.raises(ValueError):
+        run_batch_job(batch_files[0], str(tmp_path), chunk_size=CHUNK_SIZE * 2)
+
+def test_batch_results_without_a_job(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        read_batch_results(str(tmp_path))
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+from sb_capstone import shaping
+from sb_capstone.cache import StageCache, PredictionCache, hash_stage, run_stages
+from sb_capstone.experiment import receive_offer, select_offer
+
+BINS = [0, 10, 20]
+
+def cut_stage(data):
+    return data.assign(bin=pd.cut(data.value, BINS, labels=False))
+
+def lambda_stage(data):
+    return data.assign(bin=data.value.map(lambda x: np.digitize(x, BINS)))
+
+def test_hash_stage_is_stable():
+    assert hash_stage(shaping.get_transcript_combined, {"n_jobs": 2}) == \
+        hash_stage(shaping.get_transcript_combined, {"n_jobs": 2})
+    assert hash_stage(shaping.get_transcript_combined, {"n_jobs": 2}) != \
+        hash_stage(shaping.get_transcript_combined, {"n_jobs": 4})
+
+def test_hash_stage_changes_with_module_constants(monkeypatch):
+    schema = hash_stage(shaping._select_fields_for_group, {})
+    cut = hash_stage(cut_stage, {})
+    nested = hash_stage(lambda_stage, {})
+
+    monkeypatch.setattr(shaping, "TranscriptGroupSchema", {**shaping.TranscriptGroupSchema, "id": np.int64})
+    monkeypatch.setattr(f"{__name__}.BINS", [0, 10, 30])
+
+    assert hash_stage(shaping._select_fields_for_group, {}) != schema
+    assert hash_stage(cut_stage, {}) != cut
+    assert hash_stage(lambda_stage, {}) != nested
+
+def test_run_stages_recomputes_after_a_constant_change(tmp_path, monkeypatch):
+    cache = StageCache(str(tmp_path))
+    data = pd.DataFrame({"value": [1, 12, 18]})
+
+    first = run_stages(data, [(cut_stage, {})], cache)
+    run_stages(data, [(cut_stage, {})], cache)
+
+    monkeypatch.setattr(f"{__name__}.BINS", [0, 15, 20])
+    second = run_stages(data, [(cut_stage, {})], cache)
+
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert first.bin.tolist() == [0, 1, 1]
+    assert second.bin.tolist() == [0, 0, 1]
+
+class CountingModel():
+    """Doubles the first feature, counting the rows it predicts"""
+
+    def __init__(self):
+        self.rows = 0
+
+    def predict(self, X):
+        self.rows += len(X)
+        return np.asarray(X)[:, 0] * 2
+
+def test_prediction_cache_hits_and_misses():
+    cache = PredictionCache(max_size=10)
+    model = CountingModel()
+    X = pd.DataFrame({"a": [1.0, 2.0, 1.0, np.NaN, np.NaN], "b": [0.0, 0.0, 0.0, 1.0, 1.0]})
+
+    np.testing.assert_array_equal(cache.predict("v1", model.predict, X), model.predict(X))
+    model.rows = 0
+
+    # rows with the same features, missing values included, are predicted once
+    assert (cache.hits, cache.misses, len(cache)) == (0, 3, 3)
+
+    cache.predict("v1", model.predict, X)
+
+    assert (cache.hits, cache.misses, model.rows) == (5, 3, 0)
+
+def test_prediction_cache_evicts_the_least_recently_used():
+    cache = PredictionCache(max_size=2)
+    model = CountingModel()
+
+    cache.predict("v1", model.predict, np.array([[1.0], [2.0]]))
+    cache.predict("v1", model.predict, np.array([[1.0]]))
+    cache.predict("v1", model.predict, np.array([[3.0]]))
+    model.rows = 0
+    cache.predict("v1", model.predict, np.array([[1.0], [2.0]]))
+
+    assert cache.evictions == 2
+    assert model.rows == 1
+    assert len(cache) == 2
+
+def test_prediction_cache_invalidates_on_new_versions():
+    cache = PredictionCache()
+    X = np.array([[1.0], [2.0]])
+
+    cache.predict("v1", lambda X: X[:, 0], X)
+    predictions = cache.predict("v2", lambda X: X[:, 0] * 10, X)
+
+    np.testing.assert_array_equal(predictions, [10.0, 20.0])
+    assert (cache.invalidations, cache.hits, cache.misses) == (1, 0, 4)
+
+def test_cached_scoring_matches(models, dataset):
+    profile = dataset[1]
+    receive_cache = PredictionCache()
+    select_cache = PredictionCache()
+
+    for _ in range(2):
+        pd.testing.assert_frame_equal(
+            receive_offer(profile.copy(), models["receive_offer"], cache=receive_cache),
+            receive_offer(profile.copy(), models["receive_offer"]))
+        pd.testing.assert_frame_equal(
+            select_offer(profile.copy(), models["select_offer"], cache=select_cache),
+            select_offer(profile.copy(), models["select_offer"]))
+
+    assert receive_cache.hits > 0
+    assert select_cache.hits > 0
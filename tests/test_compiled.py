@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from sb_capstone.compiled import compile_model
+from sb_capstone.experiment import SELECT_COLUMNS, _convert_for_receive, _convert_for_select
+
+@pytest.fixture(scope="module")
+def receive_features(dataset):
+    _, features, _ = _convert_for_receive(dataset[1].copy())
+
+    # customers with missing features go through the imputer
+    features.loc[features.index[::7], "income"] = np.NaN
+
+    return features
+
+@pytest.fixture(scope="module")
+def select_features(dataset):
+    profile, _ = _convert_for_select(dataset[1].copy())
+
+    return profile[SELECT_COLUMNS]
+
+# the imputer is given the feature names it was fitted with
+@pytest.mark.filterwarnings("error:X does not have valid feature names")
+def test_compiled_receive_matches(models, receive_features):
+    model = models["receive_offer"]
+    compiled = compile_model(model)
+
+    assert receive_features.isna().any(axis=1).sum() > 0
+    np.testing.assert_array_equal(compiled.predict(receive_features), model.predict(receive_features))
+
+    for i in range(len(receive_features)):
+        row = receive_features.iloc[[i]]
+        assert compiled.predict_one(row.to_numpy()[0]) == model.predict(row)[0]
+
+@pytest.mark.parametrize("name", ["select_offer", "select_offer_native"])
+def test_compiled_select_matches(models, select_features, name):
+    model = models[name]
+    compiled = compile_model(model)
+
+    np.testing.assert_array_equal(compiled.predict(select_features), model.predict(select_features))
+
+    for i in range(len(select_features)):
+        row = select_features.iloc[[i]]
+        np.testing.assert_array_equal(compiled.predict_one(row.to_numpy()[0]), model.predict(row)[0])
+
+def test_compiled_checks_the_features(models, select_features):
+    compiled = compile_model(models["select_offer"])
+
+    with pytest.raises(ValueError):
+        compiled.predict(select_features.iloc[:, :3])
@@ -0,0 +1,64 @@
+import asyncio
+import pandas as pd
+import pytest
+
+from sb_capstone.experiment import receive_offer, select_offer, score_profile, score_profile_async
+
+def score_both(profile, models, **kwargs):
+    return score_profile(profile, models["receive_offer"], models["select_offer"], **kwargs)
+
+@pytest.mark.parametrize("select_model", ["select_offer", "select_offer_native"])
+def test_score_profile_matches_each_model(models, dataset, select_model):
+    profile = dataset[1]
+    scores = score_profile(
+        profile.copy(), models["receive_offer"], models[select_model], default_value=True, default_offers=[6, 7])
+
+    received = receive_offer(profile.copy(), models["receive_offer"], default_value=True)
+    selected = select_offer(profile.copy(), models[select_model], default_offers=[6, 7], output="bitmask")
+    selected = pd.Series(selected.to_lists(), index=selected.id)
+
+    pd.testing.assert_frame_equal(scores[["id", "receive_offer"]], received, check_dtype=False)
+
+    # customers of gender O are not scored by the select model
+    other = scores.id.isin(profile.id[profile.gender == "O"])
+
+    assert len(scores) == len(profile)
+    assert other.sum() > 0
+    assert (scores.recommended_offers[other].str.len() == 0).all()
+    assert scores.recommended_offers[~other].tolist() == selected[scores.id[~other]].tolist()
+
+def test_score_profile_async_matches(models, dataset):
+    profile = dataset[1]
+    scores = score_both(profile.copy(), models, default_offers=[6, 7])
+
+    scores_async = asyncio.run(score_profile_async(
+        profile.copy(), models["receive_offer"], models["select_offer"], default_offers=[6, 7]))
+
+    pd.testing.assert_frame_equal(scores_async, scores)
+
+def test_score_profile_anonymous(models, dataset):
+    profile = dataset[1]
+    anonymous = profile[profile.age.isna()]
+
+    scores = score_both(anonymous.copy(), models, default_value=False, default_offers=[7, 6])
+
+    assert scores.id.tolist() == sorted(anonymous.id)
+    assert (scores.receive_offer == False).all()
+    assert scores.recommended_offers.tolist() == [[6, 7]] * len(anonymous)
+
+    # the defaults are missing and no offers
+    scores = score_both(anonymous.copy(), models)
+
+    assert scores.receive_offer.isna().all()
+    assert (scores.recommended_offers.str.len() == 0).all()
+
+def test_score_profile_empty(models, dataset):
+    scores = score_both(dataset[1].iloc[:0].copy(), models)
+
+    assert len(scores) == 0
+    assert list(scores.columns) == ["id", "receive_offer", "recommended_offers"]
+
+    scores_async = asyncio.run(score_profile_async(
+        dataset[1].iloc[:0].copy(), models["receive_offer"], models["select_offer"]))
+
+    assert len(scores_async) == 0
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sb_capstone import features
+from sb_capstone import shaping
+from sb_capstone.features import RECEIVE_COLUMNS, ReceiveFeatureTransformer, ReceiveImputer, get_receive_imputer
+from sb_capstone.shaping import convert_for_receive_training
+from sb_capstone.wrangling import GenderType
+
+class RecordingImputer(features.SimpleImputer):
+    def fit(self, X, y=None):
+        self.n_rows_ = len(X)
+        return super().fit(X, y)
+
+@pytest.mark.parametrize("max_samples, n_rows", [(None, 1000), (100, 100), (5000, 1000), (0.2, 200), (0.0001, 1)])
+def test_receive_imputer_max_samples(monkeypatch, max_samples, n_rows):
+    monkeypatch.setattr(features, "SimpleImputer", RecordingImputer)
+    X = pd.DataFrame({"age": np.arange(1000.0), "income": np.where(np.arange(1000) % 3 == 0, np.NaN, 1.0)})
+
+    imputer = ReceiveImputer("most_frequent", max_samples=max_samples, random_state=0).fit(X)
+
+    assert imputer.imputer_.n_rows_ == n_rows
+    assert not np.isnan(imputer.transform(X)).any()
+
+def test_fast_receive_imputer_scales_with_the_rows():
+    assert get_receive_imputer(fast=True).max_samples == 0.2
+    assert get_receive_imputer().max_samples is None
+
+def test_receive_training_keeps_missing_values_by_default(transcript_group):
+    data = convert_for_receive_training(transcript_group.copy())
+    imputed = convert_for_receive_training(transcript_group.copy(), impute=True, fast=True)
+
+    assert data.isna().any().any()
+    assert not imputed.isna().any().any()
+    pd.testing.assert_index_equal(data.columns, imputed.columns)
+
+def legacy_receive_features(profile):
+    profile = shaping._extract_age_bins(profile)
+    profile = shaping._explode_membership_date(profile)
+    profile = shaping._transform_gender(profile)
+    profile = shaping._transform_generation(profile)
+    profile = shaping._transform_age_group(profile)
+
+    return profile[RECEIVE_COLUMNS].astype(float).to_numpy()
+
+@pytest.mark.parametrize("gender_dtype", [GenderType, object])
+def test_receive_transformer_matches_the_legacy_chain(gender_dtype):
+    # ages at the bin edges, including the ones left out of every bin
+    ages = [17, 18, 21, 22, 25, 26, 37, 38, 53, 54, 72, 73, 100, 101, np.NaN, 30.5]
+    genders = ["M", "F", "O", "U", np.NaN, "M", "F", "O", "U", np.NaN, "M", "F", "O", "U", np.NaN, "M"]
+
+    profile = pd.DataFrame({
+        "gender": pd.Series(genders, dtype=gender_dtype),
+        "age": ages,
+        "income": np.where(np.arange(len(ages)) % 4 == 0, np.NaN, 50000.0),
+        "became_member_on": pd.to_datetime(
+            ["2013-07-29", "2018-07-26", "2016-02-29", None] * 4)
+    })
+
+    if gender_dtype is object:
+        # a category the model never saw
+        profile.loc[2, "gender"] = "X"
+
+    np.testing.assert_array_equal(
+        ReceiveFeatureTransformer().fit_transform(profile.copy()), legacy_receive_features(profile.copy()))
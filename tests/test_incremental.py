@@ -0,0 +1,64 @@
+import joblib
+import numpy as np
+import pandas as pd
+
+from sb_capstone.shaping import WAVE_BINS
+from sb_capstone.incremental import (
+    update_receive_offer,
+    update_select_offer,
+    _get_closed_rows
+)
+
+def test_closed_rows_are_learned_once(transcript_group):
+    watermark = 0
+    learned = []
+
+    for wave in range(1, 7):
+        rows, watermark = _get_closed_rows(transcript_group[transcript_group.wave <= wave], watermark)
+        learned.append(rows.index)
+
+        assert watermark == WAVE_BINS[wave]
+
+        # a week long offer of the wave is still open at its end, except for the last wave
+        open_offers = (transcript_group.wave == wave) & (transcript_group.duration == 7)
+        assert rows.index.isin(transcript_group.index[open_offers]).any() == (wave == 6)
+
+    learned = np.concatenate(learned)
+
+    assert len(learned) == len(np.unique(learned))
+    assert set(learned) == set(transcript_group.index)
+
+def test_updates_follow_the_waves(transcript_group, tmp_path):
+    receive_file = str(tmp_path / "receive_offer-online.pkl")
+    select_file = str(tmp_path / "select_offer-online.pkl")
+
+    for wave in range(1, 7):
+        current = transcript_group[transcript_group.wave <= wave]
+
+        _, receive_score = update_receive_offer(current, receive_file, random_state=0)
+        _, select_score = update_select_offer(current, select_file, random_state=0)
+
+        assert receive_score["watermark"] == select_score["watermark"] == WAVE_BINS[wave]
+        assert receive_score["rows"] > 0
+
+        # nothing closed since the last update
+        assert update_receive_offer(current, receive_file)[1] is None
+
+    # the offers still open at the end of the last wave close with it
+    _, score = update_receive_offer(transcript_group, receive_file, now=WAVE_BINS[-1] + 24)
+
+    assert score is None
+
+def test_fit_resets_the_watermark(transcript_group, tmp_path):
+    file = str(tmp_path / "receive_offer-online.pkl")
+    update_receive_offer(transcript_group, file, random_state=0)
+
+    model = joblib.load(file)
+    assert model.watermark_ == WAVE_BINS[-1]
+
+    X = pd.DataFrame({"a": [0.0, 1.0, 2.0, 3.0]})
+    model.fit(X, np.array([0, 0, 1, 1]))
+
+    assert model.watermark_ == 0
+    assert model.history_ == []
+    assert model.predict(X).shape == (4,)
@@ -0,0 +1,73 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+
+from sb_capstone.ingest import load_id_map, iter_transcript, read_transcript
+from sb_capstone.wrangling import clean_transcript
+
+RECORDS = [
+    {"person": "a", "event": "offer received", "time": 0, "value": {"offer id": "bogo"}},
+    {"person": "b", "event": "transaction", "time": 0, "value": {"amount": 3.5}},
+    {"person": "a", "event": "offer viewed", "time": 6, "value": {"offer id": "bogo"}},
+    # a customer missing from the profile
+    {"person": "z", "event": "offer received", "time": 6, "value": {"offer id": "info"}},
+    {"person": "a", "event": "transaction", "time": 12, "value": {"amount": 10.25}},
+    {"person": "a", "event": "offer completed", "time": 12, "value": {"offer_id": "bogo", "reward": 5}},
+    {"person": "b", "event": "offer received", "time": 168, "value": {"offer id": "info"}},
+    # an offer missing from the portfolio
+    {"person": "b", "event": "offer received", "time": 168, "value": {"offer id": "unknown"}},
+    {"person": "z", "event": "transaction", "time": 200, "value": {"amount": 1.0}}
+]
+
+def write_lines(records, file):
+    with open(file, "w") as f:
+        f.writelines(json.dumps(r) + "\n" for r in records)
+
+    return str(file)
+
+def read_at_once(file, person_ids, offer_ids):
+    """Reads the whole raw transcript with pandas, the way the wrangling notebook does"""
+
+    raw = pd.read_json(file, lines=True)
+    value = pd.json_normalize(raw.value)
+
+    transcript = pd.DataFrame({
+        "person_id": raw.person.map(person_ids),
+        "event": raw.event.str.replace(" ", "_"),
+        "time": raw.time,
+        "offer_id": value["offer id"].fillna(value["offer_id"]).map(offer_ids).fillna(0).astype(int),
+        "amount": value.amount,
+        "reward": value.reward.astype(float)
+    })
+
+    transcript = transcript[transcript.person_id.notna()].reset_index(drop=True)
+    transcript.person_id = transcript.person_id.astype(np.int64)
+
+    return clean_transcript(transcript)
+
+@pytest.fixture
+def raw_files(tmp_path):
+    portfolio = write_lines([{"id": "bogo"}, {"id": "info"}], tmp_path / "portfolio.json")
+    profile = write_lines([{"id": "b"}, {"id": "a"}], tmp_path / "profile.json")
+    transcript = write_lines(RECORDS, tmp_path / "transcript.json")
+
+    return load_id_map(portfolio), load_id_map(profile), transcript
+
+def test_load_id_map_follows_the_file_order(raw_files):
+    offer_ids, person_ids, _ = raw_files
+
+    assert offer_ids == {"bogo": 1, "info": 2}
+    assert person_ids == {"b": 1, "a": 2}
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 4, 100])
+def test_read_transcript_in_chunks_matches(raw_files, chunk_size):
+    offer_ids, person_ids, file = raw_files
+
+    chunks = list(iter_transcript(file, person_ids, offer_ids, chunk_size=chunk_size))
+    transcript = read_transcript(file, person_ids, offer_ids, chunk_size=chunk_size)
+
+    assert len(chunks) == -(-len(RECORDS) // chunk_size)
+    assert transcript.offer_id.tolist() == [1, 0, 1, 0, 1, 2, 0]
+
+    pd.testing.assert_frame_equal(transcript, read_at_once(file, person_ids, offer_ids))
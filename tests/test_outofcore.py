@@ -0,0 +1,73 @@
+import glob
+import os
+import numpy as np
+import pandas as pd
+
+from sb_capstone import outofcore
+from sb_capstone.shaping import (
+    convert_for_select_training,
+    _get_person_partition
+)
+from sb_capstone.wrangling import TranscriptGroupSchema
+
+def sort_groups(transcript_group):
+    return transcript_group.sort_values(by=["id", "wave"]).reset_index(drop=True)
+
+def partition(dataset, directory, n_partitions=4):
+    portfolio, profile, transcript = dataset
+
+    # chunks of the transcript, with narrower ids than the profile
+    transcript = transcript.assign(person_id=transcript.person_id.astype(np.int32))
+    chunks = [transcript.iloc[i:i + 1000] for i in range(0, len(transcript), 1000)]
+
+    outofcore.partition_transcript(chunks, directory, n_partitions, portfolio=portfolio)
+    outofcore.partition_profile(profile, directory, n_partitions)
+
+def test_person_partition_hashes_the_ids():
+    ids = np.arange(1, 1000)
+    partition = _get_person_partition(ids, 16)
+
+    np.testing.assert_array_equal(_get_person_partition(ids.astype(np.int32), 16), partition)
+    assert set(partition.tolist()) == set(range(16))
+
+    names = _get_person_partition(np.array(["a", "b", "a"], dtype=object), 16)
+    assert names[0] == names[2]
+
+def test_transcript_group_partitioned_matches(dataset, transcript_group, tmp_path):
+    partition(dataset, str(tmp_path))
+    outofcore.get_transcript_group_partitioned(str(tmp_path))
+
+    pd.testing.assert_frame_equal(
+        sort_groups(outofcore.read_transcript_group(str(tmp_path))), sort_groups(transcript_group))
+
+    select = convert_for_select_training(transcript_group.copy())
+    select_partitioned = outofcore.convert_for_select_training_partitioned(str(tmp_path))
+
+    pd.testing.assert_frame_equal(
+        select_partitioned.sort_values(by=list(select.columns)).reset_index(drop=True),
+        select.sort_values(by=list(select.columns)).reset_index(drop=True))
+
+def test_partition_without_transcript(dataset, tmp_path):
+    partition(dataset, str(tmp_path))
+
+    for file in glob.glob(os.path.join(str(tmp_path), "partition-0000", "transcript-*.parquet")):
+        os.remove(file)
+
+    files = outofcore.get_transcript_group_partitioned(str(tmp_path))
+    transcript_group = pd.read_parquet(files[0])
+
+    # only the customers of the profile, without any event
+    assert len(files) == 4
+    assert len(transcript_group) > 0
+    assert not transcript_group.received.any()
+    assert (transcript_group.amount == 0).all()
+
+def test_empty_partitions(tmp_path):
+    transcript_group = outofcore.read_transcript_group(str(tmp_path), columns=["id", "wave"])
+
+    assert len(transcript_group) == 0
+    assert transcript_group.dtypes.to_dict() == {"id": TranscriptGroupSchema["id"], "wave": TranscriptGroupSchema["wave"]}
+
+    assert len(outofcore.read_transcript_group(str(tmp_path)).columns) == len(TranscriptGroupSchema)
+    assert len(outofcore.convert_for_receive_training_partitioned(str(tmp_path), impute=False)) == 0
+    assert len(outofcore.convert_for_select_training_partitioned(str(tmp_path))) == 0
@@ -0,0 +1,26 @@
+import pandas as pd
+
+from sb_capstone.profiling import profile_run, profiled
+
+@profiled
+def copy_twice(data):
+    return data.copy().copy()
+
+@profiled
+def concat_and_copy(data):
+    return copy_twice(pd.concat([data, data]))
+
+def test_profile_run_counts_explicit_copy_calls():
+    data = pd.DataFrame({"value": range(10)})
+
+    with profile_run(trace_memory=False) as profiler:
+        concat_and_copy(data)
+
+    report = profiler.report().set_index("stage")
+
+    assert report.explicit_copy_calls.to_dict() == {"concat_and_copy": 2, "copy_twice": 2}
+    assert report.rows_out.to_dict() == {"concat_and_copy": 20, "copy_twice": 20}
+
+    # the copy methods are restored after the run
+    data.copy()
+    assert profiler.explicit_copy_calls == 2
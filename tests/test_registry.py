@@ -0,0 +1,86 @@
+import os
+import joblib
+import pandas as pd
+import pytest
+
+from sb_capstone import experiment
+from sb_capstone.registry import ModelRegistry
+
+def dump(model, file):
+    joblib.dump(model, str(file))
+
+    return str(file)
+
+def test_registry_loads_on_first_use(tmp_path):
+    registry = ModelRegistry(str(tmp_path))
+    registry.register("receive_offer")
+
+    # the artifact does not have to exist until the model is used
+    assert registry._loaded == {}
+
+    dump({"version": 1}, tmp_path / "receive_offer.pkl")
+
+    assert registry.get("receive_offer") == {"version": 1}
+    assert registry.get("receive_offer") is registry.get("receive_offer")
+
+    registry.unload()
+
+    assert registry._loaded == {}
+
+def test_registry_serves_versions_side_by_side(tmp_path):
+    registry = ModelRegistry(str(tmp_path))
+    registry.register("select_offer", dump({"version": 1}, tmp_path / "v1.pkl"), version="v1")
+    registry.register("select_offer", dump({"version": 2}, tmp_path / "v2.pkl"), version="v2")
+
+    assert registry.get("select_offer") == {"version": 1}
+    assert registry.get("select_offer", "v2") == {"version": 2}
+
+    registry.use("select_offer", "v2")
+
+    assert registry.get("select_offer") == {"version": 2}
+    assert registry.get_version("select_offer")[:2] == ("select_offer", "v2")
+    assert registry.get_version("select_offer") != registry.get_version("select_offer", "v1")
+
+    with pytest.raises(KeyError):
+        registry.use("select_offer", "v3")
+
+    with pytest.raises(KeyError):
+        registry.get("receive_offer")
+
+def test_registry_reloads_a_replaced_artifact(tmp_path):
+    file = dump({"version": 1}, tmp_path / "receive_offer.pkl")
+    registry = ModelRegistry(str(tmp_path))
+    registry.register("receive_offer")
+
+    version = registry.get_version("receive_offer")
+    assert registry.get("receive_offer") == {"version": 1}
+
+    dump({"version": 2, "trees": list(range(10))}, file)
+    os.utime(file, ns=(version[2] + 10 ** 9, version[2] + 10 ** 9))
+
+    assert registry.get_version("receive_offer") != version
+    assert registry.get("receive_offer")["version"] == 2
+
+def test_experiment_uses_the_registry(models, dataset, tmp_path, monkeypatch):
+    profile = dataset[1]
+
+    registry = ModelRegistry(str(tmp_path))
+    registry.register("receive_offer", dump(models["receive_offer"], tmp_path / "receive_offer.pkl"))
+    registry.register("select_offer", dump(models["select_offer"], tmp_path / "select_offer.pkl"))
+    monkeypatch.setattr(experiment, "registry", registry)
+
+    assert registry._loaded == {}
+
+    pd.testing.assert_frame_equal(
+        experiment.receive_offer(profile.copy()),
+        experiment.receive_offer(profile.copy(), models["receive_offer"]))
+    pd.testing.assert_frame_equal(
+        experiment.select_offer(profile.copy()),
+        experiment.select_offer(profile.copy(), models["select_offer"]))
+
+    assert set(registry._loaded) == {("receive_offer", "latest"), ("select_offer", "latest")}
+
+    model, version = experiment._get_model("receive_offer", None)
+
+    assert model is registry.get("receive_offer")
+    assert version == registry.get_version("receive_offer")
@@ -0,0 +1,83 @@
+import asyncio
+import os
+
+import pytest
+
+from sb_capstone.serving import MicroBatcher, ScoringServer
+from sb_capstone.loadgen import run_load
+
+def score_ages(records):
+    """Scores a batch, failing it when any record has no age"""
+
+    return [record["age"] * 2 for record in records]
+
+def test_micro_batcher_fails_only_the_bad_record():
+    async def run():
+        batcher = MicroBatcher(score_ages, max_batch_size=8, max_wait=0.05)
+        results = await asyncio.gather(
+            *[batcher.submit(record) for record in [{"age": 1}, {}, {"age": 3}]], return_exceptions=True)
+        await batcher.close()
+
+        return batcher, results
+
+    batcher, results = asyncio.run(run())
+
+    assert results[0] == 2
+    assert isinstance(results[1], KeyError)
+    assert results[2] == 6
+    assert batcher.batches == 1
+
+def test_micro_batcher_fails_the_records_without_result():
+    async def run():
+        # records without age are silently dropped from the results
+        batcher = MicroBatcher(lambda records: [r["age"] * 2 for r in records if "age" in r], max_wait=0.05)
+        results = await asyncio.gather(
+            *[batcher.submit(record) for record in [{"age": 1}, {}, {"age": 3}]], return_exceptions=True)
+        await batcher.close()
+
+        return results
+
+    results = asyncio.run(run())
+
+    assert results[0] == 2
+    assert isinstance(results[1], ValueError)
+    assert results[2] == 6
+
+async def serve_load(path, server, **kwargs):
+    """Runs the load generator against a server listening on a unix socket"""
+
+    task = asyncio.get_running_loop().create_task(server.serve(path=path))
+
+    try:
+        while not os.path.exists(path):
+            await asyncio.sleep(0.01)
+
+        return await run_load([{"age": 1}, {"age": 2}], path=path, **kwargs)
+    finally:
+        task.cancel()
+
+@pytest.mark.parametrize("concurrency", [1, 4, 16])
+def test_run_load_sends_every_request(tmp_path, concurrency):
+    server = ScoringServer(max_wait=0.001)
+    server.batchers = {"/receive_offer": MicroBatcher(score_ages, max_wait=0.001)}
+
+    result = asyncio.run(serve_load(str(tmp_path / "server.sock"), server, concurrency=concurrency, n_requests=10))
+
+    assert result["requests"] == 10
+    assert result["errors"] == 0
+
+def test_run_load_raises_when_the_server_closes(tmp_path):
+    path = str(tmp_path / "server.sock")
+
+    async def run():
+        async def close(reader, writer):
+            await reader.readline()
+            writer.close()
+
+        server = await asyncio.start_unix_server(close, path=path)
+
+        async with server:
+            await run_load([{"age": 1}], concurrency=1, n_requests=1, path=path)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(run())
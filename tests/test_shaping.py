@@ -0,0 +1,284 @@
+import warnings
+import numpy as np
+import pandas as pd
+
+from sb_capstone.synthetic import generate_portfolio
+from sb_capstone.wrangling import EventType, OfferIDType
+from sb_capstone.shaping import (
+    merge_portfolio,
+    get_transcript_combined,
+    get_transcript_group,
+    convert_for_receive_training,
+    get_transcript_combined_incremental,
+    save_offer_group_state,
+    load_offer_group_state,
+    _prepare_transcript,
+    _get_offer_groups,
+    _transform_bools
+)
+
+class LegacyOfferGroup():
+    """The offer group of the original ``OfferGroups`` attribution, kept as reference"""
+
+    def __init__(self, row):
+        self.offer_id = row.offer_id
+        self.offer_type = row.offer_type
+        self.expires = (row.duration * 24) + row.time
+        self.events = []
+        self.difficulty = row.difficulty
+        self.redeemed = False
+        self.active = True
+
+    def can_add_event(self, row):
+        if row.event != "transaction":
+            return (row.offer_id == self.offer_id) and (not row.event in self.events)
+        else:
+            return (row.time <= self.expires) and (not self.redeemed) and (self.active)
+
+    def add_event(self, row):
+        if row.event != "transaction":
+            self.events.append(row.event)
+        else:
+            self.difficulty = self.difficulty - row.amount
+            self.redeemed = self.difficulty <= 0.0
+
+    def deactivate(self):
+        self.active = False
+
+class LegacyOfferGroups():
+    """The original row by row offer group attribution, kept as reference"""
+
+    def __init__(self):
+        self._groups = {}
+        self._index = 0
+
+    def get_group(self, row):
+        result = -row.wave, 0
+
+        for idx in self._groups:
+            group = self._groups[idx]
+
+            if group.can_add_event(row):
+                group.add_event(row)
+                result = idx, group.offer_id
+                break
+
+        return result
+
+    def add_group(self, row):
+        for g in self._groups:
+            self._groups[g].deactivate()
+
+        self._index = self._index + 1
+        self._groups[self._index] = LegacyOfferGroup(row)
+
+def legacy_offer_groups(transcript):
+    """Attributes the offer groups one customer and one row at a time, like the original pipeline"""
+
+    transcript, _ = _prepare_transcript(transcript)
+    groups = []
+
+    for _, user_group in transcript.groupby("person_id"):
+        user_group = user_group.copy()
+        offer_groups = LegacyOfferGroups()
+
+        for i, row in user_group.iterrows():
+            if row.event == "offer_received":
+                offer_groups.add_group(row)
+
+            group_id, offer_id = offer_groups.get_group(row)
+
+            user_group.loc[i, "offer_group"] = group_id
+            user_group.loc[i, "offer_id"] = offer_id
+
+        groups.append(user_group)
+
+    transcript = pd.concat(groups).sort_index()
+
+    return transcript.offer_group.to_numpy(dtype=float), transcript.offer_id.to_numpy(dtype=float)
+
+def make_transcript(events):
+    """Builds a transcript merged with the portfolio from (person, event, time, offer, amount) tuples"""
+
+    transcript = pd.DataFrame(events, columns=["person_id", "event", "time", "offer_id", "amount"])
+    transcript["reward"] = np.NaN
+    transcript.event = transcript.event.astype(EventType)
+    transcript.offer_id = transcript.offer_id.astype(OfferIDType)
+
+    return merge_portfolio(transcript, generate_portfolio())
+
+# offer 1 is a bogo of difficulty 10 lasting 7 days, 3 and 8 are informational
+# lasting 4 and 3 days, 6 is a discount of difficulty 7 lasting 7 days
+EVENTS = [
+    # a transaction before any offer
+    (1, "transaction", 0, 0, 3.0),
+    (1, "offer_received", 0, 1, np.NaN),
+    (1, "offer_viewed", 6, 1, np.NaN),
+    (1, "transaction", 12, 0, 4.0),
+    (1, "transaction", 18, 0, 7.0),
+    (1, "offer_completed", 18, 1, np.NaN),
+    # after the redemption
+    (1, "transaction", 24, 0, 5.0),
+    # the same offer received again, viewed twice
+    (1, "offer_received", 168, 1, np.NaN),
+    (1, "offer_viewed", 170, 1, np.NaN),
+    (1, "offer_viewed", 172, 1, np.NaN),
+    # after the expiry
+    (1, "transaction", 400, 0, 3.0),
+    (2, "offer_received", 0, 3, np.NaN),
+    (2, "transaction", 10, 0, 2.0),
+    (2, "transaction", 20, 0, 5.0),
+    (2, "offer_received", 96, 8, np.NaN),
+    (2, "offer_viewed", 100, 3, np.NaN),
+    (2, "transaction", 200, 0, 1.0),
+    (3, "offer_received", 0, 6, np.NaN),
+    (3, "offer_received", 168, 1, np.NaN),
+    (3, "transaction", 170, 0, 20.0),
+    (3, "offer_completed", 170, 6, np.NaN),
+    (3, "offer_viewed", 171, 6, np.NaN)
+]
+
+def test_offer_groups_cases():
+    offer_group, offer_id = _get_offer_groups(*_prepare_transcript(make_transcript(EVENTS))[1])
+
+    expected = [
+        (-1, 0), (1, 1), (1, 1), (1, 1), (1, 1), (1, 1), (-1, 0), (2, 1), (2, 1), (-2, 0), (-3, 0),
+        (1, 3), (1, 3), (-1, 0), (2, 8), (1, 3), (-2, 0),
+        (1, 6), (2, 1), (2, 1), (1, 6), (1, 6)
+    ]
+
+    assert list(zip(offer_group.tolist(), offer_id.tolist())) == expected
+
+def test_offer_groups_cases_match_legacy():
+    new = _get_offer_groups(*_prepare_transcript(make_transcript(EVENTS))[1])
+    legacy = legacy_offer_groups(make_transcript(EVENTS))
+
+    np.testing.assert_array_equal(new[0], legacy[0])
+    np.testing.assert_array_equal(new[1], legacy[1])
+
+def test_offer_groups_match_legacy(dataset):
+    portfolio, _, transcript = dataset
+    transcript = merge_portfolio(transcript.copy(), portfolio)
+
+    new = _get_offer_groups(*_prepare_transcript(transcript.copy())[1])
+    legacy = legacy_offer_groups(transcript.copy())
+
+    np.testing.assert_array_equal(new[0], legacy[0])
+    np.testing.assert_array_equal(new[1], legacy[1])
+
+def test_transcript_combined_keeps_order(dataset):
+    portfolio, _, transcript = dataset
+    transcript = merge_portfolio(transcript.copy(), portfolio)
+
+    combined = get_transcript_combined(transcript.copy())
+
+    assert combined.index.equals(transcript.index)
+    np.testing.assert_array_equal(combined.time.to_numpy(), transcript.time.to_numpy())
+    assert (combined.offer_group != 0).all()
+
+def test_transcript_combined_parallel_matches_serial(dataset):
+    portfolio, _, transcript = dataset
+    transcript = merge_portfolio(transcript.copy(), portfolio)
+
+    serial = get_transcript_combined(transcript.copy())
+    parallel = get_transcript_combined(transcript.copy(), n_jobs=2, chunk_size=500)
+
+    pd.testing.assert_frame_equal(parallel, serial)
+
+def get_combined_in_batches(transcript, times, tmp_path, **kwargs):
+    """Runs the incremental transcript over time batches, saving and loading the state in between"""
+
+    state = None
+    batches = []
+
+    for start, end in zip([-1] + times, times + [transcript.time.max()]):
+        batch, state = get_transcript_combined_incremental(
+            transcript[(transcript.time > start) & (transcript.time <= end)].copy(), state, **kwargs)
+        batches.append(batch)
+
+        state = load_offer_group_state(save_offer_group_state(state, str(tmp_path / "state.parquet")))
+
+    return pd.concat(batches).sort_index(), state
+
+def test_transcript_combined_incremental_matches_full(dataset, tmp_path):
+    portfolio, _, transcript = dataset
+    transcript = merge_portfolio(transcript.copy(), portfolio)
+
+    full = get_transcript_combined(transcript.copy())
+    incremental, _ = get_combined_in_batches(transcript, [200, 450], tmp_path)
+
+    pd.testing.assert_frame_equal(incremental[full.columns], full)
+
+def test_transcript_combined_incremental_parallel_matches_serial(dataset, tmp_path):
+    portfolio, _, transcript = dataset
+    transcript = merge_portfolio(transcript.copy(), portfolio)
+
+    serial, serial_state = get_combined_in_batches(transcript, [200, 450], tmp_path)
+    parallel, parallel_state = get_combined_in_batches(transcript, [200, 450], tmp_path, n_jobs=2, chunk_size=500)
+
+    pd.testing.assert_frame_equal(parallel, serial)
+    pd.testing.assert_frame_equal(parallel_state, serial_state)
+
+def test_offer_group_state_keeps_unanswered_groups():
+    # informational offers 3 and 8 are never completed, bogo 1 expires at 168 + 168
+    events = [
+        (2, "offer_received", 0, 3, np.NaN),
+        (2, "offer_received", 96, 8, np.NaN),
+        (2, "offer_viewed", 100, 8, np.NaN),
+        (2, "offer_received", 168, 1, np.NaN),
+        (2, "offer_received", 336, 6, np.NaN),
+        (2, "transaction", 400, 0, 1.0)
+    ]
+
+    _, state = get_transcript_combined_incremental(make_transcript(events))
+
+    # the expired groups still take the views of their offers
+    assert state.offer_group.tolist() == [1, 3, 4]
+    assert state.active.tolist() == [False, False, True]
+    assert (state.last_time == 400).all()
+
+    transcript, state = get_transcript_combined_incremental(make_transcript([
+        (2, "offer_viewed", 410, 3, np.NaN),
+        (2, "offer_viewed", 420, 1, np.NaN)
+    ]), state)
+
+    assert transcript.offer_group.tolist() == [1, 3]
+    assert state.offer_group.tolist() == [3, 4]
+
+def test_offer_group_state_keeps_dtypes(tmp_path):
+    transcript = make_transcript(EVENTS)
+    transcript.person_id = transcript.person_id.astype("int32")
+
+    _, state = get_transcript_combined_incremental(transcript)
+    loaded = load_offer_group_state(save_offer_group_state(state, str(tmp_path / "state.parquet")))
+
+    assert state.person_id.dtype == np.int32
+    pd.testing.assert_frame_equal(loaded, state)
+
+def test_transcript_group_keeps_the_offer_categorical(transcript_group):
+    assert transcript_group.mapped_offer.dtype == OfferIDType
+    assert transcript_group.membership_year.dtype == np.int16
+
+def test_transcript_group_without_membership_date(dataset):
+    portfolio, profile, transcript = dataset
+    profile = profile.copy()
+    profile.loc[profile.index[:5], "became_member_on"] = pd.NaT
+
+    transcript_group = get_transcript_group(
+        get_transcript_combined(merge_portfolio(transcript.copy(), portfolio)), profile)
+    missing = transcript_group.id.isin(profile.id[:5])
+
+    assert transcript_group.membership_year.dtype == np.float32
+    assert transcript_group.membership_year[missing].isna().all()
+    assert transcript_group.membership_year[~missing].notna().all()
+
+def test_transform_bools_leaves_its_input(transcript_group):
+    data = transcript_group[transcript_group.wave == 1]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", pd.errors.SettingWithCopyWarning)
+        transformed = _transform_bools(data)
+
+    assert transformed.received.dtype == np.int8
+    assert data.received.dtype == bool
+    assert len(convert_for_receive_training(data)) > 0
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from sb_capstone.storage import save_dataset, load_dataset, get_dataset_columns
+from sb_capstone.wrangling import EventType, OfferIDType
+
+def make_dataset():
+    return pd.DataFrame({
+        "person_id": np.array([1, 2, 3, 4], dtype=np.int32),
+        "event": pd.Series(["offer_received", "transaction", "offer_viewed", np.NaN], dtype=EventType),
+        "offer_id": pd.Series([1, 0, 10, np.NaN], dtype=OfferIDType),
+        "channels": [["web", "email"], [], np.NaN, ["mobile"]],
+        "reward": pd.array([5, pd.NA, 0, 10], dtype="Int16"),
+        "became_member_on": pd.to_datetime(["2017-05-09", None, "2013-08-02", "2018-07-26"]),
+        "amount": [np.NaN, 3.5, np.NaN, 0.0]
+    })
+
+def test_dataset_round_trip(tmp_path):
+    data = make_dataset()
+    file = save_dataset(data, str(tmp_path / "data.parquet"))
+
+    assert get_dataset_columns(file) == list(data.columns)
+
+    loaded = load_dataset(file)
+
+    pd.testing.assert_frame_equal(loaded, data)
+    assert isinstance(loaded.channels[0], list)
+
+    pd.testing.assert_frame_equal(load_dataset(file, memory_map=False), data)
+
+def test_dataset_projection(tmp_path):
+    data = make_dataset()
+    file = save_dataset(data, str(tmp_path / "data.parquet"))
+
+    columns = ["offer_id", "channels", "reward"]
+
+    pd.testing.assert_frame_equal(load_dataset(file, columns=columns), data[columns])
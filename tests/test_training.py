@@ -0,0 +1,19 @@
+import numpy as np
+
+from sklearn.tree import DecisionTreeClassifier
+
+from sb_capstone.training import make_folds, successive_halving
+
+def test_successive_halving_with_few_rows():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(60, 3)).astype(np.float32)
+    y = (X[:, 0] > 0).astype(int)
+    folds = make_folds(y, n_splits=5)
+
+    # 81 candidates need 5 rounds, 48 train rows // 3 ** 4 would be 0 rows
+    param_grid = {"max_depth": list(range(1, 10)), "min_samples_leaf": list(range(1, 10))}
+    best, results = successive_halving(DecisionTreeClassifier(random_state=0), param_grid, X, y, folds, n_jobs=1)
+
+    assert results.n_train.min() == 5
+    assert results.mean_score.notna().all()
+    assert best in results.params.tolist()
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sb_capstone.synthetic import generate_portfolio
+from sb_capstone.wrangling import ChannelType, get_channel_mask, apply_schema
+
+def test_channel_mask():
+    portfolio = generate_portfolio()
+    mask = get_channel_mask(portfolio)
+
+    assert not mask[0].any()
+
+    for id, channels in zip(portfolio.id, portfolio.channels):
+        assert sorted(ChannelType.categories[mask[int(id)]]) == sorted(channels)
+
+def test_channel_mask_raises_on_unknown_channels():
+    portfolio = generate_portfolio()
+    portfolio.channels = portfolio.channels.apply(lambda c: c + ["sms"])
+
+    with pytest.raises(ValueError, match="sms"):
+        get_channel_mask(portfolio)
+
+def test_apply_schema_keeps_missing_integers_as_floats():
+    data = pd.DataFrame({"year": [2017.0, np.NaN], "month": [1.0, 2.0], "gender": ["F", "M"]})
+    data = apply_schema(data, {"year": np.int16, "month": np.int8})
+
+    assert data.dtypes.to_dict() == {"year": np.float32, "month": np.int8, "gender": object}
+    assert data.year.isna().tolist() == [False, True]